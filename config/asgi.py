@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
 
 application = get_asgi_application()
+
+if settings.SERVE_MEDIA:
+    from core.media import MediaFileASGIApplication
+
+    # Media requests are answered before Django's middleware stack runs
+    application = MediaFileASGIApplication(application)
@@ -35,10 +35,17 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "core",
+    "jobs",
     "images",
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the whole stack
+    "core.middleware.RequestLoggingMiddleware",
+    # Inactive unless PROFILING_ENABLED
+    "core.middleware.ProfilingMiddleware",
+    # Inactive without DATABASE_REPLICA_URLS; ahead of anything that queries
+    "core.middleware.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -46,10 +53,10 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    # WhiteNoise, able to run on the async path too
+    "core.middleware.StaticFilesMiddleware",
     # Custom Middlewares
     "core.middleware.QuotaCheckMiddleware",
-    "core.middleware.QuotaCheckMiddleware",
     "core.middleware.FileSizeLimitMiddleware",
 ]
 
@@ -61,12 +68,74 @@ DATABASES = {
     "default": env.db("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
 }
 
+# Read replicas (comma-separated URLs), used by core.db.ReplicaRouter: GET
+# requests read from them; writes, and a client's requests for
+# DATABASE_REPLICA_PIN_SECONDS after it writes, use the primary. A replica
+# that fails is skipped for DATABASE_REPLICA_RETRY_SECONDS (add a
+# connect_timeout to its URL so a dead host fails fast).
+DATABASE_REPLICA_URLS = env.list("DATABASE_REPLICA_URLS", default=[])
+DATABASE_REPLICAS = []
+for _number, _url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f"replica{_number}"] = {
+        **env.db_url_config(_url),
+        # Persistent connections, checked before reuse
+        "CONN_MAX_AGE": env.int("DATABASE_REPLICA_CONN_MAX_AGE", 600),
+        "CONN_HEALTH_CHECKS": True,
+        # Tests read the primary's test database
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica{_number}")
+DATABASE_ROUTERS = ["core.db.ReplicaRouter"]
+DATABASE_REPLICA_PIN_SECONDS = env.int("DATABASE_REPLICA_PIN_SECONDS", 5)
+DATABASE_REPLICA_RETRY_SECONDS = env.int("DATABASE_REPLICA_RETRY_SECONDS", 30)
+
 # Static/Media
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
+# Serve MEDIA_URL from the WSGI/ASGI entry points (core.media), ahead of Django.
+# Behind nginx, set MEDIA_OFFLOAD_HEADER=X-Accel-Redirect and map
+# MEDIA_ACCEL_REDIRECT_PREFIX to MEDIA_ROOT as an internal location;
+# X-Sendfile works the same way for Apache/lighttpd.
+SERVE_MEDIA = env.bool("SERVE_MEDIA", True)
+MEDIA_OFFLOAD_HEADER = env.str("MEDIA_OFFLOAD_HEADER", "")
+MEDIA_ACCEL_REDIRECT_PREFIX = env.str(
+    "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+)
+# In-flight uploads; must be on the same filesystem as MEDIA_ROOT so that
+# committing an upload is a rename
+UPLOAD_STAGING_DIR = MEDIA_ROOT / ".staging"
+
+# Where image files live (see core.storage): "local" (MEDIA_ROOT, sharded by
+# hash prefix) or "s3" (any S3-compatible store; needs boto3). After changing
+# either the backend or STORAGE_SHARD_DEPTH, run `manage.py rehome_blobs`.
+STORAGE_BACKEND = env.str("STORAGE_BACKEND", "local")
+STORAGE_SHARD_DEPTH = env.int("STORAGE_SHARD_DEPTH", 2)
+if STORAGE_BACKEND == "s3":
+    DEFAULT_STORAGE = {
+        "BACKEND": "core.storage.S3Storage",
+        "OPTIONS": {
+            "bucket_name": env.str("S3_BUCKET", ""),
+            "endpoint_url": env.str("S3_ENDPOINT_URL", ""),
+            "region_name": env.str("S3_REGION", ""),
+            "access_key": env.str("S3_ACCESS_KEY_ID", ""),
+            "secret_key": env.str("S3_SECRET_ACCESS_KEY", ""),
+            "public_url": env.str("S3_PUBLIC_URL", ""),
+            "max_concurrency": env.int("S3_MAX_CONCURRENCY", 8),
+            "shard_depth": STORAGE_SHARD_DEPTH,
+        },
+    }
+else:
+    DEFAULT_STORAGE = {
+        "BACKEND": "core.storage.ShardedFileSystemStorage",
+        "OPTIONS": {"shard_depth": STORAGE_SHARD_DEPTH},
+    }
+STORAGES = {
+    "default": DEFAULT_STORAGE,
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
 
 # Security / proxy friendliness (opt-in via env)
 CSRF_TRUSTED_ORIGINS = env.list("CSRF_TRUSTED_ORIGINS", default=[])
@@ -80,8 +149,18 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Compiled templates are kept for the life of the process in every
+            # environment (runserver still reloads them when they change)
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -92,7 +171,106 @@ TEMPLATES = [
     },
 ]
 
+# Rendered image cards are cached this long (see images.fragments)
+FRAGMENT_CACHE_SECONDS = env.int("FRAGMENT_CACHE_SECONDS", 24 * 60 * 60)
+
+# Cache (local memory by default; point CACHE_URL at Redis/Memcached in production
+# so cached pages and fragments are shared between workers)
+CACHES = {
+    "default": env.cache("CACHE_URL", default="locmemcache://"),
+}
+
 MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5 MB
+# Files accepted by one request to the batch endpoint (each up to MAX_UPLOAD_SIZE)
+MAX_BATCH_UPLOAD_FILES = env.int("MAX_BATCH_UPLOAD_FILES", 10)
+# Resumable uploads untouched for this long are removed by `manage.py expire_upload_sessions`
+UPLOAD_SESSION_TTL_SECONDS = env.int("UPLOAD_SESSION_TTL_SECONDS", 24 * 60 * 60)
+# Uploads whose header declares more pixels than this are rejected before decoding
+MAX_IMAGE_PIXELS = env.int("MAX_IMAGE_PIXELS", 50_000_000)
+
+# Resized variants served by /image/<public_id>/r/<preset>/ (longest edge in px)
+IMAGE_RENDITION_PRESETS = {"thumb": 200, "medium": 800}
+RENDITION_CACHE_DIR = env.str(
+    "RENDITION_CACHE_DIR", str(BASE_DIR / "cache" / "renditions")
+)
+RENDITION_CACHE_MAX_BYTES = env.int("RENDITION_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+
+# Re-encode uploads before storing them, keeping the result only when smaller
+# (see images.optimization): "WEBP" or "JPEG" (progressive), lossy at
+# IMAGE_OPTIMIZE_QUALITY or lossless, scaled to fit IMAGE_OPTIMIZE_MAX_EDGE
+# (0 keeps the size), upright and without EXIF/ICC data
+IMAGE_OPTIMIZATION = env.bool("IMAGE_OPTIMIZATION", False)
+IMAGE_OPTIMIZE_FORMAT = env.str("IMAGE_OPTIMIZE_FORMAT", "WEBP")
+IMAGE_OPTIMIZE_LOSSLESS = env.bool("IMAGE_OPTIMIZE_LOSSLESS", False)
+IMAGE_OPTIMIZE_QUALITY = env.int("IMAGE_OPTIMIZE_QUALITY", 82)
+IMAGE_OPTIMIZE_MAX_EDGE = env.int("IMAGE_OPTIMIZE_MAX_EDGE", 4096)
+# Larger uploads are optimized by the worker after the request
+IMAGE_OPTIMIZE_INLINE_MAX_BYTES = env.int(
+    "IMAGE_OPTIMIZE_INLINE_MAX_BYTES", 1024 * 1024
+)
+# Keep each optimized upload's original file as well
+IMAGE_KEEP_ORIGINALS = env.bool("IMAGE_KEEP_ORIGINALS", False)
+
+# Near duplicates: images whose perceptual hashes (see images.similarity)
+# differ in at most NEAR_DUPLICATE_MAX_DISTANCE of 64 bits. With
+# REJECT_NEAR_DUPLICATES a user cannot upload a near duplicate of one of their
+# own images. Each process's in-memory index catches up with new rows at most
+# every SIMILARITY_INDEX_REFRESH_SECONDS.
+REJECT_NEAR_DUPLICATES = env.bool("REJECT_NEAR_DUPLICATES", False)
+NEAR_DUPLICATE_MAX_DISTANCE = env.int("NEAR_DUPLICATE_MAX_DISTANCE", 6)
+SIMILARITY_INDEX_REFRESH_SECONDS = env.int("SIMILARITY_INDEX_REFRESH_SECONDS", 5)
+
+# Upload quota: "daily" (resets at midnight) or "24h" (sliding window)
+UPLOAD_QUOTA_POLICY = env.str("UPLOAD_QUOTA_POLICY", "daily")
+UPLOAD_QUOTA_PER_IP = env.int("UPLOAD_QUOTA_PER_IP", 10)
+# Where quota counters are kept: "core.ratelimit.CacheBackend" (the cache, when it
+# is Redis/Memcached), else "core.ratelimit.DatabaseBackend" (a table of the primary
+# database). Both are shared by every worker; "core.ratelimit.LocalMemoryBackend"
+# counts per process, which gunicorn.conf.py refuses with more than one worker.
+RATE_LIMIT_BACKEND = env.str(
+    "RATE_LIMIT_BACKEND",
+    (
+        "core.ratelimit.CacheBackend"
+        if any(name in CACHES["default"]["BACKEND"] for name in ("redis", "memcached"))
+        else "core.ratelimit.DatabaseBackend"
+    ),
+)
+
+# Background jobs (see `manage.py run_image_worker`)
+JOBS_LEASE_SECONDS = env.int("JOBS_LEASE_SECONDS", 300)
+JOBS_RETRY_BACKOFF_SECONDS = env.int("JOBS_RETRY_BACKOFF_SECONDS", 10)
+
+# Files of deleted images are removed by a worker this long after the delete,
+# so a burst of deletes is handled by a single batched sweep
+BLOB_SWEEP_DELAY_SECONDS = env.int("BLOB_SWEEP_DELAY_SECONDS", 10)
+
+# Threads for blocking file work started by async views (see core.concurrency)
+ASYNC_BLOCKING_WORKERS = env.int("ASYNC_BLOCKING_WORKERS", 8)
+
+# Metrics served at /metrics (see core.metrics). With several worker processes,
+# point METRICS_DIR at a directory they share so a scrape sees all of them.
+METRICS_DIR = env.str("METRICS_DIR", "")
+METRICS_FLUSH_SECONDS = env.int("METRICS_FLUSH_SECONDS", 5)
+# Files of workers that exited without folding their totals (e.g. killed) are
+# folded by the next scrape once they are this old
+METRICS_STALE_SECONDS = env.int("METRICS_STALE_SECONDS", 600)
+METRICS_ALLOWED_IPS = env.list("METRICS_ALLOWED_IPS", default=["127.0.0.1"])
+
+# Request profiler (core.profiling), viewed under Admin > Core > Request profiles.
+# Profiles PROFILING_SAMPLE_RATE of requests with cProfile and records any
+# request slower than PROFILING_SLOW_MS; set PROFILING_SPILL_DIR to a shared
+# directory to see the records of every worker.
+PROFILING_ENABLED = env.bool("PROFILING_ENABLED", False)
+PROFILING_SAMPLE_RATE = env.float("PROFILING_SAMPLE_RATE", 0.01)
+PROFILING_SLOW_MS = env.int("PROFILING_SLOW_MS", 1000)
+PROFILING_BUFFER_SIZE = env.int("PROFILING_BUFFER_SIZE", 100)
+PROFILING_SPILL_DIR = env.str("PROFILING_SPILL_DIR", "")
+PROFILING_SPILL_MAX_FILES = env.int("PROFILING_SPILL_MAX_FILES", 500)
+
+# logs/app.log holds JSON lines, written by a background thread per process
+# (core.logs) and rotated at LOG_MAX_BYTES
+LOG_MAX_BYTES = env.int("LOG_MAX_BYTES", 10 * 1024 * 1024)
+LOG_BACKUP_COUNT = env.int("LOG_BACKUP_COUNT", 5)
 
 LOGGING = {
     "version": 1,
@@ -102,6 +280,9 @@ LOGGING = {
             "format": "[{asctime}] {levelname} {name} - {message}",
             "style": "{",
         },
+        "json": {
+            "()": "core.logs.JsonFormatter",
+        },
     },
     "handlers": {
         "console": {
@@ -110,9 +291,11 @@ LOGGING = {
         },
         "file": {
             "level": "INFO",
-            "class": "logging.FileHandler",
+            "class": "core.logs.AsyncRotatingFileHandler",
             "filename": str(LOG_DIR / "app.log"),
-            "formatter": "verbose",
+            "maxBytes": LOG_MAX_BYTES,
+            "backupCount": LOG_BACKUP_COUNT,
+            "formatter": "json",
         },
     },
     "loggers": {
@@ -121,8 +304,9 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        # One line per request: queued to the file only, never written inline
         "core.middleware": {
-            "handlers": ["console", "file"],
+            "handlers": ["file"],
             "level": "INFO",
             "propagate": False,
         },
@@ -9,8 +9,15 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
 
 application = get_wsgi_application()
+
+if settings.SERVE_MEDIA:
+    from core.media import MediaFileApplication
+
+    # Media requests are answered before Django's middleware stack runs
+    application = MediaFileApplication(application)
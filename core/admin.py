@@ -1,3 +1,144 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import PermissionDenied
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.urls import path
 
-# Register your models here.
+from core import profiling
+
+from .models import RequestProfile
+from .pagination import DEFAULT_COUNT_LIMIT, KeysetPaginator, estimated_count
+
+# Rows on the list page
+PROFILE_LIST_SIZE = 100
+
+# Query string parameter holding a KeysetChangeList page's cursor
+CURSOR_VAR = "cursor"
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist that pages with a cursor (see core.pagination) instead of
+    `?p=N`, and shows an estimated count instead of running COUNT(*).
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # A new filter, search or ordering starts again from the first page
+        if CURSOR_VAR not in (new_params or {}):
+            remove = [*(remove or []), CURSOR_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def get_results(self, request):
+        paginator = KeysetPaginator(
+            self.queryset, self.list_per_page, self.model_admin.keyset_ordering
+        )
+        page = paginator.get_page(request.GET.get(CURSOR_VAR))
+        count, exact = estimated_count(self.queryset, self.model_admin.count_limit)
+        self.result_count = count
+        if exact:
+            self.result_count_display = str(count)
+        elif count == self.model_admin.count_limit:
+            self.result_count_display = f"More than {count}"
+        else:
+            self.result_count_display = f"About {count}"
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = page.object_list
+        # "Show all" would load the whole table
+        self.can_show_all = False
+        self.multi_page = page.has_other_pages()
+        self.paginator = paginator
+        self.page = page
+        self.next_url = (
+            self.get_query_string({CURSOR_VAR: page.next_cursor})
+            if page.has_next()
+            else None
+        )
+        self.previous_url = (
+            self.get_query_string({CURSOR_VAR: page.previous_cursor})
+            if page.has_previous()
+            else None
+        )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    ModelAdmin for tables too large to count or to page through with OFFSET.
+
+    The changelist is read newest first along `keyset_ordering` (which should
+    be indexed), columns are not sortable, and the result count is an
+    estimate past `count_limit` rows. `list_editable` is not supported.
+    """
+
+    change_list_template = "admin/core/keyset_change_list.html"
+    show_full_result_count = False
+    sortable_by = ()
+    keyset_ordering = ("created_at", "id")
+    count_limit = DEFAULT_COUNT_LIMIT
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Slowest recent requests recorded by core.profiling, and their details."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        return [
+            path(
+                "",
+                self.admin_site.admin_view(self.changelist_view),
+                name="%s_%s_changelist" % info,
+            ),
+            path(
+                "<str:record_id>/",
+                self.admin_site.admin_view(self.detail_view),
+                name="%s_%s_detail" % info,
+            ),
+        ]
+
+    def _context(self, request, **extra):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        return {**self.admin_site.each_context(request), "opts": self.opts, **extra}
+
+    def changelist_view(self, request, extra_context=None):
+        context = self._context(
+            request,
+            title="Slowest recent requests",
+            records=profiling.recent()[:PROFILE_LIST_SIZE],
+            enabled=getattr(settings, "PROFILING_ENABLED", False),
+        )
+        return TemplateResponse(
+            request, "admin/core/requestprofile/profile_list.html", context
+        )
+
+    def detail_view(self, request, record_id):
+        record = profiling.get(record_id)
+        if record is None:
+            raise Http404("No such request profile (it may have been evicted).")
+        context = self._context(
+            request, title=f"{record.method} {record.path}", record=record
+        )
+        return TemplateResponse(
+            request, "admin/core/requestprofile/profile_detail.html", context
+        )
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
+
+    def ready(self) -> None:
+        from .metrics import install_query_counter
+        from .profiling import install_query_capture
+
+        connection_created.connect(install_query_counter)
+        connection_created.connect(install_query_capture)
@@ -0,0 +1,44 @@
+"""
+Helpers for async views.
+
+Blocking file work started from the event loop (parsing a multipart body into
+the staging directory, reading image headers) runs on one bounded thread pool,
+so a burst of uploads queues up instead of spawning a thread per request.
+Functions sent there must not touch the ORM: database work belongs in
+`sync_to_async`, which keeps each request on its own connection.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from django.conf import settings
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def blocking_executor() -> ThreadPoolExecutor:
+    """The process-wide pool (`ASYNC_BLOCKING_WORKERS` threads)."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, "ASYNC_BLOCKING_WORKERS", 8),
+                    thread_name_prefix="blocking-io",
+                )
+    return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Await `func(*args, **kwargs)` run on the bounded blocking pool."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(blocking_executor(), call)
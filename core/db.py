@@ -0,0 +1,130 @@
+"""
+Read replicas (`DATABASE_REPLICA_URLS`, see the settings).
+
+`ReplicaRouter` sends the reads of web requests to a replica and every write
+to the primary. Work outside a request (the job worker, management commands)
+uses the primary throughout. A request reads from the primary instead when
+
+- it is not a GET/HEAD/OPTIONS request,
+- it has already written something, or is inside a transaction,
+- its client wrote within the last `DATABASE_REPLICA_PIN_SECONDS` (a cookie
+  set by `ReplicaRoutingMiddleware`), so users see their own uploads at once.
+
+A replica that cannot be reached is skipped for
+`DATABASE_REPLICA_RETRY_SECONDS`, and reads fail over to the others or to
+the primary.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Present while the client is within its pin window
+PIN_COOKIE = "db_primary"
+
+
+class RoutingState:
+    """Where the current request may read from."""
+
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned: bool):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# Set for the duration of a web request; copied into sync_to_async threads
+# along with the rest of the context
+_state: ContextVar[Optional[RoutingState]] = ContextVar("db_routing", default=None)
+
+# Replica alias -> time.monotonic() until which it is skipped
+_down_until: Dict[str, float] = {}
+
+
+def replicas() -> List[str]:
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+@contextmanager
+def request_routing(pinned: bool) -> Iterator[RoutingState]:
+    """Let the reads made inside the block go to replicas unless `pinned`."""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def mark_unavailable(alias: str) -> None:
+    retry = getattr(settings, "DATABASE_REPLICA_RETRY_SECONDS", 30)
+    _down_until[alias] = time.monotonic() + retry
+
+
+def is_available(alias: str) -> bool:
+    """
+    Whether `alias` can take reads: not recently failed, and this thread's
+    connection to it is open (persistent connections are health-checked once
+    per request, as Django does before its first query).
+    """
+    until = _down_until.get(alias)
+    if until is not None:
+        if time.monotonic() < until:
+            return False
+        _down_until.pop(alias, None)
+    connection = connections[alias]
+    try:
+        connection.close_if_health_check_failed()
+        connection.ensure_connection()
+    except DatabaseError:
+        logger.warning("Replica %s is unavailable", alias, exc_info=True)
+        mark_unavailable(alias)
+        return False
+    return True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        candidates = replicas()
+        if not candidates:
+            return None
+        state = _state.get()
+        if (
+            state is None
+            or state.pinned
+            or state.wrote
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            # Explicitly, or objects loaded from a replica would drag their
+            # related lookups along with them
+            return DEFAULT_DB_ALIAS
+        for alias in random.sample(candidates, len(candidates)):
+            if is_available(alias):
+                return alias
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's rows
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,160 @@
+"""
+Logging handlers and formatters used by `LOGGING` in the settings.
+
+`AsyncRotatingFileHandler` only puts records on an in-memory queue; a
+`QueueListener` thread formats them (as JSON lines with `JsonFormatter`) and
+writes them to a size-rotated file, so request threads never wait on disk.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line: time, level, logger and message, then any
+    `extra=` fields and the traceback, if there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for a file that several processes (gunicorn workers)
+    append to: when another process has already rotated the file, reopen the
+    new one instead of rotating a second time.
+    """
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return (
+                os.stat(self.baseFilename).st_ino
+                != os.fstat(self.stream.fileno()).st_ino
+            )
+        except FileNotFoundError:
+            return True
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if self.stream is not None and self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+        return super().shouldRollover(record)
+
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # Wait for room rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+
+class AsyncRotatingFileHandler(QueueHandler):
+    """
+    Hands records to a background thread that writes them to `filename`,
+    rotated at `maxBytes` with `backupCount` old files kept.
+
+    The queue holds at most `queue_size` records: if the writer falls behind,
+    new records are dropped (and counted in `dropped`) rather than blocking
+    the caller. The formatter set on this handler runs on the writer thread.
+    """
+
+    def __init__(
+        self,
+        filename: str,
+        maxBytes: int = 10 * 1024 * 1024,
+        backupCount: int = 5,
+        encoding: str = "utf-8",
+        queue_size: int = 10000,
+    ):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.queue_size = queue_size
+        self.target = SharedRotatingFileHandler(
+            filename,
+            maxBytes=maxBytes,
+            backupCount=backupCount,
+            encoding=encoding,
+            delay=True,
+        )
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+        self._pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.flush_and_stop)
+
+    def setFormatter(self, fmt: Optional[logging.Formatter]) -> None:
+        self.target.setFormatter(fmt)
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # Started lazily, and again in a forked child: threads do not
+            # survive fork() and the parent's queue may hold a locked mutex
+            self.queue = queue.Queue(maxsize=self.queue_size)
+            self._listener = _Listener(self.queue, self.target)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only resolve what must not cross threads (arguments, traceback
+        # objects); formatting is left to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush_and_stop(self) -> None:
+        """Write out everything queued so far and stop the writer thread."""
+        with self._start_lock:
+            listener, self._listener = self._listener, None
+            if listener is not None and self._pid == os.getpid():
+                listener.stop()
+            self._pid = None
+        self.target.flush()
+
+    def close(self) -> None:
+        self.flush_and_stop()
+        self.target.close()
+        super().close()
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=10) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as exc:
+        return exc.code
+
+
+def child_pids(pid: int) -> List[int]:
+    """Processes whose parent is `pid` (Linux /proc)."""
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as fh:
+                # The command name is in parentheses and may contain spaces
+                fields = fh.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[1]) == pid:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def process_memory(pid: int) -> Optional[Dict[str, int]]:
+    """
+    Resident (RSS), proportional (PSS: shared pages split between the
+    processes sharing them) and unique (USS) memory of `pid` in KiB, or None
+    where /proc/<pid>/smaps_rollup is not available.
+    """
+    values: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as fh:
+            for line in fh:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    values[key] = int(rest.split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
+    return {
+        "rss": values.get("Rss", 0),
+        "pss": values.get("Pss", 0),
+        "uss": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn with gunicorn.conf.py and report the time until it "
+        "answers its first request, and the memory of the master and of each "
+        "worker once they have served some requests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, help="Override GUNICORN_WORKERS.")
+        parser.add_argument("--threads", type=int, help="Override GUNICORN_THREADS.")
+        parser.add_argument(
+            "--path", default="/users/login/", help="Page to request (default: login)."
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=50,
+            help="Requests sent after the first one, before memory is read.",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=60,
+            help="Seconds to wait for the first answer.",
+        )
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="Also measure with preload_app off.",
+        )
+
+    def handle(self, *args, **options):
+        runs = [("preload", True)]
+        if options["compare"]:
+            runs.append(("no preload", False))
+        for label, preload in runs:
+            self._report(label, *self._measure(preload, options))
+
+    def _measure(self, preload: bool, options):
+        port = _free_port()
+        env = {
+            **os.environ,
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "GUNICORN_PRELOAD": "1" if preload else "0",
+        }
+        for option in ("workers", "threads"):
+            if options[option]:
+                env[f"GUNICORN_{option.upper()}"] = str(options[option])
+        url = f"http://127.0.0.1:{port}{options['path']}"
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "-c",
+            str(settings.BASE_DIR / "gunicorn.conf.py"),
+            "config.wsgi:application",
+        ]
+
+        with tempfile.TemporaryFile() as log:
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                command,
+                cwd=settings.BASE_DIR,
+                env=env,
+                stdout=subprocess.DEVNULL,
+                stderr=log,
+            )
+            try:
+                status = self._first_response(url, process, log, options["timeout"])
+                seconds = time.perf_counter() - start
+                for _ in range(options["requests"]):
+                    _get(url)
+                memory = {
+                    pid: process_memory(pid)
+                    for pid in [process.pid, *child_pids(process.pid)]
+                }
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+        return seconds, status, process.pid, memory
+
+    def _first_response(self, url, process, log, timeout: float) -> int:
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                tail = log.read().decode(errors="replace")[-2000:]
+                raise CommandError(
+                    f"gunicorn exited with {process.returncode}:\n{tail}"
+                )
+            try:
+                return _get(url)
+            except (urllib.error.URLError, ConnectionError, socket.timeout):
+                time.sleep(0.02)
+        raise CommandError(f"No answer from {url} within {timeout:g}s")
+
+    def _report(self, label, seconds, status, master, memory) -> None:
+        self.stdout.write(
+            f"{label}: first request answered after {seconds * 1000:.0f} ms "
+            f"(HTTP {status})"
+        )
+        if status >= 400:
+            self.stderr.write(
+                "  The page was not served normally; check ALLOWED_HOSTS and --path."
+            )
+        if any(values is None for values in memory.values()):
+            self.stdout.write("  Memory: needs Linux /proc/<pid>/smaps_rollup")
+            return
+        self.stdout.write(
+            f"  {'process':<14}{'RSS MiB':>10}{'PSS MiB':>10}{'USS MiB':>10}"
+        )
+        for pid, values in memory.items():
+            name = "master" if pid == master else f"worker {pid}"
+            self.stdout.write(
+                f"  {name:<14}"
+                + "".join(f"{values[k] / 1024:>10.1f}" for k in ("rss", "pss", "uss"))
+            )
+        total = sum(values["pss"] for values in memory.values())
+        self.stdout.write(f"  {'total (PSS)':<14}{'':>10}{total / 1024:>10.1f}")
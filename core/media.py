@@ -0,0 +1,320 @@
+"""
+Fast path for MEDIA_URL, mounted in front of the Django application in
+`config/wsgi.py` and `config/asgi.py` so image bytes skip the middleware stack.
+
+- Zero-copy bodies: WSGI responses go through `wsgi.file_wrapper` (gunicorn
+  turns that into `os.sendfile`), ASGI responses use the
+  `http.response.zerocopysend` extension when the server offers it.
+- Single-range `Range` requests (206/416) with `If-Range`.
+- Strong ETags (the content hash for content-addressed names, mtime/size
+  otherwise), `If-None-Match`/`If-Modified-Since` 304s, and immutable
+  `Cache-Control` for content-addressed names.
+- Optional hand-off to a reverse proxy via `X-Accel-Redirect` or `X-Sendfile`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import mimetypes
+import os
+import re
+import stat
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from django.conf import settings
+from django.utils.http import http_date, parse_http_date_safe
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+
+# Basename is a SHA-256 hex digest: the content can never change
+CONTENT_ADDRESSED_RE = re.compile(r"(?:^|/)([0-9a-f]{64})\.[A-Za-z0-9]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class MediaResponse(NamedTuple):
+    status: int
+    headers: List[Tuple[str, str]]
+    path: Optional[str] = None
+    offset: int = 0
+    length: int = 0
+
+
+def _status_line(status: int) -> str:
+    reasons = {
+        200: "OK",
+        206: "Partial Content",
+        304: "Not Modified",
+        404: "Not Found",
+        405: "Method Not Allowed",
+        416: "Range Not Satisfiable",
+    }
+    return f"{status} {reasons[status]}"
+
+
+def _error(status: int, extra: Optional[List[Tuple[str, str]]] = None) -> MediaResponse:
+    headers = [("Content-Type", "text/plain"), ("Content-Length", "0")]
+    return MediaResponse(status, headers + (extra or []))
+
+
+class MediaServer:
+    """Maps a request for `<media_url><name>` to a `MediaResponse`."""
+
+    def __init__(
+        self,
+        media_url: Optional[str] = None,
+        media_root: Optional[str] = None,
+        offload_header: Optional[str] = None,
+        accel_prefix: Optional[str] = None,
+    ):
+        self.media_url = media_url or settings.MEDIA_URL
+        self.media_root = os.path.realpath(str(media_root or settings.MEDIA_ROOT))
+        self.offload_header = (
+            offload_header
+            if offload_header is not None
+            else getattr(settings, "MEDIA_OFFLOAD_HEADER", "")
+        )
+        self.accel_prefix = accel_prefix or getattr(
+            settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/"
+        )
+
+    def handles(self, path: str) -> bool:
+        return path.startswith(self.media_url)
+
+    def _resolve(self, path: str) -> Optional[str]:
+        name = unquote(path[len(self.media_url) :])
+        parts = name.split("/")
+        # No traversal, no hidden files (e.g. the upload staging directory)
+        if not name or any(not p or p.startswith(".") for p in parts):
+            return None
+        return name
+
+    def respond(self, method: str, path: str, headers: dict) -> MediaResponse:
+        """`headers` maps lower-case request header names to values."""
+        if method not in ("GET", "HEAD"):
+            return _error(405, [("Allow", "GET, HEAD")])
+
+        name = self._resolve(path)
+        if name is None:
+            return _error(404)
+        full_path = os.path.join(self.media_root, name)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            return _error(404)
+        if not stat.S_ISREG(st.st_mode):
+            return _error(404)
+
+        match = CONTENT_ADDRESSED_RE.search(name)
+        if match:
+            etag = f'"{match.group(1)}"'
+            cache_control = f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            cache_control = f"public, max-age={MUTABLE_MAX_AGE}"
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        response_headers = [
+            ("ETag", etag),
+            ("Last-Modified", http_date(st.st_mtime)),
+            ("Cache-Control", cache_control),
+            ("Accept-Ranges", "bytes"),
+        ]
+
+        if self._not_modified(headers, etag, st.st_mtime):
+            return MediaResponse(304, response_headers)
+
+        status, offset, length = 200, 0, st.st_size
+        range_header = headers.get("range")
+        if range_header and headers.get("if-range", etag) == etag:
+            byte_range = parse_range(range_header, st.st_size)
+            if byte_range is None:
+                return _error(416, [("Content-Range", f"bytes */{st.st_size}")])
+            if byte_range != (0, st.st_size):
+                status, (offset, length) = 206, byte_range
+                response_headers.append(
+                    (
+                        "Content-Range",
+                        f"bytes {offset}-{offset + length - 1}/{st.st_size}",
+                    )
+                )
+
+        response_headers += [
+            ("Content-Type", content_type),
+            ("Content-Length", str(length)),
+        ]
+
+        if self.offload_header and method == "GET":
+            # The proxy reads the file (and applies Range) itself
+            target = (
+                self.accel_prefix + quote(name)
+                if self.offload_header.lower() == "x-accel-redirect"
+                else full_path
+            )
+            offloaded = [
+                (k, v)
+                for k, v in response_headers
+                if k not in ("Content-Length", "Content-Range")
+            ]
+            return MediaResponse(200, offloaded + [(self.offload_header, target)])
+
+        if method == "HEAD":
+            return MediaResponse(status, response_headers)
+        return MediaResponse(status, response_headers, full_path, offset, length)
+
+    @staticmethod
+    def _not_modified(headers: dict, etag: str, mtime: float) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+        since = parse_http_date_safe(headers.get("if-modified-since") or "")
+        return since is not None and int(mtime) <= since
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return (offset, length) for a single byte range, or None if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        # Multiple or malformed ranges: serve the whole file
+        return 0, size
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return 0, size
+        suffix = min(int(end), size)
+        if suffix == 0:
+            return None
+        return size - suffix, suffix
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return None
+    return start, end - start + 1
+
+
+def _read_range(fh, length: int):
+    remaining = length
+    while remaining > 0:
+        chunk = fh.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+class _RangeFileWrapper:
+    """Fallback body for servers without `wsgi.file_wrapper`."""
+
+    def __init__(self, fh, length: int):
+        self.fh = fh
+        self.length = length
+
+    def __iter__(self):
+        return _read_range(self.fh, self.length)
+
+    def close(self):
+        self.fh.close()
+
+
+class MediaFileApplication:
+    """WSGI wrapper: serves MEDIA_URL itself and passes everything else on."""
+
+    def __init__(self, application, server: Optional[MediaServer] = None):
+        self.application = application
+        self.server = server or MediaServer()
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if not self.server.handles(path):
+            return self.application(environ, start_response)
+
+        headers = {
+            key[5:].replace("_", "-").lower(): value
+            for key, value in environ.items()
+            if key.startswith("HTTP_")
+        }
+        response = self.server.respond(environ["REQUEST_METHOD"], path, headers)
+        start_response(_status_line(response.status), response.headers)
+        if response.path is None:
+            return [b""]
+
+        fh = open(response.path, "rb")
+        fh.seek(response.offset)
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        to_eof = response.offset + response.length == os.fstat(fh.fileno()).st_size
+        # gunicorn sends a file wrapper with os.sendfile(), from the current
+        # offset for Content-Length bytes. Generic wrappers read to EOF, so
+        # they are only safe for ranges that end there.
+        if file_wrapper is not None and (
+            to_eof or environ.get("SERVER_SOFTWARE", "").startswith("gunicorn")
+        ):
+            return file_wrapper(fh, CHUNK_SIZE)
+        return _RangeFileWrapper(fh, response.length)
+
+
+class MediaFileASGIApplication:
+    """ASGI wrapper: serves MEDIA_URL itself and passes everything else on."""
+
+    def __init__(self, application, server: Optional[MediaServer] = None):
+        self.application = application
+        self.server = server or MediaServer()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.server.handles(scope["path"]):
+            return await self.application(scope, receive, send)
+
+        headers = {
+            k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]
+        }
+        response = self.server.respond(scope["method"], scope["path"], headers)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": response.status,
+                "headers": [
+                    (k.lower().encode("latin-1"), v.encode("latin-1"))
+                    for k, v in response.headers
+                ],
+            }
+        )
+        if response.path is None:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        loop = asyncio.get_running_loop()
+        fh = await loop.run_in_executor(None, open, response.path, "rb")
+        try:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": fh,
+                        "offset": response.offset,
+                        "count": response.length,
+                    }
+                )
+                return
+
+            fh.seek(response.offset)
+            remaining = response.length
+            while remaining > 0:
+                chunk = await loop.run_in_executor(
+                    None, fh.read, min(CHUNK_SIZE, remaining)
+                )
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+            if remaining > 0:
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            fh.close()
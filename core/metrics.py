@@ -0,0 +1,410 @@
+"""
+Request, upload and database counters plus per-route latency histograms,
+exposed at /metrics in the Prometheus text format.
+
+Recording takes no lock: every thread adds to its own shard, and a scrape
+sums the shards. With several worker processes, set `METRICS_DIR` to a
+directory they share. Each process then writes its totals to
+`<pid>-<token>.json` every `METRICS_FLUSH_SECONDS` from a background thread
+(the token keeps a reused pid from overwriting an exited worker's file), and
+the worker that answers the scrape merges those files with its own live
+totals.
+
+Totals of workers that have exited are folded into `retired.json` and their
+files removed (`retire`), so totals do not drop when gunicorn recycles a
+worker and the directory does not grow with every recycle. gunicorn.conf.py
+does this as each worker exits; a scrape also folds files nobody has written
+to for `METRICS_STALE_SECONDS`, for workers that died without the hook.
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: folds and scrapes are not serialized
+    fcntl = None
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds of the latency buckets, in milliseconds (plus +Inf)
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+_BOUNDS_NS = tuple(int(ms * 1_000_000) for ms in LATENCY_BUCKETS_MS)
+# A histogram is a flat list: one count per bucket, the +Inf bucket, then the
+# sum of all observations in nanoseconds
+_HISTOGRAM_LEN = len(_BOUNDS_NS) + 2
+
+REPORTED_QUANTILES = (0.5, 0.9, 0.99)
+
+DESCRIPTIONS = {
+    "http_requests_total": ("counter", "Requests served, by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "Time spent in Django per route."),
+    "http_request_duration_estimate_seconds": (
+        "gauge",
+        "Latency quantiles estimated from the duration histogram.",
+    ),
+    "upload_bytes_total": ("counter", "Bytes of image data stored from uploads."),
+    "quota_rejections_total": ("counter", "Uploads refused by the per-IP quota."),
+    "db_queries_total": ("counter", "SQL queries executed, by database alias."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Shard:
+    """Totals recorded by one thread."""
+
+    __slots__ = ("counters", "histograms")
+
+    def __init__(self):
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[str, List[int]] = {}
+
+
+_local = threading.local()
+_shards: List[_Shard] = []
+_shards_lock = threading.Lock()
+_flusher_pid: Optional[int] = None
+# Names this process's snapshot file together with its pid
+_token = uuid.uuid4().hex[:12]
+
+RETIRED_FILE = "retired.json"
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _Shard()
+        # Once per thread, not per observation
+        with _shards_lock:
+            _shards.append(shard)
+        if _flusher_pid != os.getpid() and getattr(settings, "METRICS_DIR", ""):
+            _start_flusher()
+    return shard
+
+
+def _forget_parent() -> None:
+    # A forked worker starts from zero instead of double-counting what the
+    # parent had recorded before the fork
+    global _local, _shards_lock, _flusher_pid, _token
+    _local = threading.local()
+    _shards.clear()
+    _shards_lock = threading.Lock()
+    _flusher_pid = None
+    _token = uuid.uuid4().hex[:12]
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_parent)
+
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+    """Add `amount` to the counter `name` with the given labels."""
+    counters = _shard().counters
+    key = (name, tuple(sorted(labels.items())))
+    counters[key] = counters.get(key, 0) + amount
+
+
+def record_request(route: str, method: str, status: int, duration_ns: int) -> None:
+    """Count a finished request and add its duration to the route's histogram."""
+    shard = _shard()
+    key = (
+        "http_requests_total",
+        (("method", method), ("route", route), ("status", str(status))),
+    )
+    shard.counters[key] = shard.counters.get(key, 0) + 1
+    histogram = shard.histograms.get(route)
+    if histogram is None:
+        histogram = shard.histograms[route] = [0] * _HISTOGRAM_LEN
+    histogram[bisect.bisect_left(_BOUNDS_NS, duration_ns)] += 1
+    histogram[-1] += duration_ns
+
+
+def snapshot() -> dict:
+    """
+    This process's totals, in a JSON-serialisable form. Shards are read
+    without stopping their threads, so an observation being recorded right
+    now may show up in one field a scrape before the other.
+    """
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[str, List[int]] = {}
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        # dict() copies in one step, safe against the owner adding keys
+        for key, value in dict(shard.counters).items():
+            counters[key] = counters.get(key, 0) + value
+        for route, histogram in dict(shard.histograms).items():
+            _add_histogram(histograms, route, histogram)
+    return {
+        "counters": [
+            [name, list(labels), value] for (name, labels), value in counters.items()
+        ],
+        "histograms": histograms,
+    }
+
+
+def reset() -> None:
+    """Zero this process's totals (for tests and benchmarks)."""
+    with _shards_lock:
+        for shard in _shards:
+            shard.counters.clear()
+            shard.histograms.clear()
+
+
+def _add_histogram(histograms: Dict[str, List[int]], route: str, values) -> None:
+    total = histograms.setdefault(route, [0] * _HISTOGRAM_LEN)
+    for i, value in enumerate(values):
+        total[i] += value
+
+
+def merge(snapshots: Iterable[dict]) -> dict:
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[str, List[int]] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            counters[key] = counters.get(key, 0) + value
+        for route, values in snap.get("histograms", {}).items():
+            if len(values) == _HISTOGRAM_LEN:
+                _add_histogram(histograms, route, values)
+    return {
+        "counters": [
+            [name, list(labels), value] for (name, labels), value in counters.items()
+        ],
+        "histograms": histograms,
+    }
+
+
+def _snapshot_path(directory: str) -> str:
+    return os.path.join(directory, f"{os.getpid()}-{_token}.json")
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str) -> Optional[dict]:
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def flush() -> None:
+    """Write this process's totals to `METRICS_DIR` (no-op if unset)."""
+    directory = getattr(settings, "METRICS_DIR", "")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    _write_json(_snapshot_path(directory), snapshot())
+
+
+@contextmanager
+def _directory_lock(directory: str):
+    """Serializes folding files into `retired.json` with reading them."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "a") as fh:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _snapshot_files(directory: str) -> List[str]:
+    return [
+        path
+        for path in glob.glob(os.path.join(directory, "*.json"))
+        if os.path.basename(path) != RETIRED_FILE
+    ]
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return float("inf")
+
+
+def _fold(directory: str, paths: List[str]) -> None:
+    # The caller holds the directory lock
+    retired_path = os.path.join(directory, RETIRED_FILE)
+    snapshots = [_read_json(retired_path) or {}]
+    snapshots += filter(None, map(_read_json, paths))
+    _write_json(retired_path, merge(snapshots))
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def retire(pid: int, directory: Optional[str] = None) -> None:
+    """
+    Fold the totals of the exited process `pid` into `retired.json`. Called
+    from gunicorn's `child_exit` hook, after the worker's last flush.
+    """
+    directory = directory or getattr(settings, "METRICS_DIR", "")
+    if not directory:
+        return
+    with _directory_lock(directory):
+        paths = glob.glob(os.path.join(directory, f"{pid}-*.json"))
+        if paths:
+            _fold(directory, paths)
+
+
+def _flush_forever(interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _start_flusher() -> None:
+    global _flusher_pid
+    with _shards_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    interval = getattr(settings, "METRICS_FLUSH_SECONDS", 5)
+    threading.Thread(
+        target=_flush_forever, args=(interval,), name="metrics-flush", daemon=True
+    ).start()
+    atexit.register(flush)
+
+
+def collect() -> dict:
+    """Totals across all processes sharing `METRICS_DIR` (or just this one)."""
+    snapshots = [snapshot()]
+    directory = getattr(settings, "METRICS_DIR", "")
+    if directory:
+        own = _snapshot_path(directory)
+        stale_after = getattr(settings, "METRICS_STALE_SECONDS", 600)
+        cutoff = time.time() - stale_after
+        with _directory_lock(directory):
+            others = [path for path in _snapshot_files(directory) if path != own]
+            stale = [path for path in others if _mtime(path) < cutoff]
+            if stale:
+                _fold(directory, stale)
+            paths = [os.path.join(directory, RETIRED_FILE)]
+            paths += [path for path in others if path not in stale]
+            # This process's own file is skipped: the live totals are newer
+            snapshots += filter(None, map(_read_json, paths))
+    return merge(snapshots)
+
+
+def estimate_quantile(histogram: List[int], q: float) -> Optional[float]:
+    """
+    The `q` quantile of a histogram, in seconds, interpolated within its
+    bucket (as Prometheus' `histogram_quantile()` does). None if empty.
+    """
+    counts = histogram[:-1]
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if i == len(_BOUNDS_NS):
+                # +Inf bucket: the best we can say is "above the last bound"
+                return _BOUNDS_NS[-1] / 1e9
+            lower = _BOUNDS_NS[i - 1] if i else 0
+            upper = _BOUNDS_NS[i]
+            return (lower + (upper - lower) * (rank - seen) / count) / 1e9
+        seen += count
+    return None
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels)
+    return "{" + inner + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render(totals: dict) -> str:
+    """Prometheus text exposition of `collect()`'s result."""
+    by_name: Dict[str, List[str]] = {}
+    for name, labels, value in sorted(totals["counters"], key=lambda c: (c[0], c[1])):
+        by_name.setdefault(name, []).append(
+            f"{name}{_format_labels(labels)} {_format_value(value)}"
+        )
+
+    name = "http_request_duration_seconds"
+    lines = []
+    estimates = []
+    for route, histogram in sorted(totals["histograms"].items()):
+        cumulative = 0
+        for bound, count in zip(_BOUNDS_NS, histogram):
+            cumulative += count
+            labels = (("route", route), ("le", _format_value(bound / 1e9)))
+            lines.append(f"{name}_bucket{_format_labels(labels)} {cumulative}")
+        cumulative += histogram[-2]
+        lines.append(
+            f"{name}_bucket{_format_labels((('route', route), ('le', '+Inf')))} "
+            f"{cumulative}"
+        )
+        lines.append(
+            f"{name}_sum{_format_labels((('route', route),))} "
+            f"{_format_value(histogram[-1] / 1e9)}"
+        )
+        lines.append(f"{name}_count{_format_labels((('route', route),))} {cumulative}")
+        for q in REPORTED_QUANTILES:
+            value = estimate_quantile(histogram, q)
+            if value is not None:
+                labels = (("route", route), ("quantile", str(q)))
+                estimates.append(
+                    "http_request_duration_estimate_seconds"
+                    f"{_format_labels(labels)} {_format_value(value)}"
+                )
+    if lines:
+        by_name[name] = lines
+    if estimates:
+        by_name["http_request_duration_estimate_seconds"] = estimates
+
+    output = []
+    for name in sorted(set(DESCRIPTIONS) | set(by_name)):
+        kind, description = DESCRIPTIONS.get(name, ("untyped", ""))
+        if description:
+            output.append(f"# HELP {name} {description}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(by_name.get(name, []))
+    return "\n".join(output) + "\n"
+
+
+def count_queries(execute, sql, params, many, context):
+    """`connection.execute_wrapper` hook behind `db_queries_total`."""
+    inc("db_queries_total", alias=context["connection"].alias)
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs) -> None:
+    """`connection_created` receiver: count every query on the connection."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_queries)
@@ -1,12 +1,17 @@
 import logging
+import random
 import time
 
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
 from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.http import JsonResponse
-from django.urls import resolve
+from django.urls import Resolver404, resolve, reverse
+from whitenoise.middleware import WhiteNoiseMiddleware
 
+from core import db, metrics, profiling
 from core.utils import get_client_ip
-from images.services import is_daily_quota_exceeded
+from images.services import is_upload_quota_exceeded
 
 logger = logging.getLogger(__name__)
 
@@ -15,40 +20,225 @@ class QuotaCheckMiddleware:
     """
     Middleware to reject requests from IPs that exceeded the daily upload quota
     *before* the view executes. This is especially useful for POSTs to `/`.
+    It only peeks at the counter; the view takes the actual slot.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
-        # Only apply to the upload endpoint and POST requests
-        if (
-            request.method == "POST"
-            and resolve(request.path_info).url_name == "image_upload"
-        ):
-            client_ip = get_client_ip(request)
-            if is_daily_quota_exceeded(client_ip):
-                return JsonResponse(
-                    {
-                        "detail": "Daily quota reached (10 uploads per IP). Try again tomorrow."
-                    },
-                    status=429,
-                )
+    @staticmethod
+    def _applies(request) -> bool:
+        # Only apply to the upload endpoints and POST requests
+        return request.method == "POST" and resolve(request.path_info).url_name in (
+            "image_upload",
+            "image_batch_upload",
+        )
 
+    @staticmethod
+    def _quota_response():
+        return JsonResponse(
+            {"detail": "Daily quota reached (10 uploads per IP). Try again tomorrow."},
+            status=429,
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self._applies(request) and is_upload_quota_exceeded(get_client_ip(request)):
+            return self._quota_response()
         return self.get_response(request)
 
+    async def __acall__(self, request):
+        # A cold counter is seeded from the database, so the check leaves the
+        # event loop; it only runs for upload POSTs
+        if self._applies(request) and await sync_to_async(is_upload_quota_exceeded)(
+            get_client_ip(request)
+        ):
+            return self._quota_response()
+        return await self.get_response(request)
+
 
 class RequestLoggingMiddleware:
+    """
+    Logs one record per request and adds its duration to the route's latency
+    histogram (core.metrics). Timing uses `perf_counter_ns`; the record goes
+    to the logging queue, so nothing here waits on disk.
+    """
+
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _route(request) -> str:
+        # The URL pattern, not the path, keeps the number of series bounded.
+        # Responses returned by middleware never reached URL resolution.
+        match = request.resolver_match
+        if match is None:
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                return "unmatched"
+        return match.route
+
+    def _record(self, request, response, duration_ns: int) -> None:
+        route = self._route(request)
+        metrics.record_request(route, request.method, response.status_code, duration_ns)
+        logger.info(
+            "%s %s %s %.2fms",
+            request.method,
+            request.path,
+            response.status_code,
+            duration_ns / 1e6,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "route": route,
+                "status": response.status_code,
+                "duration_ms": round(duration_ns / 1e6, 3),
+                "client_ip": request.META.get("REMOTE_ADDR"),
+            },
+        )
 
     def __call__(self, request):
-        start = time.time()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter_ns()
         response = self.get_response(request)
-        duration = (time.time() - start) * 1000
-        logger.info(
-            f"{request.method} {request.path} from {request.META.get('REMOTE_ADDR')} - {response.status_code} ({duration:.2f} ms)"
+        self._record(request, response, time.perf_counter_ns() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter_ns()
+        response = await self.get_response(request)
+        self._record(request, response, time.perf_counter_ns() - start)
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Records a sample of requests, and every slow one, for the admin's request
+    profile viewer (see core.profiling). Requests served through the async
+    chain (ASGI) are only recorded when slow. Only loaded with
+    PROFILING_ENABLED.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "PROFILING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "PROFILING_SAMPLE_RATE", 0.01)
+        self.slow_ns = getattr(settings, "PROFILING_SLOW_MS", 1000) * 1_000_000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self) -> bool:
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _keep(
+        self, request, response, duration_ns, capture, profiler=None, sampled=False
+    ):
+        if sampled or duration_ns >= self.slow_ns:
+            reason = "sampled" if sampled else "slow"
+            profiling.store(
+                profiling.build_record(
+                    request, response, duration_ns, reason, capture, profiler
+                )
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        capture = profiling.QueryCapture()
+        token = profiling.current_capture.set(capture)
+        sampled = self._sampled()
+        profiler = profiling.start_profiler() if sampled else None
+        start = time.perf_counter_ns()
+        try:
+            response = self.get_response(request)
+        finally:
+            duration_ns = time.perf_counter_ns() - start
+            if profiler is not None:
+                profiler.disable()
+            profiling.current_capture.reset(token)
+        self._keep(request, response, duration_ns, capture, profiler, sampled)
+        return response
+
+    async def __acall__(self, request):
+        capture = profiling.QueryCapture()
+        token = profiling.current_capture.set(capture)
+        start = time.perf_counter_ns()
+        try:
+            response = await self.get_response(request)
+        finally:
+            duration_ns = time.perf_counter_ns() - start
+            profiling.current_capture.reset(token)
+        # No sampling: cProfile would see the other requests sharing the event
+        # loop and miss the work done in threads, so only slow requests are
+        # kept, with their SQL and timings
+        self._keep(request, response, duration_ns, capture)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets the request's reads go to a read replica (see core.db), unless it
+    is unsafe or its client wrote recently, and starts the client's pin
+    window when it writes. Only loaded with DATABASE_REPLICAS configured.
+    """
+
+    sync_capable = True
+    async_capable = True
+    safe_methods = ("GET", "HEAD", "OPTIONS")
+
+    def __init__(self, get_response):
+        if not db.replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.pin_seconds = getattr(settings, "DATABASE_REPLICA_PIN_SECONDS", 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request) -> bool:
+        return (
+            request.method not in self.safe_methods or db.PIN_COOKIE in request.COOKIES
         )
+
+    def _finish(self, request, response, state) -> None:
+        if state.wrote:
+            response.set_cookie(
+                db.PIN_COOKIE,
+                "1",
+                max_age=self.pin_seconds,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with db.request_routing(self._pinned(request)) as state:
+            response = self.get_response(request)
+        self._finish(request, response, state)
+        return response
+
+    async def __acall__(self, request):
+        with db.request_routing(self._pinned(request)) as state:
+            response = await self.get_response(request)
+        self._finish(request, response, state)
         return response
 
 
@@ -58,24 +248,73 @@ class FileSizeLimitMiddleware:
     Prevents memory waste and unnecessary form validation.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
         self.max_upload_size = getattr(
             settings, "MAX_UPLOAD_SIZE", 5 * 1024 * 1024
         )  # 5 MB default
+        # Resolved once rather than reversing the URLconf on every request
+        self.batch_upload_path = reverse("image_batch_upload")
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
-    def __call__(self, request):
+    def _reject(self, request):
         content_length = request.META.get("CONTENT_LENGTH")
         if content_length is not None:
+            max_size = self.max_upload_size
+            if request.path_info == self.batch_upload_path:
+                # Each file is held to MAX_UPLOAD_SIZE by BatchImageUploadHandler
+                max_size *= getattr(settings, "MAX_BATCH_UPLOAD_FILES", 10)
             try:
                 size = int(content_length)
-                if size > self.max_upload_size:
+                if size > max_size:
                     return JsonResponse(
                         {
-                            "detail": f"File too large. Max size is {self.max_upload_size // (1024 * 1024)} MB."
+                            "detail": f"File too large. Max size is {max_size // (1024 * 1024)} MB."
                         },
                         status=413,  # 413 Payload Too Large
                     )
             except ValueError:
                 pass
-        return self.get_response(request)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self._reject(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self._reject(request) or await self.get_response(request)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that can also run on the async path. WhiteNoise is
+    sync-only, so under ASGI it would put a thread hop in front of every
+    request; here only requests for static files leave the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings=settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
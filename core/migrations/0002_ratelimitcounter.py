@@ -0,0 +1,24 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RateLimitCounter",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=255, primary_key=True, serialize=False),
+                ),
+                ("value", models.BigIntegerField()),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
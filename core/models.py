@@ -28,3 +28,23 @@ class PublicIdMixin(models.Model):
 
     class Meta:
         abstract = True
+
+
+class RequestProfile(models.Model):
+    """
+    Admin entry for the request profiler. There is no table: records live in
+    memory or in PROFILING_SPILL_DIR (see core.profiling).
+    """
+
+    class Meta:
+        managed = False
+        default_permissions = ("view",)
+        verbose_name = "request profile"
+
+
+class RateLimitCounter(models.Model):
+    """A quota counter kept by core.ratelimit.DatabaseBackend."""
+
+    key = models.CharField(max_length=255, primary_key=True)
+    value = models.BigIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
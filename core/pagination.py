@@ -0,0 +1,248 @@
+"""
+Keyset (cursor) pagination.
+
+`Paginator` counts the whole queryset and then skips rows with OFFSET, so page
+N costs O(N * per_page). A keyset page instead continues from the last row it
+has seen (`WHERE (created_at, id) < (c, i) ORDER BY created_at DESC, id DESC
+LIMIT n`), which is a single index range scan at any depth and never counts.
+
+Cursors are opaque to clients: URL-safe base64 of the boundary row's key and
+the direction to read in.
+
+`estimated_count` stands in for `COUNT(*)` where a rough total will do: the
+planner's row estimate for a whole table, a count capped at a limit otherwise.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q, QuerySet
+
+# Counts at or below this are exact; above it they are estimates
+DEFAULT_COUNT_LIMIT = 10000
+
+
+class InvalidCursor(ValueError):
+    """The cursor was not produced by `KeysetPaginator`."""
+
+
+def encode_cursor(values: Tuple[Any, ...], reverse: bool = False) -> str:
+    payload = ["p" if reverse else "n"] + [
+        v.isoformat() if hasattr(v, "isoformat") else v for v in values
+    ]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[List[Any], bool]:
+    """Return (raw key values, reverse)."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, values = payload[0], payload[1:]
+    except (ValueError, TypeError, IndexError, KeyError) as exc:
+        raise InvalidCursor(cursor) from exc
+    if direction not in ("n", "p"):
+        raise InvalidCursor(cursor)
+    return values, direction == "p"
+
+
+class KeysetPage:
+    def __init__(
+        self,
+        object_list: List[Any],
+        next_cursor: Optional[str],
+        previous_cursor: Optional[str],
+    ):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    def has_previous(self) -> bool:
+        return self.previous_cursor is not None
+
+    def has_other_pages(self) -> bool:
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` in descending `ordering` order.
+
+    `ordering` names the key fields, most significant first, and must end in a
+    unique column so every row has a distinct key (e.g. `("created_at", "id")`).
+    For the scan to stay on an index, the queryset's filter columns followed by
+    `ordering` should be a composite index.
+    """
+
+    def __init__(
+        self, queryset: QuerySet, per_page: int, ordering=("created_at", "id")
+    ):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def _key(self, obj) -> Tuple[Any, ...]:
+        return tuple(getattr(obj, field) for field in self.ordering)
+
+    def _parse(self, values: List[Any]) -> Tuple[Any, ...]:
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        parsed = []
+        for field, value in zip(self.ordering, values):
+            model_field = self.queryset.model._meta.get_field(field)
+            try:
+                # A tampered cursor can hold any JSON value, e.g. a number for
+                # a DateTimeField
+                value = model_field.to_python(value)
+            except (ValidationError, TypeError, ValueError, OverflowError) as exc:
+                raise InvalidCursor(values) from exc
+            if value is None or not self._in_range(model_field, value):
+                raise InvalidCursor(values)
+            parsed.append(value)
+        return tuple(parsed)
+
+    def _in_range(self, model_field, value) -> bool:
+        # An id wider than the column type fails the query instead of matching
+        # nothing. The nominal ranges, since SQLite reports none and auto
+        # fields have no range validators.
+        ranges = BaseDatabaseOperations.integer_field_ranges
+        low, high = ranges.get(model_field.get_internal_type(), (None, None))
+        return (low is None or low <= value) and (high is None or value <= high)
+
+    def _beyond(self, key: Tuple[Any, ...], reverse: bool) -> Q:
+        """Rows after `key` in page order (before it if `reverse`)."""
+        lookup = "gt" if reverse else "lt"
+        condition = Q()
+        # (a, b) < (x, y)  <=>  a < x OR (a = x AND b < y)
+        for i in reversed(range(len(self.ordering))):
+            strict = Q(**{f"{self.ordering[i]}__{lookup}": key[i]})
+            condition = (
+                strict
+                if i == len(self.ordering) - 1
+                else strict | (Q(**{self.ordering[i]: key[i]}) & condition)
+            )
+        return condition
+
+    def _query(self, cursor: Optional[str]):
+        key, reverse = None, False
+        if cursor:
+            try:
+                values, reverse = decode_cursor(cursor)
+                key = self._parse(values)
+            except InvalidCursor:
+                key, reverse = None, False
+
+        queryset = self.queryset
+        if key is not None:
+            queryset = queryset.filter(self._beyond(key, reverse))
+        if reverse:
+            queryset = queryset.order_by(*self.ordering)
+        else:
+            queryset = queryset.order_by(*[f"-{field}" for field in self.ordering])
+        # One extra row tells us whether there is another page that way
+        return queryset[: self.per_page + 1], key, reverse
+
+    def _page(self, rows: List[Any], key, reverse: bool) -> KeysetPage:
+        more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([], None, None)
+        has_next = more if not reverse else True
+        has_previous = more if reverse else key is not None
+        return KeysetPage(
+            rows,
+            encode_cursor(self._key(rows[-1])) if has_next else None,
+            encode_cursor(self._key(rows[0]), reverse=True) if has_previous else None,
+        )
+
+    def get_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        """
+        Return the page after (or, for a previous-page cursor, before) the
+        cursor's row; the first page when `cursor` is empty or unreadable.
+        """
+        queryset, key, reverse = self._query(cursor)
+        return self._page(list(queryset), key, reverse)
+
+    async def aget_page(self, cursor: Optional[str] = None) -> KeysetPage:
+        """Async version of `get_page`."""
+        queryset, key, reverse = self._query(cursor)
+        return self._page([obj async for obj in queryset], key, reverse)
+
+
+def table_row_estimate(model, using: str = "default") -> Optional[int]:
+    """
+    The database's own estimate of `model`'s row count, kept by ANALYZE
+    (`pg_class.reltuples`, `sqlite_stat1`, `information_schema.tables`), or
+    None if there is none.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == "sqlite":
+        # One row per index (or one for the table), each starting with the
+        # row count; the table only exists once ANALYZE has run
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+        params = [table]
+    elif connection.vendor == "mysql":
+        sql = (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s"
+        )
+        params = [table]
+    else:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None:
+        return None
+    try:
+        estimate = int(str(row[0]).split()[0])
+    except (ValueError, IndexError):
+        return None
+    # PostgreSQL reports -1 for a table that was never analyzed
+    return estimate if estimate >= 0 else None
+
+
+def estimated_count(
+    queryset: QuerySet, limit: int = DEFAULT_COUNT_LIMIT
+) -> Tuple[int, bool]:
+    """
+    Return (count, exact). An unfiltered queryset over a table the database
+    estimates at more than `limit` rows gets that estimate; anything else is
+    counted, but no further than `limit` rows, so a larger result comes back
+    as `(limit, False)` ("more than limit").
+    """
+    if not queryset.query.where:
+        estimate = table_row_estimate(queryset.model, queryset.db)
+        if estimate is not None and estimate > limit:
+            return estimate, False
+    # COUNT(*) over a LIMITed subquery stops reading after limit + 1 rows
+    count = queryset.order_by()[: limit + 1].count()
+    if count > limit:
+        return limit, False
+    return count, True
@@ -0,0 +1,277 @@
+"""
+Opt-in request profiler (`PROFILING_ENABLED`), used by `ProfilingMiddleware`.
+
+A fraction of requests (`PROFILING_SAMPLE_RATE`) runs under cProfile. Those,
+and any request slower than `PROFILING_SLOW_MS`, are kept as a
+`ProfileRecord`: timings, every SQL query with its duration, and for
+profiled requests the call tree and the time spent in template rendering and
+in Pillow. Records go to a ring buffer of `PROFILING_BUFFER_SIZE` per
+process; with `PROFILING_SPILL_DIR` set they are also written there, where
+the admin viewer sees the records of every worker.
+
+Under ASGI the event loop is shared by concurrent requests, so there only
+SQL and timings are recorded.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import glob
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+# Queries kept per record; the count and total time cover all of them
+MAX_QUERIES = 200
+TOP_FUNCTIONS = 30
+# Call tree edges below this share of the request are left out
+CALL_TREE_MIN_SHARE = 0.01
+CALL_TREE_MAX_DEPTH = 25
+
+_TEMPLATE_PATH = os.sep + os.path.join("django", "template") + os.sep
+_PILLOW_PATH = os.sep + "PIL" + os.sep
+
+
+class ProfileRecord(NamedTuple):
+    id: str
+    started_at: str
+    method: str
+    path: str
+    status: int
+    duration_ms: float
+    reason: str  # "sampled" or "slow"
+    sql_count: int
+    sql_ms: float
+    queries: List[Tuple[str, float]]
+    template_ms: Optional[float] = None
+    pillow_ms: Optional[float] = None
+    call_tree: str = ""
+    top_functions: str = ""
+
+
+class QueryCapture:
+    """SQL run while a request is being recorded (see `capture_queries`)."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.queries: List[Tuple[str, float]] = []
+
+    def add(self, sql: str, duration_ns: int) -> None:
+        self.count += 1
+        self.total_ns += duration_ns
+        if len(self.queries) < MAX_QUERIES:
+            self.queries.append((sql, round(duration_ns / 1e6, 3)))
+
+
+# Set for the duration of a recorded request; copied into sync_to_async
+# threads along with the rest of the context
+current_capture: ContextVar[Optional[QueryCapture]] = ContextVar(
+    "current_capture", default=None
+)
+
+
+def capture_queries(execute, sql, params, many, context):
+    """`connection.execute_wrapper` hook; a no-op outside recorded requests."""
+    capture = current_capture.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter_ns()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        capture.add(sql, time.perf_counter_ns() - start)
+
+
+def install_query_capture(sender, connection, **kwargs) -> None:
+    """`connection_created` receiver for `capture_queries`."""
+    if capture_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(capture_queries)
+
+
+def start_profiler() -> Optional[cProfile.Profile]:
+    """A running cProfile profiler, or None if another one is already active."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _self_time_ms(stats: dict, path_part: str) -> float:
+    # Own time only (tt), so nested calls are not counted twice
+    total = sum(
+        tt
+        for (filename, _, _), (_, _, tt, _, _) in stats.items()
+        if path_part in filename
+    )
+    return round(total * 1000, 3)
+
+
+def _label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name  # built-in
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def call_tree(stats: dict, total_seconds: float) -> str:
+    """
+    Indented tree of the calls that took at least `CALL_TREE_MIN_SHARE` of
+    the request, each with the cumulative time spent through that edge.
+    """
+    callees: Dict[tuple, List[Tuple[float, tuple]]] = {}
+    roots = []
+    for func, (_, _, _, ct, callers) in stats.items():
+        if not callers:
+            roots.append((ct, func))
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((edge[3], func))
+    # Recursion through the middleware chain can leave the real entry point
+    # with callers of its own; the most expensive function is always a root
+    if stats:
+        top = max(stats, key=lambda func: stats[func][3])
+        if all(func != top for _, func in roots):
+            roots.append((stats[top][3], top))
+    floor = total_seconds * CALL_TREE_MIN_SHARE
+    lines: List[str] = []
+
+    def walk(func, seconds, depth, path):
+        lines.append(f"{'  ' * depth}{seconds * 1000:.1f}ms {_label(func)}")
+        if depth >= CALL_TREE_MAX_DEPTH:
+            return
+        for child_seconds, child in sorted(callees.get(func, []), reverse=True):
+            if child_seconds >= floor and child not in path:
+                walk(child, child_seconds, depth + 1, path | {child})
+
+    for seconds, root in sorted(roots, reverse=True):
+        if seconds >= floor:
+            walk(root, seconds, 0, {root})
+    return "\n".join(lines)
+
+
+def summarize(profiler: cProfile.Profile, duration_ms: float) -> dict:
+    """Profiler output for a `ProfileRecord`."""
+    stats = pstats.Stats(profiler)
+    raw = stats.stats  # type: ignore[attr-defined]
+    summary = {
+        "template_ms": _self_time_ms(raw, _TEMPLATE_PATH),
+        "pillow_ms": _self_time_ms(raw, _PILLOW_PATH),
+        "call_tree": call_tree(raw, duration_ms / 1000),
+    }
+    out = io.StringIO()
+    stats.stream = out  # type: ignore[attr-defined]
+    stats.strip_dirs().sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+    summary["top_functions"] = out.getvalue().strip()
+    return summary
+
+
+def build_record(
+    request,
+    response,
+    duration_ns: int,
+    reason: str,
+    capture: QueryCapture,
+    profiler: Optional[cProfile.Profile] = None,
+) -> ProfileRecord:
+    duration_ms = round(duration_ns / 1e6, 3)
+    extra = summarize(profiler, duration_ms) if profiler is not None else {}
+    return ProfileRecord(
+        id=uuid.uuid4().hex,
+        started_at=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        method=request.method,
+        path=request.get_full_path(),
+        status=response.status_code,
+        duration_ms=duration_ms,
+        reason=reason,
+        sql_count=capture.count,
+        sql_ms=round(capture.total_ns / 1e6, 3),
+        queries=capture.queries,
+        **extra,
+    )
+
+
+_buffer: Optional[Deque[ProfileRecord]] = None
+_buffer_lock = threading.Lock()
+
+
+def _ring() -> Deque[ProfileRecord]:
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                size = getattr(settings, "PROFILING_BUFFER_SIZE", 100)
+                _buffer = deque(maxlen=size)
+    return _buffer
+
+
+def store(record: ProfileRecord) -> None:
+    """Keep `record` in this process's ring buffer (and spill it, if enabled)."""
+    _ring().append(record)
+    directory = getattr(settings, "PROFILING_SPILL_DIR", "")
+    if directory:
+        spill(record, directory)
+
+
+def spill(record: ProfileRecord, directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    # Names sort by time, so pruning removes the oldest
+    name = f"{int(time.time() * 1000):015d}-{record.id}.json"
+    path = os.path.join(directory, name)
+    with open(f"{path}.tmp", "w") as fh:
+        json.dump(record._asdict(), fh)
+    os.replace(f"{path}.tmp", path)
+    keep = getattr(settings, "PROFILING_SPILL_MAX_FILES", 500)
+    files = sorted(glob.glob(os.path.join(directory, "*.json")))
+    for old in files[: max(len(files) - keep, 0)]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+
+
+def _load(path: str) -> Optional[ProfileRecord]:
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+        data["queries"] = [tuple(q) for q in data["queries"]]
+        return ProfileRecord(**data)
+    except (OSError, ValueError, TypeError, KeyError):
+        return None
+
+
+def recent() -> List[ProfileRecord]:
+    """Recorded requests, slowest first: every worker's if spilled, else this one's."""
+    records = {r.id: r for r in list(_ring())}
+    directory = getattr(settings, "PROFILING_SPILL_DIR", "")
+    if directory:
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            record = _load(path)
+            if record is not None:
+                records.setdefault(record.id, record)
+    return sorted(records.values(), key=lambda r: r.duration_ms, reverse=True)
+
+
+def get(record_id: str) -> Optional[ProfileRecord]:
+    for record in recent():
+        if record.id == record_id:
+            return record
+    return None
+
+
+def clear() -> None:
+    """Empty this process's ring buffer (for tests)."""
+    global _buffer
+    with _buffer_lock:
+        _buffer = None
@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import IntegrityError, router, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+Seed = Callable[[str, datetime, datetime], int]
+Window = Callable[[datetime], Tuple[datetime, datetime]]
+
+
+class RateLimitBackend:
+    """
+    Minimal counter store used by the limiters below.
+    Implementations must make `incr` atomic with respect to other callers.
+    """
+
+    def get(self, key: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def add(self, key: str, value: int, ttl: int) -> bool:
+        """Set `key` only if it does not exist yet. Returns True if it was set."""
+        raise NotImplementedError
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        """Atomically add `delta`. Returns None if the key does not exist."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LocalMemoryBackend(RateLimitBackend):
+    """
+    In-process backend. Correct for a single worker process only.
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> Optional[int]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires <= now:
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            return self._live(key, time.monotonic())
+
+    def add(self, key: str, value: int, ttl: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._live(key, now) is not None:
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        with self._lock:
+            value = self._live(key, time.monotonic())
+            if value is None:
+                return None
+            value += delta
+            self._data[key] = (value, self._data[key][1])
+            return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class CacheBackend(RateLimitBackend):
+    """
+    Shared backend on top of Django's cache framework.
+    Atomicity comes from the cache's own `add`/`incr` (Redis, Memcached, LocMem).
+    """
+
+    def __init__(self, alias: Optional[str] = None) -> None:
+        self.alias = alias or getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key: str) -> Optional[int]:
+        return self.cache.get(key)
+
+    def add(self, key: str, value: int, ttl: int) -> bool:
+        return self.cache.add(key, value, ttl)
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        try:
+            return self.cache.incr(key, delta)
+        except ValueError:
+            # Key expired (or was evicted) between add() and incr()
+            return None
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class DatabaseBackend(RateLimitBackend):
+    """
+    Shared backend on a table of the primary database (`RateLimitCounter`),
+    for deployments without Redis or Memcached. A reservation costs an UPDATE
+    and a SELECT in one short transaction.
+    """
+
+    def __init__(self, alias: Optional[str] = None) -> None:
+        self.alias = alias
+
+    @property
+    def counters(self):
+        from .models import RateLimitCounter
+
+        # Never a replica: a lagging copy would hand out spent quota
+        return RateLimitCounter.objects.using(
+            self.alias or router.db_for_write(RateLimitCounter)
+        )
+
+    def get(self, key: str) -> Optional[int]:
+        return (
+            self.counters.filter(key=key, expires_at__gt=timezone.now())
+            .values_list("value", flat=True)
+            .first()
+        )
+
+    def add(self, key: str, value: int, ttl: int) -> bool:
+        now = timezone.now()
+        counters = self.counters
+        # Counters of past windows, this key's included if it has expired
+        counters.filter(expires_at__lte=now).delete()
+        try:
+            with transaction.atomic(using=counters.db):
+                counters.create(
+                    key=key, value=value, expires_at=now + timedelta(seconds=ttl)
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def incr(self, key: str, delta: int = 1) -> Optional[int]:
+        counters = self.counters.filter(key=key)
+        with transaction.atomic(using=counters.db):
+            # The UPDATE holds the row until commit, so the value read back
+            # is this increment's and no one else's
+            if not counters.filter(expires_at__gt=timezone.now()).update(
+                value=F("value") + delta
+            ):
+                return None
+            return counters.values_list("value", flat=True).get()
+
+    def clear(self) -> None:
+        self.counters.all().delete()
+
+
+_backend: Optional[RateLimitBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> RateLimitBackend:
+    """Return the process-wide backend configured by `RATE_LIMIT_BACKEND`."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(
+                    settings, "RATE_LIMIT_BACKEND", "core.ratelimit.CacheBackend"
+                )
+                _backend = import_string(path)()
+    return _backend
+
+
+def is_process_local(backend: Optional[RateLimitBackend] = None) -> bool:
+    """
+    Whether `backend` (the configured one by default) keeps its counters in
+    this process's memory, so that every worker process counts on its own.
+    """
+    backend = backend or get_backend()
+    if isinstance(backend, CacheBackend):
+        return isinstance(backend.cache, LocMemCache)
+    return isinstance(backend, LocalMemoryBackend)
+
+
+class Reservation:
+    """A slot taken by `reserve()`; hand it back to `release()` if the action fails."""
+
+    __slots__ = ("key", "count")
+
+    def __init__(self, key: str, count: int) -> None:
+        self.key = key
+        self.count = count
+
+    def __repr__(self) -> str:
+        return f"Reservation({self.key!r}, {self.count})"
+
+
+class _Limiter:
+    def __init__(
+        self,
+        scope: str,
+        limit: int,
+        seed: Optional[Seed] = None,
+        backend: Optional[RateLimitBackend] = None,
+    ) -> None:
+        self.scope = scope
+        self.limit = limit
+        self.seed = seed
+        self._backend = backend
+
+    @property
+    def backend(self) -> RateLimitBackend:
+        return self._backend or get_backend()
+
+    def _key(self, identity: str, start: datetime) -> str:
+        return f"rl:{self.scope}:{identity}:{int(start.timestamp())}"
+
+    def _ensure(
+        self, key: str, identity: str, start: datetime, end: datetime, ttl: int
+    ) -> None:
+        # The seed (usually a COUNT query) runs at most once per key and window,
+        # so a cold or flushed cache does not hand out a fresh quota.
+        if self.backend.get(key) is None:
+            initial = self.seed(identity, start, end) if self.seed else 0
+            self.backend.add(key, initial, ttl)
+
+    def _incr(
+        self, key: str, identity: str, start: datetime, end: datetime, ttl: int, n: int
+    ) -> int:
+        for _ in range(3):
+            self._ensure(key, identity, start, end, ttl)
+            value = self.backend.incr(key, n)
+            if value is not None:
+                return value
+        raise RuntimeError(f"Rate limit counter {key!r} keeps disappearing")
+
+    def release(self, reservation: Optional[Reservation]) -> None:
+        """Give back a reserved slot. Safe to call with None."""
+        if reservation is not None:
+            self.backend.incr(reservation.key, -reservation.count)
+
+
+class FixedWindowLimiter(_Limiter):
+    """
+    Counts events in windows returned by `window(now)`, e.g. a calendar day.
+    """
+
+    def __init__(self, scope: str, limit: int, window: Window, **kwargs) -> None:
+        super().__init__(scope, limit, **kwargs)
+        self.window = window
+
+    def _bounds(self, now: Optional[datetime]) -> Tuple[datetime, datetime, int]:
+        start, end = self.window(now or timezone.now())
+        ttl = max(int((end - start).total_seconds()), 1)
+        return start, end, ttl
+
+    def usage(self, identity: str, now: Optional[datetime] = None) -> int:
+        start, end, ttl = self._bounds(now)
+        key = self._key(identity, start)
+        self._ensure(key, identity, start, end, ttl)
+        return self.backend.get(key) or 0
+
+    def is_exceeded(self, identity: str, now: Optional[datetime] = None) -> bool:
+        return self.usage(identity, now) >= self.limit
+
+    def reserve(
+        self, identity: str, n: int = 1, now: Optional[datetime] = None
+    ) -> Optional[Reservation]:
+        """Atomically take `n` slots, or return None (and take nothing) if that would exceed the limit."""
+        start, end, ttl = self._bounds(now)
+        key = self._key(identity, start)
+        value = self._incr(key, identity, start, end, ttl, n)
+        if value > self.limit:
+            self.backend.incr(key, -n)
+            return None
+        return Reservation(key, n)
+
+
+class SlidingWindowLimiter(_Limiter):
+    """
+    Sliding-window counter: the previous fixed bucket is weighted by how much of it
+    still overlaps the trailing `period`. O(1) memory per identity.
+    """
+
+    def __init__(self, scope: str, limit: int, period: timedelta, **kwargs) -> None:
+        super().__init__(scope, limit, **kwargs)
+        self.period = period
+
+    def _buckets(self, now: Optional[datetime]):
+        now = now or timezone.now()
+        size = self.period.total_seconds()
+        ts = now.timestamp()
+        start = datetime.fromtimestamp(ts - ts % size, tz=now.tzinfo)
+        prev = start - self.period
+        weight = 1.0 - (ts - start.timestamp()) / size
+        # Keep buckets around long enough to serve as the "previous" bucket
+        ttl = int(size * 2) + 1
+        return start, prev, weight, ttl
+
+    def _previous(self, identity: str, prev: datetime, ttl: int) -> int:
+        key = self._key(identity, prev)
+        self._ensure(key, identity, prev, prev + self.period, ttl)
+        return self.backend.get(key) or 0
+
+    def usage(self, identity: str, now: Optional[datetime] = None) -> float:
+        start, prev, weight, ttl = self._buckets(now)
+        key = self._key(identity, start)
+        self._ensure(key, identity, start, start + self.period, ttl)
+        current = self.backend.get(key) or 0
+        return current + self._previous(identity, prev, ttl) * weight
+
+    def is_exceeded(self, identity: str, now: Optional[datetime] = None) -> bool:
+        return self.usage(identity, now) >= self.limit
+
+    def reserve(
+        self, identity: str, n: int = 1, now: Optional[datetime] = None
+    ) -> Optional[Reservation]:
+        """Atomically take `n` slots, or return None (and take nothing) if that would exceed the limit."""
+        start, prev, weight, ttl = self._buckets(now)
+        key = self._key(identity, start)
+        current = self._incr(key, identity, start, start + self.period, ttl, n)
+        if current + self._previous(identity, prev, ttl) * weight > self.limit:
+            self.backend.incr(key, -n)
+            return None
+        return Reservation(key, n)
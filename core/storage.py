@@ -0,0 +1,261 @@
+"""
+File storage backends, selected with `STORAGES["default"]`.
+
+- `ShardedFileSystemStorage`: local files, fanned out by the leading
+  characters of the file name (`blobs/ab/cd/abcd....png` at depth 2), so no
+  directory grows past a few thousand entries.
+- `S3Storage`: any S3-compatible object store (AWS, MinIO, R2, ...), with the
+  same key layout. Large files go up as parallel multipart uploads and every
+  request reuses one pooled, thread-safe client per process. Needs `boto3`.
+"""
+
+from __future__ import annotations
+
+import os
+import posixpath
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, Storage
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+
+DEFAULT_SHARD_DEPTH = 2
+DEFAULT_SHARD_WIDTH = 2
+
+
+def shard_name(name: str, depth: int, width: int = DEFAULT_SHARD_WIDTH) -> str:
+    """
+    `blobs/abcdef.png` -> `blobs/ab/cd/abcdef.png` (depth 2, width 2).
+    Names that are already sharded, or too short to shard, are returned as is.
+    """
+    dirname, basename = posixpath.split(name)
+    stem = os.path.splitext(basename)[0]
+    if depth <= 0 or len(stem) < depth * width:
+        return name
+    parts = [stem[i * width : (i + 1) * width] for i in range(depth)]
+    if dirname.split("/")[-depth:] == parts:
+        return name
+    return posixpath.join(dirname, *parts, basename)
+
+
+class HashShardingMixin:
+    """Shard every name produced by `generate_filename()` (see `shard_name`)."""
+
+    def __init__(
+        self,
+        *args,
+        shard_depth: int = DEFAULT_SHARD_DEPTH,
+        shard_width: int = DEFAULT_SHARD_WIDTH,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    def generate_filename(self, filename: str) -> str:
+        filename = super().generate_filename(filename)
+        return shard_name(filename, self.shard_depth, self.shard_width)
+
+
+@deconstructible(path="core.storage.ShardedFileSystemStorage")
+class ShardedFileSystemStorage(HashShardingMixin, FileSystemStorage):
+    pass
+
+
+# One client per endpoint/credentials per process: boto3 clients are
+# thread-safe and keep a pool of open connections
+_clients: Dict[Tuple, object] = {}
+_clients_lock = threading.Lock()
+
+
+@deconstructible(path="core.storage.S3Storage")
+class S3Storage(HashShardingMixin, Storage):
+    """
+    Storage on an S3-compatible bucket.
+
+    Files larger than `multipart_threshold` are sent in `multipart_chunksize`
+    parts, `max_concurrency` at a time. `url()` returns presigned URLs unless
+    `public_url` (a CDN or public bucket URL) is set.
+    """
+
+    def __init__(
+        self,
+        bucket_name: str = "",
+        endpoint_url: Optional[str] = None,
+        region_name: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        location: str = "",
+        public_url: str = "",
+        url_expiry: int = 3600,
+        multipart_threshold: int = 8 * 1024 * 1024,
+        multipart_chunksize: int = 8 * 1024 * 1024,
+        max_concurrency: int = 8,
+        max_pool_connections: int = 32,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        if not bucket_name:
+            raise ImproperlyConfigured("S3Storage needs a bucket_name.")
+        self.bucket_name = bucket_name
+        self.endpoint_url = endpoint_url or None
+        self.region_name = region_name or None
+        self.access_key = access_key or None
+        self.secret_key = secret_key or None
+        self.location = location.strip("/")
+        self.public_url = public_url.rstrip("/")
+        self.url_expiry = url_expiry
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_concurrency = max_concurrency
+        self.max_pool_connections = max_pool_connections
+
+    @property
+    def client(self):
+        key = (
+            self.endpoint_url,
+            self.region_name,
+            self.access_key,
+            self.max_pool_connections,
+        )
+        client = _clients.get(key)
+        if client is None:
+            with _clients_lock:
+                client = _clients.get(key)
+                if client is None:
+                    client = _clients[key] = self._make_client()
+        return client
+
+    def _make_client(self):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as exc:
+            raise ImproperlyConfigured("S3Storage requires boto3.") from exc
+        return boto3.session.Session().client(
+            "s3",
+            endpoint_url=self.endpoint_url,
+            region_name=self.region_name,
+            aws_access_key_id=self.access_key,
+            aws_secret_access_key=self.secret_key,
+            config=Config(
+                max_pool_connections=self.max_pool_connections,
+                retries={"max_attempts": 5, "mode": "standard"},
+            ),
+        )
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+
+        return TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+            use_threads=self.max_concurrency > 1,
+        )
+
+    def _key(self, name: str) -> str:
+        name = name.replace("\\", "/").lstrip("/")
+        return f"{self.location}/{name}" if self.location else name
+
+    def _is_missing(self, exc) -> bool:
+        error = getattr(exc, "response", {}).get("Error", {})
+        return error.get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    def _head(self, name: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=self._key(name))
+        except ClientError as exc:
+            if self._is_missing(exc):
+                return None
+            raise
+
+    def _open(self, name: str, mode: str = "rb") -> File:
+        if "w" in mode or "a" in mode:
+            raise ValueError("S3Storage files are read-only; use save().")
+        from botocore.exceptions import ClientError
+
+        # Spooled: small images stay in memory, large ones go to disk
+        fh = tempfile.SpooledTemporaryFile(max_size=self.multipart_threshold)
+        try:
+            self.client.download_fileobj(
+                self.bucket_name,
+                self._key(name),
+                fh,
+                Config=self._transfer_config(),
+            )
+        except ClientError as exc:
+            fh.close()
+            if self._is_missing(exc):
+                raise FileNotFoundError(name) from exc
+            raise
+        fh.seek(0)
+        return File(fh, name)
+
+    def _save(self, name: str, content) -> str:
+        extra = {}
+        content_type = getattr(content, "content_type", None)
+        if content_type:
+            extra["ContentType"] = content_type
+        content.seek(0)
+        # upload_fileobj() switches to a parallel multipart upload above the
+        # threshold; staged uploads are read straight from their temp file
+        source = getattr(content, "file", content)
+        self.client.upload_fileobj(
+            source,
+            self.bucket_name,
+            self._key(name),
+            ExtraArgs=extra,
+            Config=self._transfer_config(),
+        )
+        return name
+
+    def get_available_name(self, name: str, max_length: Optional[int] = None) -> str:
+        # Object stores overwrite in place; blob names are content-addressed
+        return self.generate_filename(name)
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._key(name))
+
+    def exists(self, name: str) -> bool:
+        return self._head(name) is not None
+
+    def size(self, name: str) -> int:
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head["ContentLength"]
+
+    def get_modified_time(self, name: str):
+        head = self._head(name)
+        if head is None:
+            raise FileNotFoundError(name)
+        return head["LastModified"]
+
+    def listdir(self, path: str):
+        prefix = self._key(path).rstrip("/") + "/" if path else self._key("")
+        paginator = self.client.get_paginator("list_objects_v2")
+        directories, files = [], []
+        for page in paginator.paginate(
+            Bucket=self.bucket_name, Prefix=prefix, Delimiter="/"
+        ):
+            for entry in page.get("CommonPrefixes", []):
+                directories.append(posixpath.basename(entry["Prefix"].rstrip("/")))
+            for entry in page.get("Contents", []):
+                files.append(posixpath.basename(entry["Key"]))
+        return directories, files
+
+    def url(self, name: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{filepath_to_uri(self._key(name))}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket_name, "Key": self._key(name)},
+            ExpiresIn=self.url_expiry,
+        )
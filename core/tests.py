@@ -1,3 +1,637 @@
-from django.test import TestCase
+import glob
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth.models import User
+from django.core.handlers.base import BaseHandler
+from django.http import HttpResponse
+from django.db import connections, transaction
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import db, metrics, profiling
+from core.logs import AsyncRotatingFileHandler, JsonFormatter
+from core.models import RateLimitCounter
+from core.management.commands.measure_startup import child_pids, process_memory
+from core.media import MediaFileApplication, MediaServer
+from core.middleware import (
+    FileSizeLimitMiddleware,
+    QuotaCheckMiddleware,
+    RequestLoggingMiddleware,
+    StaticFilesMiddleware,
+)
+from core.warmup import warm_up
+from core.ratelimit import (
+    CacheBackend,
+    DatabaseBackend,
+    FixedWindowLimiter,
+    LocalMemoryBackend,
+    SlidingWindowLimiter,
+    is_process_local,
+)
+
+NOW = datetime(2025, 10, 20, 12, 0, tzinfo=timezone.utc)
+
+
+def _day(now):
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+class FixedWindowLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocalMemoryBackend()
+        self.limiter = FixedWindowLimiter("t", 3, window=_day, backend=self.backend)
+
+    def test_reserve_until_limit_then_reject(self):
+        for _ in range(3):
+            self.assertIsNotNone(self.limiter.reserve("1.2.3.4", now=NOW))
+        self.assertIsNone(self.limiter.reserve("1.2.3.4", now=NOW))
+        self.assertTrue(self.limiter.is_exceeded("1.2.3.4", now=NOW))
+        # Other identities and the next day are unaffected
+        self.assertIsNotNone(self.limiter.reserve("5.6.7.8", now=NOW))
+        self.assertIsNotNone(
+            self.limiter.reserve("1.2.3.4", now=NOW + timedelta(days=1))
+        )
+
+    def test_release_gives_slot_back(self):
+        reservations = [self.limiter.reserve("ip", now=NOW) for _ in range(3)]
+        self.limiter.release(reservations[0])
+        self.assertEqual(self.limiter.usage("ip", now=NOW), 2)
+        self.assertIsNotNone(self.limiter.reserve("ip", now=NOW))
+
+    def test_seed_runs_once_for_cold_counter(self):
+        calls = []
+
+        def seed(identity, start, end):
+            calls.append(identity)
+            return 2
+
+        limiter = FixedWindowLimiter(
+            "seeded", 3, window=_day, seed=seed, backend=self.backend
+        )
+        self.assertIsNotNone(limiter.reserve("ip", now=NOW))
+        self.assertIsNone(limiter.reserve("ip", now=NOW))
+        self.assertEqual(calls, ["ip"])
+
+    def test_concurrent_reservations_never_exceed_limit(self):
+        limiter = FixedWindowLimiter("race", 10, window=_day, backend=CacheBackend())
+        limiter.backend.clear()
+        granted = []
+
+        def worker():
+            for _ in range(5):
+                if limiter.reserve("ip", now=NOW) is not None:
+                    granted.append(1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(granted), 10)
+
+
+class DatabaseBackendTests(TestCase):
+    def setUp(self):
+        self.backend = DatabaseBackend()
+
+    def test_counters_are_shared_rows(self):
+        limiter = FixedWindowLimiter("db", 2, window=_day, backend=self.backend)
+        self.assertIsNotNone(limiter.reserve("ip", now=NOW))
+        # Another worker's backend sees the same counter
+        other = FixedWindowLimiter("db", 2, window=_day, backend=DatabaseBackend())
+        reservation = other.reserve("ip", now=NOW)
+        self.assertIsNotNone(reservation)
+        self.assertIsNone(limiter.reserve("ip", now=NOW))
+        other.release(reservation)
+        self.assertEqual(limiter.usage("ip", now=NOW), 1)
+
+    def test_add_and_incr_respect_expiry(self):
+        self.assertTrue(self.backend.add("k", 1, 60))
+        self.assertFalse(self.backend.add("k", 5, 60))
+        self.assertEqual(self.backend.incr("k", 2), 3)
+        self.assertIsNone(self.backend.incr("missing"))
+
+        RateLimitCounter.objects.update(
+            expires_at=datetime.now(timezone.utc) - timedelta(seconds=1)
+        )
+        self.assertIsNone(self.backend.get("k"))
+        self.assertIsNone(self.backend.incr("k"))
+        # An expired counter is replaced, and old ones are purged
+        RateLimitCounter.objects.create(
+            key="old", value=1, expires_at=datetime.now(timezone.utc)
+        )
+        self.assertTrue(self.backend.add("k", 0, 60))
+        self.assertEqual(self.backend.get("k"), 0)
+        self.assertEqual(
+            list(RateLimitCounter.objects.values_list("key", flat=True)), ["k"]
+        )
+
+    def test_only_in_memory_counters_are_process_local(self):
+        self.assertFalse(is_process_local(self.backend))
+        self.assertTrue(is_process_local(LocalMemoryBackend()))
+        # The test settings' cache is local memory
+        self.assertTrue(is_process_local(CacheBackend()))
+        with override_settings(
+            CACHES={
+                "default": {
+                    "BACKEND": "django.core.cache.backends.redis.RedisCache",
+                    "LOCATION": "redis://localhost:6379/0",
+                }
+            }
+        ):
+            self.assertFalse(is_process_local(CacheBackend()))
+
+
+class SlidingWindowLimiterTests(SimpleTestCase):
+    def test_previous_bucket_is_weighted_by_overlap(self):
+        limiter = SlidingWindowLimiter(
+            "s", 4, period=timedelta(hours=1), backend=LocalMemoryBackend()
+        )
+        start = NOW.replace(minute=0)
+        for _ in range(4):
+            self.assertIsNotNone(
+                limiter.reserve("ip", now=start + timedelta(minutes=50))
+            )
+        # 15 minutes into the next bucket, 75% of the previous 4 still count
+        later = start + timedelta(minutes=75)
+        self.assertIsNotNone(limiter.reserve("ip", now=later))
+        self.assertIsNone(limiter.reserve("ip", now=later))
+        # Halfway through, only 2 of the previous bucket remain
+        self.assertAlmostEqual(
+            limiter.usage("ip", now=start + timedelta(minutes=90)), 3.0
+        )
+
+
+class MediaFileApplicationTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.digest = "ab" * 32
+        os.makedirs(os.path.join(self.root, "blobs", "ab"))
+        os.makedirs(os.path.join(self.root, ".staging"))
+        self.name = f"blobs/ab/{self.digest}.png"
+        for name in (self.name, "plain.txt", ".staging/x.upload"):
+            with open(os.path.join(self.root, name), "wb") as fh:
+                fh.write(b"0123456789")
+        self.inner_calls = []
+        self.app = self._app()
+
+    def _app(self, **kwargs):
+        def inner(environ, start_response):
+            self.inner_calls.append(environ["PATH_INFO"])
+            start_response("200 OK", [])
+            return [b"django"]
+
+        server = MediaServer("/media/", self.root, **kwargs)
+        return MediaFileApplication(inner, server)
+
+    def _get(self, path, app=None, **headers):
+        environ = {"REQUEST_METHOD": "GET", "PATH_INFO": path}
+        environ.update({f"HTTP_{k.upper()}": v for k, v in headers.items()})
+        result = {}
+
+        def start_response(status, response_headers):
+            result["status"] = int(status.split()[0])
+            result["headers"] = dict(response_headers)
+
+        body = (app or self.app)(environ, start_response)
+        result["body"] = b"".join(body)
+        getattr(body, "close", lambda: None)()
+        return result
+
+    def test_content_addressed_file_is_immutable(self):
+        response = self._get(f"/media/{self.name}")
+        self.assertEqual(response["status"], 200)
+        self.assertEqual(response["body"], b"0123456789")
+        self.assertEqual(response["headers"]["ETag"], f'"{self.digest}"')
+        self.assertIn("immutable", response["headers"]["Cache-Control"])
+        self.assertEqual(response["headers"]["Content-Type"], "image/png")
+        self.assertEqual(self.inner_calls, [])
+
+    def test_if_none_match_returns_304(self):
+        etag = self._get("/media/plain.txt")["headers"]["ETag"]
+        response = self._get("/media/plain.txt", if_none_match=etag)
+        self.assertEqual(response["status"], 304)
+        self.assertEqual(response["body"], b"")
+
+    def test_range_requests(self):
+        response = self._get(f"/media/{self.name}", range="bytes=2-4")
+        self.assertEqual(response["status"], 206)
+        self.assertEqual(response["body"], b"234")
+        self.assertEqual(response["headers"]["Content-Range"], "bytes 2-4/10")
+
+        response = self._get(f"/media/{self.name}", range="bytes=-3")
+        self.assertEqual(response["body"], b"789")
+
+        response = self._get(f"/media/{self.name}", range="bytes=20-")
+        self.assertEqual(response["status"], 416)
+
+        # A stale If-Range gets the whole file
+        response = self._get(
+            f"/media/{self.name}", range="bytes=2-4", if_range='"stale"'
+        )
+        self.assertEqual(response["status"], 200)
+
+    def test_hidden_and_missing_files_are_404(self):
+        self.assertEqual(self._get("/media/.staging/x.upload")["status"], 404)
+        self.assertEqual(self._get("/media/../secret")["status"], 404)
+        self.assertEqual(self._get("/media/nope.png")["status"], 404)
+
+    def test_other_paths_reach_django(self):
+        self.assertEqual(self._get("/images/")["body"], b"django")
+        self.assertEqual(self.inner_calls, ["/images/"])
+
+    def test_x_accel_redirect_mode(self):
+        app = self._app(offload_header="X-Accel-Redirect", accel_prefix="/internal/")
+        response = self._get(f"/media/{self.name}", app=app)
+        self.assertEqual(
+            response["headers"]["X-Accel-Redirect"], f"/internal/{self.name}"
+        )
+        self.assertEqual(response["body"], b"")
+
+
+class AsyncMiddlewareTests(SimpleTestCase):
+    def test_custom_middleware_stays_async_under_asgi(self):
+        async def view(request):
+            return HttpResponse("ok")
+
+        for middleware in (
+            QuotaCheckMiddleware,
+            FileSizeLimitMiddleware,
+            StaticFilesMiddleware,
+            RequestLoggingMiddleware,
+        ):
+            self.assertTrue(iscoroutinefunction(middleware(view)), middleware)
+            self.assertFalse(iscoroutinefunction(middleware(lambda r: None)))
+
+    def test_asgi_handler_chain_is_async_end_to_end(self):
+        # Django logs (with DEBUG on) every sync/async adaptation in the chain
+        with override_settings(DEBUG=True), self.assertLogs(
+            "django.request", "DEBUG"
+        ) as logs:
+            logging.getLogger("django.request").debug("loading middleware")
+            BaseHandler().load_middleware(is_async=True)
+        self.assertEqual([m for m in logs.output if "adapted" in m], [])
+
+    def test_oversized_body_rejected_on_async_path(self):
+        async def view(request):
+            return HttpResponse("ok")
+
+        request = RequestFactory().post("/", CONTENT_LENGTH=str(50 * 1024 * 1024))
+        response = async_to_sync(FileSizeLimitMiddleware(view))(request)
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(MAX_UPLOAD_SIZE=1024, MAX_BATCH_UPLOAD_FILES=4)
+    def test_batch_uploads_get_a_limit_per_file(self):
+        middleware = FileSizeLimitMiddleware(lambda request: HttpResponse("ok"))
+        factory = RequestFactory()
+        with mock.patch("core.middleware.reverse") as reverse_url:
+            batch = factory.post(reverse("image_batch_upload"), CONTENT_LENGTH="3000")
+            self.assertEqual(middleware(batch).status_code, 200)
+            single = factory.post(reverse("image_upload"), CONTENT_LENGTH="3000")
+            self.assertEqual(middleware(single).status_code, 413)
+        reverse_url.assert_not_called()
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.path = os.path.join(self.tmp, "app.log")
+
+    def _record(self, msg, *args, **extra):
+        record = logging.makeLogRecord(
+            {"name": "t", "levelno": logging.INFO, "levelname": "INFO", "msg": msg}
+        )
+        record.args = args
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_formatter_includes_extra_fields(self):
+        entry = json.loads(
+            JsonFormatter().format(self._record("%s done", "upload", status=201))
+        )
+        self.assertEqual(entry["message"], "upload done")
+        self.assertEqual(entry["status"], 201)
+        self.assertEqual(entry["level"], "INFO")
+
+    def test_records_are_written_by_the_listener_thread(self):
+        handler = AsyncRotatingFileHandler(self.path, maxBytes=300, backupCount=2)
+        handler.setFormatter(JsonFormatter())
+        self.addCleanup(handler.close)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            failed = self._record("failed")
+            failed.exc_info = sys.exc_info()
+        handler.handle(failed)
+        for i in range(10):
+            handler.handle(self._record("line %d", i, route="image/"))
+        handler.flush_and_stop()
+
+        with open(self.path) as fh:
+            last = [json.loads(line) for line in fh][-1]
+        self.assertEqual(last["message"], "line 9")
+        self.assertEqual(last["route"], "image/")
+        # Rotated at maxBytes, keeping backupCount old files
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertFalse(os.path.exists(self.path + ".3"))
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = AsyncRotatingFileHandler(self.path, queue_size=1)
+        self.addCleanup(handler.close)
+        handler._start()
+        handler._listener.stop()  # nothing drains the queue now
+        handler._listener = None
+        for i in range(3):
+            handler.handle(self._record("line %d", i))
+        self.assertEqual(handler.dropped, 2)
+
+
+class MetricsTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_histogram_and_quantiles(self):
+        for ms in [3] * 90 + [400] * 10:
+            metrics.record_request("image/", "GET", 200, ms * 1_000_000)
+        histogram = metrics.snapshot()["histograms"]["image/"]
+        self.assertAlmostEqual(metrics.estimate_quantile(histogram, 0.5), 0.0039, 4)
+        self.assertGreater(metrics.estimate_quantile(histogram, 0.99), 0.25)
+
+        text = metrics.render(metrics.collect())
+        self.assertIn(
+            'http_requests_total{method="GET",route="image/",status="200"} 100', text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="image/",le="0.005"} 90', text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_bucket{route="image/",le="+Inf"} 100', text
+        )
+        self.assertIn('http_request_duration_estimate_seconds{route="image/"', text)
+
+    def test_threads_record_without_losing_counts(self):
+        def worker():
+            for _ in range(1000):
+                metrics.inc("upload_bytes_total", 2)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        counters = {c[0]: c[2] for c in metrics.snapshot()["counters"]}
+        self.assertEqual(counters["upload_bytes_total"], 16000)
+
+    def test_collect_merges_other_workers(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        metrics.inc("quota_rejections_total")
+        metrics.record_request("images/", "GET", 200, 2_000_000)
+        with override_settings(METRICS_DIR=directory):
+            metrics.flush()
+            # Written by another worker
+            [own] = glob.glob(os.path.join(directory, "*.json"))
+            other = os.path.join(directory, f"{os.getpid() + 1}-abc.json")
+            shutil.copy(own, other)
+            os.remove(own)
+            totals = metrics.collect()
+        counters = {c[0]: c[2] for c in totals["counters"]}
+        self.assertEqual(counters["quota_rejections_total"], 2)
+        self.assertEqual(sum(totals["histograms"]["images/"][:-1]), 2)
+
+    def test_exited_workers_are_folded_into_retired_totals(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        metrics.inc("quota_rejections_total")
+        with override_settings(METRICS_DIR=directory):
+            metrics.flush()
+            [own] = glob.glob(os.path.join(directory, "*.json"))
+            # Two earlier workers that had the same pid, and one killed long ago
+            for name in ("101-aaa.json", "101-bbb.json", "102-ccc.json"):
+                shutil.copy(own, os.path.join(directory, name))
+            long_ago = time.time() - 3600
+            os.utime(os.path.join(directory, "102-ccc.json"), (long_ago, long_ago))
+
+            metrics.retire(101)
+            self.assertFalse(glob.glob(os.path.join(directory, "101-*.json")))
+            totals = metrics.collect()
+            self.assertFalse(os.path.exists(os.path.join(directory, "102-ccc.json")))
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                [".lock", os.path.basename(own), metrics.RETIRED_FILE],
+            )
+            # Folding moves totals, it never loses or repeats them
+            self.assertEqual(metrics.collect(), totals)
+        counters = {c[0]: c[2] for c in totals["counters"]}
+        self.assertEqual(counters["quota_rejections_total"], 4)
+
+
+class MetricsEndpointTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_requests_and_queries_are_counted_per_route(self):
+        self.client.get("/users/login/")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn(
+            'http_requests_total{method="GET",route="users/login/",status="200"} 1',
+            body,
+        )
+        self.assertIn("db_queries_total", body)
+
+    def test_only_allowed_addresses_or_staff(self):
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.9")
+        self.assertEqual(response.status_code, 403)
+        staff = User.objects.create_user("ops", password="pw", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.9")
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=1.0, PROFILING_SLOW_MS=60_000
+)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        profiling.clear()
+        self.addCleanup(profiling.clear)
+        self.user = User.objects.create_superuser("admin", password="pw")
+
+    def test_sampled_request_has_call_tree_and_timings(self):
+        self.client.get("/users/login/")
+        [record] = profiling.recent()
+        self.assertEqual(record.reason, "sampled")
+        self.assertEqual(record.path, "/users/login/")
+        self.assertIsNotNone(record.template_ms)
+        self.assertIn("ms ", record.call_tree)
+        self.assertIn("cumulative", record.top_functions)
+
+    @override_settings(PROFILING_SAMPLE_RATE=0, PROFILING_SLOW_MS=0)
+    def test_slow_request_records_queries_without_profiling(self):
+        self.client.force_login(self.user)
+        self.client.get("/images/")
+        [record] = profiling.recent()
+        self.assertEqual(record.reason, "slow")
+        self.assertEqual(record.call_tree, "")
+        self.assertGreater(record.sql_count, 0)
+        self.assertTrue(any("images_imageasset" in sql for sql, _ in record.queries))
+
+    async def test_async_requests_are_not_sampled(self):
+        await self.async_client.get("/users/login/")
+        self.assertEqual(profiling.recent(), [])
+
+    @override_settings(PROFILING_SLOW_MS=0)
+    async def test_slow_async_requests_are_recorded_without_profiling(self):
+        await self.async_client.get("/users/login/")
+        [record] = profiling.recent()
+        self.assertEqual(record.reason, "slow")
+        self.assertEqual(record.call_tree, "")
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.client.get("/users/login/")
+        self.assertEqual(profiling.recent(), [])
+
+    def test_records_spill_to_a_bounded_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(
+            PROFILING_SPILL_DIR=directory, PROFILING_SPILL_MAX_FILES=2
+        ):
+            for _ in range(3):
+                self.client.get("/users/login/")
+            self.assertEqual(len(os.listdir(directory)), 2)
+            profiling.clear()
+            self.assertEqual(len(profiling.recent()), 2)
+
+    def test_admin_lists_and_shows_records(self):
+        self.client.get("/users/login/")
+        [record] = profiling.recent()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("admin:core_requestprofile_changelist"))
+        self.assertContains(response, "/users/login/")
+        response = self.client.get(
+            reverse("admin:core_requestprofile_detail", args=[record.id])
+        )
+        self.assertContains(response, "Call tree")
+        response = self.client.get(
+            reverse("admin:core_requestprofile_detail", args=["missing"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class ReplicaRoutingTests(TransactionTestCase):
+    """The replica is a second connection to the test database."""
+
+    def setUp(self):
+        self._add_replica(connections["default"].settings_dict["NAME"])
+        db._down_until.clear()
+        self.addCleanup(db._down_until.clear)
+        self.router = db.ReplicaRouter()
+
+    def _add_replica(self, name):
+        connections.settings["replica1"] = {
+            **connections["default"].settings_dict,
+            "NAME": name,
+        }
+        self.addCleanup(connections.settings.pop, "replica1", None)
+        self.addCleanup(self._drop_replica)
+
+    def _drop_replica(self):
+        if hasattr(connections._connections, "replica1"):
+            connections["replica1"].close()
+            del connections["replica1"]
+
+    def test_reads_use_the_replica_only_inside_unpinned_requests(self):
+        self.assertEqual(self.router.db_for_read(User), "default")
+        with db.request_routing(pinned=False):
+            self.assertEqual(self.router.db_for_read(User), "replica1")
+            with transaction.atomic():
+                self.assertEqual(self.router.db_for_read(User), "default")
+            self.assertEqual(self.router.db_for_write(User), "default")
+            # Read your own writes
+            self.assertEqual(self.router.db_for_read(User), "default")
+        with db.request_routing(pinned=True):
+            self.assertEqual(self.router.db_for_read(User), "default")
+        self.assertFalse(self.router.allow_migrate("replica1", "images"))
+
+    def test_unreachable_replica_fails_over_to_the_primary(self):
+        self._drop_replica()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self._add_replica(os.path.join(directory, "missing", "db.sqlite3"))
+        with db.request_routing(pinned=False):
+            with self.assertLogs("core.db", "WARNING"):
+                self.assertEqual(self.router.db_for_read(User), "default")
+            # Not retried until DATABASE_REPLICA_RETRY_SECONDS have passed
+            with mock.patch.object(
+                connections["replica1"], "ensure_connection"
+            ) as ensure:
+                self.assertEqual(self.router.db_for_read(User), "default")
+            ensure.assert_not_called()
+
+    def test_writes_pin_the_client_to_the_primary(self):
+        User.objects.create_user("amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+        replica = connections["replica1"]
+
+        with CaptureQueriesContext(replica) as queries:
+            response = self.client.get("/images/")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(len(queries), 0)
+        self.assertNotIn(db.PIN_COOKIE, response.cookies)
+
+        self.client.logout()
+        response = self.client.post(
+            "/users/login/", {"username": "amir", "password": "amir123"}
+        )
+        self.assertEqual(response.cookies[db.PIN_COOKIE]["max-age"], 5)
+        with CaptureQueriesContext(replica) as queries:
+            self.client.get("/images/")
+        self.assertEqual(len(queries), 0)
+
+
+class WarmUpTests(TestCase):
+    def test_compiles_templates_into_the_cached_loader(self):
+        [loader] = engines["django"].engine.template_loaders
+        loader.reset()
+        summary = warm_up()
+        self.assertGreater(summary["templates"], 0)
+        self.assertGreater(summary["pillow_formats"], 0)
+        self.assertEqual(summary["databases"], 1)
+        self.assertIn("similarity_index", summary)
+        self.assertIn("images/list.html", loader.get_template_cache)
+
+    @skipUnless(os.path.exists("/proc/self/smaps_rollup"), "needs Linux /proc")
+    def test_process_memory(self):
+        memory = process_memory(os.getpid())
+        self.assertGreater(memory["rss"], memory["uss"])
+        self.assertGreater(memory["pss"], 0)
+        self.assertIn(os.getpid(), child_pids(os.getppid()))
@@ -1,3 +1,43 @@
-from django.shortcuts import render
+from __future__ import annotations
 
-# Create your views here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpRequest, HttpResponse
+from django.views.decorators.http import require_GET
+
+from core import metrics
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    LoginRequiredMixin that also works for views with `async def` handlers.
+    The session and user are loaded with a single `sync_to_async` call, after
+    which `request.user` is safe to read from the event loop.
+    """
+
+    def dispatch(self, request: HttpRequest, *args, **kwargs):
+        if not self.view_is_async:
+            return super().dispatch(request, *args, **kwargs)
+        return self._adispatch(request, *args, **kwargs)
+
+    async def _adispatch(self, request: HttpRequest, *args, **kwargs) -> HttpResponse:
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+@require_GET
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Prometheus scrape endpoint. Open to `METRICS_ALLOWED_IPS` (matched against
+    the socket address, not X-Forwarded-For) and to staff users.
+    """
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", ["127.0.0.1"])
+    if request.META.get("REMOTE_ADDR") not in allowed and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(metrics.collect()), content_type=metrics.CONTENT_TYPE
+    )
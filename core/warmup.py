@@ -0,0 +1,115 @@
+"""
+Work a process does once before serving requests (see gunicorn.conf.py):
+import Pillow's codecs, compile every template into the cached loader, build
+the URL resolver, connect to each database and load the image similarity
+index. With `preload_app` this runs
+in the gunicorn master, and the forked workers share the result.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from typing import Dict, Iterator
+
+from django.db import DatabaseError, connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.template.backends.django import DjangoTemplates
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_SUFFIXES = (".html", ".txt")
+
+
+def load_pillow_plugins() -> int:
+    """Import every Pillow format plugin now rather than on the first upload."""
+    from PIL import Image
+
+    Image.init()
+    return len(Image.OPEN)
+
+
+def _template_dirs(engine: DjangoTemplates) -> Iterator[str]:
+    for loader in engine.engine.template_loaders:
+        # The cached loader wraps the ones that know the directories
+        for inner in getattr(loader, "loaders", [loader]):
+            if hasattr(inner, "get_dirs"):
+                yield from (str(directory) for directory in inner.get_dirs())
+
+
+def compile_templates() -> int:
+    """
+    Compile every template found in the engines' directories; Django's
+    cached loader keeps them. Returns how many compiled.
+    """
+    count = 0
+    for engine in engines.all():
+        if not isinstance(engine, DjangoTemplates):
+            continue
+        for directory in _template_dirs(engine):
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith(TEMPLATE_SUFFIXES):
+                        continue
+                    path = os.path.join(root, filename)
+                    name = os.path.relpath(path, directory).replace(os.sep, "/")
+                    try:
+                        engine.get_template(name)
+                    except (TemplateDoesNotExist, TemplateSyntaxError):
+                        # Fragments of other apps that only compile in context
+                        continue
+                    count += 1
+    return count
+
+
+def connect_databases() -> int:
+    """
+    Connect to each database once, which loads the driver and the server's
+    version and features, then close the connection again: a socket must
+    not be shared by processes forked from this one. Connections already
+    open are left alone.
+    """
+    count = 0
+    for connection in connections.all():
+        if connection.connection is not None:
+            count += 1
+            continue
+        try:
+            connection.ensure_connection()
+        except DatabaseError:
+            logger.warning("Could not connect to %s", connection.alias, exc_info=True)
+            continue
+        connection.close()
+        count += 1
+    return count
+
+
+def load_similarity_index() -> int:
+    """
+    Load every image's perceptual hash (see images.similarity), so forked
+    workers start with the index rather than each reading the whole table.
+    """
+    from images.similarity import get_index
+
+    closed = [c for c in connections.all() if c.connection is None]
+    count = len(get_index())
+    # Like connect_databases(): forked processes must not share a socket
+    for connection in closed:
+        if connection.connection is not None:
+            connection.close()
+    return count
+
+
+def warm_up() -> Dict[str, float]:
+    start = time.perf_counter()
+    summary: Dict[str, float] = {
+        "pillow_formats": load_pillow_plugins(),
+        "templates": compile_templates(),
+        "url_patterns": len(get_resolver().reverse_dict),
+        "databases": connect_databases(),
+        "similarity_index": load_similarity_index(),
+    }
+    summary["seconds"] = round(time.perf_counter() - start, 3)
+    return summary
@@ -0,0 +1,113 @@
+"""
+Gunicorn runtime profile: `gunicorn -c gunicorn.conf.py config.wsgi:application`.
+
+Threaded workers, so a slow upload holds one thread rather than a whole
+process, sized from the CPUs the container may use. The app is loaded and
+warmed up once in the master (core.warmup) before the workers are forked, so
+they share those pages copy-on-write. Workers are recycled after
+`max_requests` (with jitter, so they do not all restart at once).
+
+Run `manage.py migrate` as a separate one-shot step before starting this.
+Every setting can be changed through its GUNICORN_* variable; see
+`manage.py measure_startup` to measure the effect.
+"""
+
+import gc
+import math
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _available_cpus():
+    # The cgroup v2 quota of a container, else the CPUs this process may run on
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as fh:
+            quota, period = fh.read().split()
+        if quota != "max":
+            return max(math.ceil(int(quota) / int(period)), 1)
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cpus = _available_cpus()
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+# A process per CPU for image decoding, threads for waiting on clients and I/O
+workers = _env_int("GUNICORN_WORKERS", max(cpus, 2))
+threads = _env_int("GUNICORN_THREADS", 4)
+
+# Only a stuck worker misses its heartbeat; threads keep it alive during
+# slow requests
+timeout = _env_int("GUNICORN_TIMEOUT", 60)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 30)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in ("0", "false")
+
+# The heartbeat file on tmpfs, not on the container's overlay filesystem
+worker_tmp_dir = os.environ.get("GUNICORN_WORKER_TMP_DIR", "/dev/shm")
+if not os.path.isdir(worker_tmp_dir):
+    worker_tmp_dir = None
+
+# Requests are logged by the app (core.middleware.RequestLoggingMiddleware)
+accesslog = None
+errorlog = "-"
+
+
+def _warm_up(log):
+    from core.warmup import warm_up
+
+    log.info("Warmed up: %s", warm_up())
+
+
+def _check_rate_limit(cfg):
+    # Per-process quota counters would let each worker hand out the whole quota
+    from core import ratelimit
+
+    if cfg.workers > 1 and ratelimit.is_process_local():
+        raise RuntimeError(
+            f"RATE_LIMIT_BACKEND counts per process, so each of the {cfg.workers} "
+            "workers would allow the full upload quota; use "
+            "core.ratelimit.DatabaseBackend or a Redis/Memcached CACHE_URL"
+        )
+
+
+def when_ready(server):
+    # Runs in the master, after the preloaded app is imported and before any
+    # worker is forked
+    if server.cfg.preload_app:
+        _check_rate_limit(server.cfg)
+        _warm_up(server.log)
+        # Keep the collector in the workers from touching (and so copying)
+        # the objects they inherited
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    if not worker.cfg.preload_app:
+        # Failing here stops gunicorn, like an import error would
+        _check_rate_limit(worker.cfg)
+        _warm_up(worker.log)
+
+
+def child_exit(server, worker):
+    # Runs in the master once a worker has exited (after its last metrics
+    # flush): fold its totals into the retired ones (see core.metrics). The
+    # directory comes from the environment, as the master may not have loaded
+    # the settings
+    directory = os.environ.get("METRICS_DIR", "")
+    if directory:
+        from core import metrics
+
+        metrics.retire(worker.pid, directory)
@@ -1,11 +1,149 @@
-from django.contrib import admin
+from __future__ import annotations
 
-from .models import ImageAsset
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.template.response import TemplateResponse
+
+from core.admin import LargeTableAdmin
+from core.pagination import estimated_count
+
+from .cleanup import schedule_asset_deletion
+from .lookups import asset_search_lookup
+from .models import ImageAsset, ImageBlob, IpDailyUsage, UploadSession, UserDailyUsage
 
 
 @admin.register(ImageAsset)
-class ImageAssetAdmin(admin.ModelAdmin):
-    list_display = ("public_id", "uploader_ip", "created_at")
-    readonly_fields = ("public_id", "created_at", "updated_at")
-    search_fields = ("public_id", "uploader_ip")
-    list_filter = ("created_at",)
+class ImageAssetAdmin(LargeTableAdmin):
+    list_display = (
+        "public_id",
+        "uploader_ip",
+        "format",
+        "width",
+        "height",
+        "byte_size",
+        "created_at",
+    )
+    readonly_fields = (
+        "public_id",
+        "width",
+        "height",
+        "format",
+        "byte_size",
+        "content_hash",
+        "perceptual_hash",
+        # Changing these here would bypass the blobs' reference counts
+        "blob",
+        "original_blob",
+        "created_at",
+        "updated_at",
+    )
+    raw_id_fields = ("user",)
+    # Only shows the search box; see get_search_results
+    search_fields = ("public_id", "uploader_ip", "content_hash")
+    search_help_text = (
+        "Exact public id, uploader IP or id, or a content hash (at least 6 "
+        "leading characters)."
+    )
+    list_filter = ("format", "created_at")
+    actions = ["delete_in_background"]
+
+    def has_add_permission(self, request):
+        # Images come in through the upload paths, which count blob references
+        return False
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        # Substring matches (icontains) would scan the whole table
+        lookup = asset_search_lookup(search_term)
+        if lookup is None:
+            return queryset.none(), False
+        return queryset.filter(lookup), False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Collects every related object for a confirmation page, then deletes
+        # row by row; delete_in_background replaces it
+        actions.pop("delete_selected", None)
+        return actions
+
+    @admin.action(
+        description="Delete selected images in the background",
+        permissions=["delete"],
+    )
+    def delete_in_background(self, request, queryset):
+        if request.POST.get("post") != "yes":
+            count, exact = estimated_count(queryset)
+            context = {
+                **self.admin_site.each_context(request),
+                "title": "Are you sure?",
+                "opts": self.opts,
+                "count": count if exact else f"more than {count}",
+                "selected": request.POST.getlist(helpers.ACTION_CHECKBOX_NAME),
+                "select_across": request.POST.get("select_across", "0"),
+                "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+            }
+            return TemplateResponse(
+                request,
+                "admin/images/imageasset/delete_in_background_confirmation.html",
+                context,
+            )
+        if request.POST.get("select_across") == "1":
+            # Everything the changelist matches, found again by the worker
+            changelist = self.get_changelist_instance(request)
+            job = schedule_asset_deletion(
+                filters=changelist.get_filters_params(), search=changelist.query
+            )
+        else:
+            job = schedule_asset_deletion(
+                pks=list(queryset.values_list("pk", flat=True))
+            )
+        if job is None:
+            self.message_user(request, "No images to delete.", messages.WARNING)
+        else:
+            self.message_user(
+                request,
+                f"The images are being deleted in the background (job {job.pk}).",
+                messages.SUCCESS,
+            )
+        return None
+
+
+@admin.register(ImageBlob)
+class ImageBlobAdmin(admin.ModelAdmin):
+    list_display = ("content_hash", "size", "ref_count", "created_at")
+    readonly_fields = ("content_hash", "file", "size", "ref_count", "created_at")
+    search_fields = ("=content_hash",)
+
+
+@admin.register(UploadSession)
+class UploadSessionAdmin(admin.ModelAdmin):
+    list_display = ("public_id", "user", "offset", "length", "expires_at")
+    raw_id_fields = ("user",)
+
+
+class DailyUsageAdmin(admin.ModelAdmin):
+    """Read-only: the rows are kept by images.usage and `manage.py reconcile_usage`."""
+
+    readonly_fields = ("day", "image_count", "byte_count", "last_upload_at")
+    list_filter = ("day",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(UserDailyUsage)
+class UserDailyUsageAdmin(DailyUsageAdmin):
+    list_display = ("user", "day", "image_count", "byte_count", "last_upload_at")
+    list_select_related = ("user",)
+    raw_id_fields = ("user",)
+    search_fields = ("=user__username",)
+
+
+@admin.register(IpDailyUsage)
+class IpDailyUsageAdmin(DailyUsageAdmin):
+    list_display = ("uploader_ip", "day", "image_count", "byte_count", "last_upload_at")
+    search_fields = ("=uploader_ip",)
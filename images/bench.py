@@ -0,0 +1,412 @@
+"""
+Benchmark harness behind `manage.py bench`.
+
+`seed()` fills the database with bench users, skewed towards a few heavy
+uploaders and busy IP addresses, and with `ImageAsset` rows that share a
+handful of real sample files. Each scenario is a callable that performs one
+operation (mostly a request through the test client, so the whole middleware
+stack is included). `measure()` times it with `perf_counter_ns` and counts the
+SQL behind each call. Results are plain dicts, written as JSON and compared
+against a saved baseline with `compare()`.
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import itertools
+import math
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from core.pagination import encode_cursor
+from core.profiling import QueryCapture, current_capture
+
+from . import usage
+from .models import ImageAsset, ImageBlob
+from .services import (
+    acquire_blob,
+    is_upload_quota_exceeded,
+    release_upload_slot,
+    reserve_upload_slot,
+)
+from .views import ImageListView
+
+BENCH_USER_PREFIX = "bench-"
+# Reserved for benchmarking (RFC 2544), so bench rows never look like real clients
+BENCH_NETWORK = ipaddress.ip_network("198.18.0.0/15")
+# (width, height, format) of the generated sample images
+SAMPLE_SIZES = (
+    (320, 240, "PNG"),
+    (1024, 768, "PNG"),
+    (1280, 720, "JPEG"),
+    (2560, 1440, "JPEG"),
+)
+PERCENTILES = (50, 95, 99)
+
+
+class BenchError(RuntimeError):
+    """A scenario operation did not do what it measures."""
+
+
+def sample_image(
+    width: int, height: int, image_format: str, rng: random.Random
+) -> bytes:
+    """An image with enough random detail to be unique and compress realistically."""
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(60):
+        x, y = rng.randrange(width), rng.randrange(height)
+        w, h = rng.randrange(1, width // 4 + 2), rng.randrange(1, height // 4 + 2)
+        fill = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.rectangle([x, y, x + w, y + h], fill=fill)
+    out = BytesIO()
+    options = {"quality": 85} if image_format == "JPEG" else {}
+    image.save(out, image_format, **options)
+    return out.getvalue()
+
+
+def _skewed(n: int, exponent: float = 1.1) -> List[float]:
+    """Cumulative Zipf weights: item 0 is the most frequent."""
+    return list(itertools.accumulate(1 / (rank**exponent) for rank in range(1, n + 1)))
+
+
+def bench_ips(count: int) -> List[str]:
+    hosts = BENCH_NETWORK.hosts()
+    return [str(next(hosts)) for _ in range(count)]
+
+
+@contextmanager
+def _explicit_timestamps(model) -> Iterator[None]:
+    # bulk_create() would otherwise stamp every row with now()
+    fields = [
+        f
+        for f in model._meta.concrete_fields
+        if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+def seed(
+    rows: int,
+    *,
+    users: int,
+    ips: int,
+    rng: random.Random,
+    days: int = 365,
+    batch_size: int = 5000,
+    progress: Optional[Callable[[int], None]] = None,
+) -> None:
+    """
+    Create `users` bench users and `rows` images spread over the last `days`
+    days. Users and IPs are Zipf-distributed, so user 0 owns the most images.
+    """
+    User = get_user_model()
+    password = make_password(None)
+    User.objects.bulk_create(
+        [
+            User(username=f"{BENCH_USER_PREFIX}{i:06d}", password=password)
+            for i in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    user_ids = list(
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX)
+        .order_by("username")
+        .values_list("pk", flat=True)
+    )
+    ip_pool = bench_ips(ips)
+
+    blobs = []
+    with transaction.atomic():
+        for width, height, image_format in SAMPLE_SIZES:
+            data = sample_image(width, height, image_format, rng)
+            name = f"sample.{image_format.lower()}"
+            blobs.append(
+                (
+                    acquire_blob(SimpleUploadedFile(name, data)),
+                    width,
+                    height,
+                    image_format,
+                )
+            )
+
+    user_weights, ip_weights = _skewed(len(user_ids)), _skewed(len(ip_pool))
+    now = timezone.now()
+    created = 0
+    with _explicit_timestamps(ImageAsset):
+        while created < rows:
+            n = min(batch_size, rows - created)
+            owners = rng.choices(user_ids, cum_weights=user_weights, k=n)
+            addresses = rng.choices(ip_pool, cum_weights=ip_weights, k=n)
+            batch = []
+            for user_id, ip in zip(owners, addresses):
+                blob, width, height, image_format = rng.choice(blobs)
+                stamp = now - timedelta(seconds=rng.uniform(0, days * 86400))
+                batch.append(
+                    ImageAsset(
+                        blob=blob,
+                        width=width,
+                        height=height,
+                        format=image_format,
+                        byte_size=blob.size,
+                        content_hash=blob.content_hash,
+                        uploader_ip=ip,
+                        user_id=user_id,
+                        created_at=stamp,
+                        updated_at=stamp,
+                    )
+                )
+            ImageAsset.objects.bulk_create(batch)
+            created += n
+            if progress is not None:
+                progress(created)
+
+    for blob, *_ in blobs:
+        ImageBlob.objects.filter(pk=blob.pk).update(
+            ref_count=ImageAsset.objects.filter(blob=blob).count()
+        )
+    # bulk_create() sends no post_save, so the usage rows are built in one go
+    span = usage.usage_days()
+    if span is not None:
+        usage.reconcile(*span)
+
+
+class BenchData(NamedTuple):
+    """What the scenarios draw their inputs from."""
+
+    users: list  # heaviest uploader first
+    ips: List[str]
+    public_ids: list
+    rng: random.Random
+
+
+def load(rng: random.Random, ips: int, sample: int = 1000) -> BenchData:
+    User = get_user_model()
+    users = list(
+        User.objects.filter(username__startswith=BENCH_USER_PREFIX).order_by("username")
+    )
+    if not users:
+        raise BenchError("No bench data; run with --rows to seed some.")
+    bounds = ImageAsset.objects.order_by("pk").values_list("pk", flat=True)
+    low, high = bounds.first(), bounds.last()
+    candidates = [rng.randint(low, high) for _ in range(sample)]
+    public_ids = list(
+        ImageAsset.objects.filter(pk__in=candidates).values_list("public_id", flat=True)
+    )
+    return BenchData(users, bench_ips(ips), public_ids, rng)
+
+
+def _client(user) -> Client:
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _expect(response, status: int):
+    if response.status_code != status:
+        raise BenchError(
+            f"Expected {status}, got {response.status_code}: {response.content[:200]!r}"
+        )
+    return response
+
+
+Operation = Callable[[int], None]
+
+
+def upload_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """`ImageUploadView.post` with unique images of every sample size."""
+    client = _client(data.users[0])
+    url = reverse("image_upload")
+    sizes = itertools.cycle(SAMPLE_SIZES)
+    # Generated up front so only the upload itself is timed
+    payloads = []
+    for _ in range(iterations):
+        width, height, image_format = next(sizes)
+        payloads.append(
+            (image_format, sample_image(width, height, image_format, data.rng))
+        )
+
+    def op(i: int) -> None:
+        image_format, content = payloads[i % len(payloads)]
+        upload = SimpleUploadedFile(f"bench.{image_format.lower()}", content)
+        _expect(
+            client.post(url, {"image": upload}, REMOTE_ADDR=data.rng.choice(data.ips)),
+            302,
+        )
+
+    return op
+
+
+def detail_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """`ImageDetailView` for random images."""
+    client = _client(data.users[-1])
+
+    def op(i: int) -> None:
+        public_id = data.public_ids[i % len(data.public_ids)]
+        _expect(client.get(reverse("image_detail", args=[public_id])), 200)
+
+    return op
+
+
+def _list_scenario(data: BenchData, depth: int, numbered: bool) -> Operation:
+    user = data.users[0]
+    client = _client(user)
+    url = reverse("image_list")
+    params = {}
+    if numbered:
+        params = {"page": depth + 1}
+    elif depth:
+        # The cursor a client holds after paging `depth` pages in
+        offset = depth * ImageListView.per_page
+        boundary = (
+            ImageAsset.objects.filter(user=user)
+            .order_by("-created_at", "-id")
+            .values_list("created_at", "id")[offset - 1 : offset]
+        )
+        if not boundary:
+            raise BenchError(f"{user} has fewer than {offset} images; lower --depth.")
+        params = {"cursor": encode_cursor(tuple(boundary[0]))}
+
+    def op(i: int) -> None:
+        _expect(client.get(url, params), 200)
+
+    return op
+
+
+def list_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """`ImageListView`, first page, for the user with the most images."""
+    return _list_scenario(data, 0, numbered=False)
+
+
+def list_deep_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """`ImageListView` `depth` pages in, through a keyset cursor."""
+    return _list_scenario(data, depth, numbered=False)
+
+
+def list_deep_offset_scenario(
+    data: BenchData, iterations: int, depth: int
+) -> Operation:
+    """The same page through `?page=<n>` (COUNT plus OFFSET)."""
+    return _list_scenario(data, depth, numbered=True)
+
+
+def quota_check_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """The pre-check QuotaCheckMiddleware runs for every upload POST."""
+
+    def op(i: int) -> None:
+        is_upload_quota_exceeded(data.rng.choice(data.ips))
+
+    return op
+
+
+def quota_reserve_scenario(data: BenchData, iterations: int, depth: int) -> Operation:
+    """Taking and giving back an upload slot."""
+
+    def op(i: int) -> None:
+        release_upload_slot(reserve_upload_slot(data.rng.choice(data.ips)))
+
+    return op
+
+
+SCENARIOS: Dict[str, Callable[..., Operation]] = {
+    "upload": upload_scenario,
+    "detail": detail_scenario,
+    "list": list_scenario,
+    "list_deep": list_deep_scenario,
+    "list_deep_offset": list_deep_offset_scenario,
+    "quota_check": quota_check_scenario,
+    "quota_reserve": quota_reserve_scenario,
+}
+
+
+class Measurement(NamedTuple):
+    durations_ns: List[int]
+    queries: List[int]
+    elapsed_ns: int
+
+
+def measure(op: Operation, iterations: int, warmup: int = 0) -> Measurement:
+    """Run `op` `warmup` times untimed, then `iterations` times timed."""
+    for i in range(warmup):
+        op(iterations + i)
+    durations, queries = [], []
+    started = time.perf_counter_ns()
+    for i in range(iterations):
+        capture = QueryCapture()
+        token = current_capture.set(capture)
+        start = time.perf_counter_ns()
+        try:
+            op(i)
+        finally:
+            durations.append(time.perf_counter_ns() - start)
+            current_capture.reset(token)
+        queries.append(capture.count)
+    return Measurement(durations, queries, time.perf_counter_ns() - started)
+
+
+def percentile(sorted_values: List[int], pct: float) -> int:
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(pct / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+def summarize(measurement: Measurement) -> Dict[str, float]:
+    durations = sorted(measurement.durations_ns)
+    n = len(durations)
+    summary = {"iterations": n}
+    for pct in PERCENTILES:
+        summary[f"p{pct}_ms"] = round(percentile(durations, pct) / 1e6, 3)
+    summary["mean_ms"] = round(sum(durations) / n / 1e6, 3)
+    summary["max_ms"] = round(durations[-1] / 1e6, 3)
+    summary["ops_per_sec"] = round(n / (measurement.elapsed_ns / 1e9), 1)
+    summary["queries_per_op"] = round(sum(measurement.queries) / n, 2)
+    return summary
+
+
+def compare(
+    results: dict, baseline: dict, tolerance: float = 0.2, noise_ms: float = 0.2
+) -> List[str]:
+    """
+    Regressions of `results` against `baseline`: a percentile more than
+    `tolerance` (and more than `noise_ms`) slower, or more queries per call.
+    """
+    regressions = []
+    for name, current in results.get("scenarios", {}).items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        for pct in PERCENTILES:
+            key = f"p{pct}_ms"
+            if key not in before:
+                continue
+            limit = max(before[key] * (1 + tolerance), before[key] + noise_ms)
+            if current[key] > limit:
+                regressions.append(
+                    f"{name}: {key} {before[key]} -> {current[key]} "
+                    f"(+{(current[key] / before[key] - 1) * 100 if before[key] else math.inf:.0f}%)"
+                )
+        if current["queries_per_op"] > before.get("queries_per_op", math.inf):
+            regressions.append(
+                f"{name}: queries_per_op {before['queries_per_op']} -> {current['queries_per_op']}"
+            )
+    return regressions
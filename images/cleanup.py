@@ -0,0 +1,266 @@
+"""
+Deleting image files nothing refers to.
+
+Releasing an image's last reference to a blob only leaves the blob with
+`ref_count=0` and schedules `images.sweep_blobs`. A worker then deletes such
+rows and their files in batches, with the files removed in parallel and each
+batch's row locks held until they are gone, so a concurrent upload of the
+same content either revives the row first or re-creates both after.
+
+`manage.py gc_media` runs the same sweep and also removes files under
+MEDIA_ROOT that no blob points at (left by crashes or older code), plus stale
+staging files.
+
+Bulk deletes from the admin go through `schedule_asset_deletion`: a worker
+deletes the images a batch per transaction and then sweeps their files. The
+job carries the selection as plain JSON (ticked ids, or the changelist's
+filters and search term) and only the admin's own filters are accepted back.
+"""
+
+from __future__ import annotations
+
+import bisect
+import hashlib
+import heapq
+import logging
+import os
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import QuerySet
+
+from jobs.models import Job
+from jobs.queue import enqueue
+
+from .lookups import asset_search_lookup
+from .models import ImageAsset, ImageBlob
+
+logger = logging.getLogger(__name__)
+
+SWEEP_TASK = "images.sweep_blobs"
+DELETE_TASK = "images.delete_images"
+DEFAULT_WORKERS = 8
+DEFAULT_BATCH_SIZE = 500
+# The image changelist's filters (`ImageAssetAdmin.list_filter`)
+ASSET_FILTERS = frozenset({"format__exact", "created_at__gte", "created_at__lt"})
+
+
+def delete_in_parallel(
+    remove: Callable[[str], None], names: List[str], workers: int = DEFAULT_WORKERS
+) -> int:
+    """Call `remove(name)` for each name, `workers` at a time. Returns the successes."""
+
+    def attempt(name: str) -> bool:
+        try:
+            remove(name)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            logger.warning("Could not delete %s", name, exc_info=True)
+            return False
+        return True
+
+    if workers <= 1 or len(names) <= 1:
+        return sum(map(attempt, names))
+    with ThreadPoolExecutor(max_workers=min(workers, len(names))) as pool:
+        return sum(pool.map(attempt, names))
+
+
+def schedule_sweep() -> None:
+    """Have a worker sweep unreferenced blobs once the transaction commits."""
+    transaction.on_commit(_enqueue_sweep)
+
+
+def _enqueue_sweep() -> None:
+    # A sweep that has not started yet also covers blobs released after it
+    # was queued, so a burst of deletes (or a user cascade) queues one job
+    if Job.objects.filter(task=SWEEP_TASK, status=Job.Status.QUEUED).exists():
+        return
+    delay = getattr(settings, "BLOB_SWEEP_DELAY_SECONDS", 10)
+    enqueue(SWEEP_TASK, delay=timedelta(seconds=delay))
+
+
+def sweep_unreferenced_blobs(
+    batch_size: int = DEFAULT_BATCH_SIZE, workers: int = DEFAULT_WORKERS
+) -> int:
+    """Delete blobs with no references, rows and files. Returns how many went."""
+    storage = ImageBlob._meta.get_field("file").storage
+    connection = connections[router.db_for_write(ImageBlob)]
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic(using=connection.alias):
+            blobs = list(
+                ImageBlob.objects.select_for_update(skip_locked=skip_locked)
+                .filter(ref_count=0, pk__gt=last_pk)
+                .order_by("pk")
+                .only("pk", "file")[:batch_size]
+            )
+            if not blobs:
+                return deleted
+            last_pk = blobs[-1].pk
+            pks = [blob.pk for blob in blobs]
+            ImageBlob.objects.filter(pk__in=pks, ref_count=0).delete()
+            # Without row locks (SQLite), an upload may have revived a row
+            # between the SELECT and the DELETE; its file must stay
+            revived = set(
+                ImageBlob.objects.filter(pk__in=pks).values_list("pk", flat=True)
+            )
+            names = [blob.file.name for blob in blobs if blob.pk not in revived]
+            delete_in_parallel(storage.delete, names, workers)
+            deleted += len(names)
+
+
+def selected_assets(
+    pks: Optional[List[int]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    search: str = "",
+    last_pk: Optional[int] = None,
+) -> QuerySet:
+    """
+    The images with `pks`, or else those the image changelist shows for
+    `filters` and `search`; with `last_pk`, only those up to it.
+    """
+    queryset = ImageAsset.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=pks)
+    else:
+        unknown = set(filters or {}) - ASSET_FILTERS
+        if unknown:
+            raise ValueError(f"Unsupported filters: {', '.join(sorted(unknown))}")
+        queryset = queryset.filter(**(filters or {}))
+        if search.strip():
+            lookup = asset_search_lookup(search)
+            queryset = queryset.filter(lookup) if lookup else queryset.none()
+    if last_pk is not None:
+        queryset = queryset.filter(pk__lte=last_pk)
+    return queryset
+
+
+def schedule_asset_deletion(
+    pks: Optional[List[int]] = None,
+    filters: Optional[Dict[str, str]] = None,
+    search: str = "",
+) -> Optional[Job]:
+    """
+    Queue a job deleting the images `selected_assets` picks, as they stand now
+    (images created later are left alone). Returns the job, or None if there
+    is nothing to delete.
+    """
+    queryset = selected_assets(pks, filters, search)
+    last_pk = queryset.order_by("-pk").values_list("pk", flat=True).first()
+    if last_pk is None:
+        return None
+    return enqueue(
+        DELETE_TASK, pks=pks, filters=filters or {}, search=search, last_pk=last_pk
+    )
+
+
+def delete_assets_in_batches(
+    queryset: QuerySet,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    workers: int = DEFAULT_WORKERS,
+) -> int:
+    """
+    Delete the images in `queryset` `batch_size` per transaction, in primary
+    key order, then sweep the blobs they released. Returns how many went.
+    """
+    deleted = 0
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            pks = list(
+                queryset.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            # Through the ORM, so the delete signals release blob references
+            ImageAsset.objects.filter(pk__in=pks).delete()
+            deleted += len(pks)
+    sweep_unreferenced_blobs(batch_size, workers)
+    return deleted
+
+
+def _fingerprint(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big")
+
+
+def referenced_fingerprints(batch_size: int = 10000) -> array:
+    """
+    Sorted 64-bit fingerprints of every blob's file name: 8 bytes per blob,
+    read in keyset-ordered chunks. A collision can only make an orphan look
+    referenced, never the other way round.
+    """
+    chunks = []
+    last_pk = 0
+    while True:
+        rows = list(
+            ImageBlob.objects.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "file")[:batch_size]
+        )
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        chunks.append(array("Q", sorted(_fingerprint(name) for _, name in rows)))
+    return array("Q", heapq.merge(*chunks))
+
+
+def is_referenced(fingerprints: array, name: str) -> bool:
+    value = _fingerprint(name)
+    i = bisect.bisect_left(fingerprints, value)
+    return i < len(fingerprints) and fingerprints[i] == value
+
+
+def walk_files(root: str, skip: Iterable[str] = ()) -> Iterator[os.DirEntry]:
+    """Files below `root`, streamed with os.scandir; `skip` lists directories to leave out."""
+    skip = {os.path.abspath(path) for path in skip}
+    pending = [root]
+    while pending:
+        try:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if os.path.abspath(entry.path) not in skip:
+                            pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def orphaned_files(
+    root: str,
+    fingerprints: array,
+    min_age: float,
+    skip: Iterable[str] = (),
+    now: Optional[float] = None,
+) -> Iterator[os.DirEntry]:
+    """
+    Files under `root` that no blob refers to and that are older than
+    `min_age` seconds (younger ones may belong to an upload still committing).
+    """
+    cutoff = (now or time.time()) - min_age
+    for entry in walk_files(root, skip):
+        name = os.path.relpath(entry.path, root).replace(os.sep, "/")
+        if entry.stat().st_mtime < cutoff and not is_referenced(fingerprints, name):
+            yield entry
+
+
+def stale_staging_files(
+    directory: str, max_age: float, now: Optional[float] = None
+) -> Iterator[os.DirEntry]:
+    """Staging files untouched for `max_age` seconds: abandoned uploads."""
+    cutoff = (now or time.time()) - max_age
+    for entry in walk_files(directory):
+        if entry.stat().st_mtime < cutoff:
+            yield entry
@@ -0,0 +1,290 @@
+"""
+Streaming ZIP export of a user's images (see `ImageExportView`).
+
+The archive is written as it is sent. Images come from one query iterated in
+(created_at, id) order, each file is read `CHUNK_SIZE` bytes at a time, and
+the central directory is spooled to a temporary file, so memory use does not
+grow with the archive.
+
+The layout is deterministic:
+
+- entries are named `<upload day>/<public_id>.<ext>` and dated by upload
+- every entry is stored (the accepted formats are all compressed already)
+- every entry has a data descriptor, so its CRC-32 is computed while it
+  streams and no file is read twice
+
+Each header's size follows from the file sizes and name lengths, so the
+archive's exact length (and a version for its ETag) comes from one aggregate
+query before the first byte. That is what lets `Range` requests resume a
+download. Bytes before the range are generated and dropped, since the
+central directory needs the skipped entries' CRCs.
+
+Archives of 65535 entries or more, or beyond 4 GiB, use ZIP64 end records
+and local header offsets. Sizes never need ZIP64: every file is at most
+`MAX_UPLOAD_SIZE`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import struct
+import tempfile
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+from django.db.models import Count, Max, Q, QuerySet, Sum
+from django.utils import timezone
+
+from .models import ImageAsset
+
+CHUNK_SIZE = 64 * 1024
+# Rows fetched per round trip
+ROWS_PER_QUERY = 500
+# Central directory bytes kept in memory before spilling to disk
+SPOOL_MAX_BYTES = 1024 * 1024
+
+EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+# "YYYY-MM-DD/" + a UUID
+NAME_PREFIX_LENGTH = 11 + 36
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_DATA_DESCRIPTOR = struct.Struct("<IIII")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_ZIP64_OFFSET = struct.Struct("<HHQ")
+_ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+_ZIP64_LOCATOR = struct.Struct("<IIQI")
+_END = struct.Struct("<IHHHHIIH")
+
+# Sizes come after the data (bit 3); names are UTF-8 (bit 11)
+_FLAGS = 0x0808
+_STORED = 0
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_COUNT_LIMIT = 0xFFFF
+
+
+class ExportChanged(RuntimeError):
+    """The images changed while their archive was being sent."""
+
+
+class ExportPlan(NamedTuple):
+    """What an archive holds, known before it is written."""
+
+    count: int
+    data_bytes: int
+    name_bytes: int
+    # (created_at, id) of the last image; later uploads are left out
+    last_key: Optional[Tuple[datetime, int]]
+    etag: str
+
+    @property
+    def zip64(self) -> bool:
+        return (
+            self.count >= _ZIP64_COUNT_LIMIT
+            or self._local_bytes >= _ZIP64_LIMIT
+            or self._central_bytes(False) >= _ZIP64_LIMIT
+        )
+
+    @property
+    def _local_bytes(self) -> int:
+        return (
+            self.count * (_LOCAL_HEADER.size + _DATA_DESCRIPTOR.size)
+            + self.name_bytes
+            + self.data_bytes
+        )
+
+    def _central_bytes(self, zip64: bool) -> int:
+        extra = _ZIP64_OFFSET.size if zip64 else 0
+        return self.count * (_CENTRAL_HEADER.size + extra) + self.name_bytes
+
+    @property
+    def length(self) -> int:
+        """Size of the whole archive in bytes."""
+        zip64 = self.zip64
+        end = _END.size + (_ZIP64_END.size + _ZIP64_LOCATOR.size if zip64 else 0)
+        return self._local_bytes + self._central_bytes(zip64) + end
+
+
+def _midnight(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_queryset(user, since: Optional[date] = None, until: Optional[date] = None):
+    """`user`'s images uploaded from `since` through `until` (local days)."""
+    queryset = ImageAsset.objects.filter(user=user).exclude(blob=None)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=_midnight(since))
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=_midnight(until) + timedelta(days=1))
+    return queryset
+
+
+def plan_export(queryset: QuerySet) -> ExportPlan:
+    """Size and version of the archive of `queryset`, from two small queries."""
+    last_key = (
+        queryset.order_by("-created_at", "-id").values_list("created_at", "id").first()
+    )
+    if last_key is not None:
+        queryset = _up_to(queryset, last_key)
+    groups = (
+        queryset.order_by()
+        .values("format")
+        .annotate(count=Count("id"), size=Sum("blob__size"), updated=Max("updated_at"))
+    )
+    count = data_bytes = name_bytes = 0
+    updated = None
+    for group in groups:
+        count += group["count"]
+        data_bytes += group["size"] or 0
+        extension = EXTENSIONS.get(group["format"], "")
+        name_bytes += group["count"] * (NAME_PREFIX_LENGTH + len(extension))
+        updated = max(filter(None, (updated, group["updated"])), default=None)
+
+    version = f"{count}|{data_bytes}|{last_key}|{updated}"
+    etag = hashlib.sha256(version.encode()).hexdigest()[:32]
+    return ExportPlan(count, data_bytes, name_bytes, last_key, etag)
+
+
+def _up_to(queryset: QuerySet, key: Tuple[datetime, int]) -> QuerySet:
+    created_at, pk = key
+    return queryset.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, id__lte=pk)
+    )
+
+
+def entry_name(image_obj: ImageAsset) -> str:
+    day = timezone.localtime(image_obj.created_at).date()
+    extension = EXTENSIONS.get(image_obj.format, "")
+    return f"{day.isoformat()}/{image_obj.public_id}{extension}"
+
+
+def _dos_datetime(moment: datetime) -> Tuple[int, int]:
+    moment = timezone.localtime(moment)
+    if moment.year < 1980:
+        return 0, (1 << 5) | 1
+    dos_time = (moment.hour << 11) | (moment.minute << 5) | (moment.second // 2)
+    dos_date = ((moment.year - 1980) << 9) | (moment.month << 5) | moment.day
+    return dos_time, dos_date
+
+
+def archive_chunks(queryset: QuerySet, plan: ExportPlan) -> Iterator[bytes]:
+    """
+    The archive of `queryset` laid out as `plan` promised. Raises
+    ExportChanged, ending the download early, if the images no longer match.
+    """
+    zip64 = plan.zip64
+    version = 45 if zip64 else 20
+    images = queryset
+    if plan.last_key is not None:
+        images = _up_to(queryset, plan.last_key)
+    images = (
+        images.select_related("blob")
+        .only("public_id", "created_at", "format", "blob__file", "blob__size")
+        .order_by("created_at", "id")
+    )
+
+    offset = count = 0
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as central:
+        for image_obj in images.iterator(chunk_size=ROWS_PER_QUERY):
+            name = entry_name(image_obj).encode()
+            dos_time, dos_date = _dos_datetime(image_obj.created_at)
+            yield _LOCAL_HEADER.pack(
+                0x04034B50,
+                version,
+                _FLAGS,
+                _STORED,
+                dos_time,
+                dos_date,
+                0,  # CRC-32 and sizes: in the data descriptor
+                0,
+                0,
+                len(name),
+                0,  # extra field length
+            ) + name
+
+            crc = size = 0
+            with image_obj.blob.file.open("rb") as fh:
+                for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+                    crc = zlib.crc32(chunk, crc)
+                    size += len(chunk)
+                    yield chunk
+            if size != image_obj.blob.size:
+                raise ExportChanged(f"{image_obj.public_id} changed size")
+            yield _DATA_DESCRIPTOR.pack(0x08074B50, crc, size, size)
+
+            extra = _ZIP64_OFFSET.pack(1, 8, offset) if zip64 else b""
+            central.write(
+                _CENTRAL_HEADER.pack(
+                    0x02014B50,
+                    version,
+                    version,
+                    _FLAGS,
+                    _STORED,
+                    dos_time,
+                    dos_date,
+                    crc,
+                    size,
+                    size,
+                    len(name),
+                    len(extra),
+                    0,  # comment length
+                    0,  # disk number
+                    0,  # internal attributes
+                    0,  # external attributes
+                    _ZIP64_LIMIT if zip64 else offset,
+                )
+                + name
+                + extra
+            )
+            offset += _LOCAL_HEADER.size + len(name) + size + _DATA_DESCRIPTOR.size
+            count += 1
+
+        if count != plan.count:
+            raise ExportChanged(f"{count} images instead of {plan.count}")
+        central_size = central.tell()
+        central.seek(0)
+        yield from iter(lambda: central.read(CHUNK_SIZE), b"")
+
+    if zip64:
+        yield _ZIP64_END.pack(
+            0x06064B50,
+            _ZIP64_END.size - 12,
+            version,
+            version,
+            0,  # this disk
+            0,  # disk where the central directory starts
+            count,
+            count,
+            central_size,
+            offset,
+        )
+        yield _ZIP64_LOCATOR.pack(0x07064B50, 0, offset + central_size, 1)
+        # Everything that does not fit is in the ZIP64 record
+        yield _END.pack(
+            0x06054B50,
+            0,
+            0,
+            _ZIP64_COUNT_LIMIT,
+            _ZIP64_COUNT_LIMIT,
+            _ZIP64_LIMIT,
+            _ZIP64_LIMIT,
+            0,
+        )
+    else:
+        yield _END.pack(0x06054B50, 0, 0, count, count, central_size, offset, 0)
+
+
+def byte_range(chunks: Iterator[bytes], offset: int, length: int) -> Iterator[bytes]:
+    """The `length` bytes of `chunks` from `offset` on."""
+    position, end = 0, offset + length
+    try:
+        for chunk in chunks:
+            chunk_end = position + len(chunk)
+            if chunk_end > offset:
+                yield chunk[max(offset - position, 0) : end - position]
+            position = chunk_end
+            if position >= end:
+                return
+    finally:
+        # Closes the file being read, if we stopped inside an entry
+        chunks.close()
@@ -1,12 +1,50 @@
 from __future__ import annotations
 
 from django import forms
+from django.core.exceptions import ValidationError
+
+from .inspection import InspectionError, inspect_image
+from .uploadhandlers import IMAGE_MIME_TYPES
+
+
+class InspectedImageField(forms.FileField):
+    """
+    Image field that validates uploads from their header alone (see
+    `images.inspection`) instead of a full Pillow `verify()` pass.
+    The result is kept on the file as `image_info` so nothing has to reopen it.
+    """
+
+    default_error_messages = {
+        "invalid_image": "Upload a valid image. %(reason)s",
+    }
+
+    def to_python(self, data):
+        f = super().to_python(data)
+        if f is None:
+            return None
+
+        try:
+            # Streamed uploads arrive pre-hashed (see StreamingImageUploadHandler)
+            f.image_info = inspect_image(f, getattr(f, "sha256", None))
+        except InspectionError as exc:
+            raise ValidationError(
+                self.error_messages["invalid_image"],
+                code="invalid_image",
+                params={"reason": exc},
+            ) from exc
+        f.content_type = IMAGE_MIME_TYPES[f.image_info.format]
+        return f
+
+    def widget_attrs(self, widget):
+        attrs = super().widget_attrs(widget)
+        attrs.setdefault("accept", "image/*")
+        return attrs
 
 
 class ImageUploadForm(forms.Form):
     """
     Simple form for validating uploaded image.
-    - Handles file validation (Pillow backend).
+    - Handles file validation (Pillow header inspection).
     """
 
-    image = forms.ImageField()
+    image = InspectedImageField()
@@ -0,0 +1,65 @@
+"""
+Cached HTML of image cards (the list grid's cards and the detail page's).
+
+A card only shows the image's own fields, so its HTML is cached per image
+under a key holding the image's `public_id` and `updated_at` and a hash of
+the card template: an upload adds new keys, a change to an image or to the
+template makes new ones, and a delete drops the image's own. Everything else
+keeps being served from the cache, and a list page is assembled from cards
+with one `get_many`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Dict, Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import SafeString, mark_safe
+
+CARD_TEMPLATE = "images/card.html"
+DETAIL_CARD_TEMPLATE = "images/detail_card.html"
+TEMPLATES = (CARD_TEMPLATE, DETAIL_CARD_TEMPLATE)
+
+_template_versions: Dict[str, str] = {}
+
+
+def _template_version(template_name: str) -> str:
+    # Templates only change with a deploy, which restarts the process
+    version = _template_versions.get(template_name)
+    if version is None:
+        source = get_template(template_name).template.source
+        version = hashlib.blake2b(source.encode(), digest_size=6).hexdigest()
+        _template_versions[template_name] = version
+    return version
+
+
+def fragment_key(template_name: str, image) -> str:
+    stamp = int(image.updated_at.timestamp() * 1_000_000)
+    return (
+        f"images:fragment:{template_name}:{_template_version(template_name)}:"
+        f"{image.public_id}:{stamp}"
+    )
+
+
+async def arender(template_name: str, images: Iterable) -> List[SafeString]:
+    """`template_name` rendered for each image, from the cache where possible."""
+    images = list(images)
+    keys = [fragment_key(template_name, image) for image in images]
+    found = await cache.aget_many(keys)
+    rendered = {}
+    for key, image in zip(keys, images):
+        if key not in found:
+            rendered[key] = render_to_string(template_name, {"image": image})
+    if rendered:
+        await cache.aset_many(
+            rendered, getattr(settings, "FRAGMENT_CACHE_SECONDS", 86400)
+        )
+    return [mark_safe(found[key] if key in found else rendered[key]) for key in keys]
+
+
+def forget(image) -> None:
+    """Drop `image`'s cached cards (once it is deleted)."""
+    cache.delete_many([fragment_key(name, image) for name in TEMPLATES])
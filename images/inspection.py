@@ -0,0 +1,51 @@
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from PIL import Image
+
+from .uploadhandlers import IMAGE_MIME_TYPES
+
+DEFAULT_MAX_IMAGE_PIXELS = 50_000_000
+
+
+class InspectionError(ValueError):
+    """The file is not an image we accept."""
+
+
+class ImageInfo(NamedTuple):
+    width: int
+    height: int
+    format: str
+    byte_size: int
+    content_hash: Optional[str]
+
+
+def inspect_image(f, content_hash: Optional[str] = None) -> ImageInfo:
+    """
+    Read only the container header of the file object `f` and describe it.
+
+    Raises InspectionError for unsupported formats and for decompression bombs
+    (more than MAX_IMAGE_PIXELS pixels), before any pixel data is decoded.
+    """
+    max_pixels = getattr(settings, "MAX_IMAGE_PIXELS", DEFAULT_MAX_IMAGE_PIXELS)
+    source = f.temporary_file_path() if hasattr(f, "temporary_file_path") else f
+    try:
+        # Image.open() parses the header and leaves the pixel data alone
+        with Image.open(source) as image:
+            width, height = image.size
+            image_format = image.format
+    except Image.DecompressionBombError as exc:
+        raise InspectionError("Image dimensions are too large.") from exc
+    except Exception as exc:
+        raise InspectionError("Not a valid image.") from exc
+    finally:
+        f.seek(0)
+
+    if image_format not in IMAGE_MIME_TYPES:
+        raise InspectionError(f"Unsupported image format: {image_format}.")
+    if width * height > max_pixels:
+        raise InspectionError("Image dimensions are too large.")
+
+    return ImageInfo(width, height, image_format, f.size, content_hash)
@@ -0,0 +1,45 @@
+"""
+Turning an admin search term into an indexed lookup. Shared by the image
+admin's search box and the background deletes it starts (images.cleanup).
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import re
+import uuid
+from typing import Optional
+
+from django.db.models import Q
+
+# Shorter hash prefixes would match too much of the table to be useful
+_HASH_PREFIX = re.compile(r"[0-9a-f]{6,64}")
+# Fits a bigint
+_MAX_ID_DIGITS = 18
+
+
+def asset_search_lookup(term: str) -> Optional[Q]:
+    """
+    Indexed lookup for an admin search term: a public id, an uploader IP, a
+    numeric id or a content hash (or prefix of one). None if it is none of
+    these.
+    """
+    term = term.strip().lower()
+    try:
+        return Q(public_id=uuid.UUID(term))
+    except ValueError:
+        pass
+    try:
+        return Q(uploader_ip=str(ipaddress.ip_address(term)))
+    except ValueError:
+        pass
+    lookup = Q()
+    if term.isdigit() and len(term) <= _MAX_ID_DIGITS:
+        lookup |= Q(pk=int(term))
+    if _HASH_PREFIX.fullmatch(term):
+        lookup |= (
+            Q(content_hash=term)
+            if len(term) == 64
+            else Q(content_hash__startswith=term)
+        )
+    return lookup or None
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from images import similarity
+from images.inspection import InspectionError, inspect_image
+from images.models import ImageAsset
+
+# updated_at too, which versions cached pages and cards
+FIELDS = [
+    "width",
+    "height",
+    "format",
+    "byte_size",
+    "content_hash",
+    "perceptual_hash",
+    "updated_at",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in width/height/format/byte_size/content_hash/perceptual_hash "
+        "for older images."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows fetched and updated per round trip.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        queryset = (
+            ImageAsset.objects.filter(
+                Q(width__isnull=True) | Q(perceptual_hash__isnull=True)
+            )
+            .exclude(blob=None)
+            .select_related("blob")
+            .only("id", "blob__file", "blob__size", "blob__content_hash")
+            .order_by()
+        )
+
+        updated = skipped = 0
+        pending = []
+        # Stream rows instead of loading the whole table
+        for image_obj in queryset.iterator(chunk_size=batch_size):
+            blob = image_obj.blob
+            try:
+                with blob.file.open("rb") as fh:
+                    info = inspect_image(fh, blob.content_hash)
+                    phash = similarity.perceptual_hash(fh)
+            except (InspectionError, OSError) as exc:
+                skipped += 1
+                self.stderr.write(f"Skipping {image_obj.pk}: {exc}")
+                continue
+
+            image_obj.width, image_obj.height = info.width, info.height
+            image_obj.format = info.format
+            image_obj.byte_size = blob.size
+            image_obj.content_hash = blob.content_hash
+            image_obj.perceptual_hash = similarity.to_db(phash)
+            image_obj.updated_at = timezone.now()
+            pending.append(image_obj)
+            if len(pending) >= batch_size:
+                ImageAsset.objects.bulk_update(pending, FIELDS)
+                updated += len(pending)
+                pending = []
+
+        if pending:
+            ImageAsset.objects.bulk_update(pending, FIELDS)
+            updated += len(pending)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Backfilled {updated} images ({skipped} skipped)")
+        )
@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import platform
+import random
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from images import bench
+from images.models import ImageAsset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a separate benchmark database and time the upload, list, detail "
+        "and quota paths (p50/p95/p99 and queries per call), optionally "
+        "against a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=sorted(bench.SCENARIOS),
+            help="Scenario to run; repeat for several (default: all).",
+        )
+        parser.add_argument("--rows", type=int, default=20000, help="Images to seed.")
+        parser.add_argument("--users", type=int, default=200, help="Users to seed.")
+        parser.add_argument("--ips", type=int, default=2000, help="Client IPs to seed.")
+        parser.add_argument(
+            "--iterations", type=int, default=200, help="Timed calls per scenario."
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=10, help="Untimed calls per scenario."
+        )
+        parser.add_argument(
+            "--depth",
+            type=int,
+            default=500,
+            help="How many pages in the deep list scenarios read.",
+        )
+        parser.add_argument("--random-seed", type=int, default=1234)
+        parser.add_argument("--output", help="Write the results to this JSON file.")
+        parser.add_argument(
+            "--baseline",
+            help="Results file to compare against; regressions make the command fail.",
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="Allowed slowdown against the baseline (0.2 = 20%%).",
+        )
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the benchmark database (and its seed) for the next run.",
+        )
+
+    def handle(self, *args, **options):
+        names = options["scenario"] or list(bench.SCENARIOS)
+        rng = random.Random(options["random_seed"])
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"]) as fh:
+                baseline = json.load(fh)
+
+        with self._bench_database(options["keepdb"]), self._media_root(
+            options["keepdb"]
+        ), override_settings(
+            # Measure what production runs: no query log kept by DEBUG
+            DEBUG=False,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            # Every upload scenario call would otherwise hit the quota
+            UPLOAD_QUOTA_PER_IP=10**9,
+        ):
+            self._seed(options, rng)
+            data = bench.load(rng, options["ips"])
+            results = {"meta": self._meta(options), "scenarios": {}}
+            for name in names:
+                op = bench.SCENARIOS[name](
+                    data,
+                    iterations=options["iterations"] + options["warmup"],
+                    depth=options["depth"],
+                )
+                try:
+                    measurement = bench.measure(
+                        op, options["iterations"], options["warmup"]
+                    )
+                except bench.BenchError as exc:
+                    raise CommandError(f"{name}: {exc}") from exc
+                results["scenarios"][name] = summary = bench.summarize(measurement)
+                self._report(name, summary)
+
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(results, fh, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline is not None:
+            regressions = bench.compare(results, baseline, options["tolerance"])
+            if regressions:
+                for line in regressions:
+                    self.stderr.write(line)
+                raise CommandError(
+                    f"{len(regressions)} regression(s) against the baseline"
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
+
+    @contextmanager
+    def _bench_database(self, keepdb: bool):
+        # The test database machinery gives a disposable copy of the schema;
+        # SQLite gets a file so that --keepdb has something to keep
+        test = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite" and not test.get("NAME"):
+            test["NAME"] = str(settings.BASE_DIR / "bench.sqlite3")
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb
+        )
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+    @contextmanager
+    def _media_root(self, keepdb: bool):
+        if keepdb:
+            root = settings.BASE_DIR / "bench-media"
+            root.mkdir(exist_ok=True)
+        else:
+            root = tempfile.mkdtemp(prefix="bench-media-")
+        try:
+            with override_settings(
+                MEDIA_ROOT=str(root), UPLOAD_STAGING_DIR=f"{root}/.staging"
+            ):
+                yield
+        finally:
+            if not keepdb:
+                shutil.rmtree(root, ignore_errors=True)
+
+    def _seed(self, options, rng) -> None:
+        existing = ImageAsset.objects.count()
+        if existing:
+            self.stdout.write(f"Reusing {existing} seeded images")
+            return
+        if options["rows"] <= 0:
+            raise CommandError("--rows must be positive")
+        step = max(options["rows"] // 10, 1)
+        next_report = [step]
+
+        def progress(done: int) -> None:
+            if done >= next_report[0] or done == options["rows"]:
+                self.stdout.write(f"  seeded {done}/{options['rows']} images")
+                next_report[0] = done + step
+
+        self.stdout.write("Seeding...")
+        bench.seed(
+            options["rows"],
+            users=options["users"],
+            ips=options["ips"],
+            rng=rng,
+            progress=progress,
+        )
+
+    def _meta(self, options) -> dict:
+        return {
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "rows": ImageAsset.objects.count(),
+            "iterations": options["iterations"],
+            "depth": options["depth"],
+            "random_seed": options["random_seed"],
+        }
+
+    def _report(self, name: str, summary: dict) -> None:
+        self.stdout.write(
+            f"{name:<18} p50 {summary['p50_ms']:>9.2f} ms  "
+            f"p95 {summary['p95_ms']:>9.2f} ms  p99 {summary['p99_ms']:>9.2f} ms  "
+            f"{summary['ops_per_sec']:>9.1f} ops/s  "
+            f"{summary['queries_per_op']:>6.2f} queries/op"
+        )
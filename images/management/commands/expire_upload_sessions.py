@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from images.resumable import expire_sessions
+
+
+class Command(BaseCommand):
+    help = "Remove abandoned resumable uploads and their staging files."
+
+    def handle(self, *args, **options):
+        count = expire_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Expired {count} upload sessions"))
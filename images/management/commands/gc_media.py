@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+
+from images import cleanup
+from images.models import ImageBlob
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete blobs no image refers to, files under MEDIA_ROOT no blob refers "
+        "to, and abandoned staging files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list what would be deleted.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Rows read per query, and files deleted per batch.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=cleanup.DEFAULT_WORKERS,
+            help="Parallel deletes within a batch.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=3600,
+            help="Leave files younger than this many seconds (uploads in flight).",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+        batch_size = options["batch_size"]
+        workers = options["workers"]
+
+        if dry_run:
+            count = ImageBlob.objects.filter(ref_count=0).count()
+            self.stdout.write(f"{count} unreferenced blobs would be deleted")
+        else:
+            count = cleanup.sweep_unreferenced_blobs(batch_size, workers)
+            self.stdout.write(f"Deleted {count} unreferenced blobs")
+
+        staging = str(getattr(settings, "UPLOAD_STAGING_DIR", ""))
+        renditions = str(getattr(settings, "RENDITION_CACHE_DIR", ""))
+        storage = ImageBlob._meta.get_field("file").storage
+        if isinstance(storage, FileSystemStorage):
+            fingerprints = cleanup.referenced_fingerprints(batch_size)
+            orphans = cleanup.orphaned_files(
+                storage.location,
+                fingerprints,
+                options["min_age"],
+                skip=[path for path in (staging, renditions) if path],
+            )
+            self._delete(orphans, "orphaned files", dry_run, batch_size, workers)
+        else:
+            self.stdout.write("Storage is not local; skipped the orphaned file scan")
+
+        if staging:
+            max_age = max(
+                getattr(settings, "UPLOAD_SESSION_TTL_SECONDS", 86400),
+                options["min_age"],
+            )
+            stale = cleanup.stale_staging_files(staging, max_age)
+            self._delete(stale, "staging files", dry_run, batch_size, workers)
+
+    def _delete(self, entries, label, dry_run, batch_size, workers) -> None:
+        count = size = 0
+        batch = []
+
+        def flush():
+            nonlocal count
+            count += cleanup.delete_in_parallel(os.remove, batch, workers)
+            batch.clear()
+
+        for entry in entries:
+            size += entry.stat().st_size
+            if dry_run:
+                self.stdout.write(entry.path)
+                count += 1
+                continue
+            batch.append(entry.path)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+
+        verb = "would be deleted" if dry_run else "deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{count} {label} {verb} ({size / 1024 / 1024:.1f} MB)")
+        )
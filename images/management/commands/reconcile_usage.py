@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from images import usage
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the per-user and per-IP daily usage rows from the images, "
+        "a few days per transaction. Run once after migrating, then to fix drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="Days recomputed per transaction.",
+        )
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            help="Only recompute from this day (YYYY-MM-DD) on.",
+        )
+
+    def handle(self, *args, **options):
+        step = options["days"]
+        if step < 1:
+            raise CommandError("--days must be at least 1.")
+        span = usage.usage_days()
+        if span is None:
+            self.stdout.write(self.style.SUCCESS("No images; nothing to do"))
+            return
+        day, end = span
+        if options["since"] is not None:
+            day = max(day, options["since"])
+
+        days = changed = 0
+        while day < end:
+            chunk_end = min(day + timedelta(days=step), end)
+            changed += usage.reconcile(day, chunk_end)
+            days += (chunk_end - day).days
+            day = chunk_end
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Reconciled {days} days ({changed} rows corrected)")
+        )
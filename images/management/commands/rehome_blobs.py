@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import errno
+import os
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.core.management.base import BaseCommand
+
+from images.models import ImageBlob, blob_storage_name
+
+
+class Command(BaseCommand):
+    help = (
+        "Move blob files to the names the configured storage gives them, e.g. "
+        "after changing STORAGE_SHARD_DEPTH or STORAGE_BACKEND."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Rows fetched and updated per round trip.",
+        )
+        parser.add_argument(
+            "--source",
+            default="default",
+            help=(
+                "STORAGES alias to read the files from, for moving between "
+                "backends (e.g. a 'legacy' entry describing the old one)."
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the moves.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        target = ImageBlob._meta.get_field("file").storage
+        in_place = options["source"] == "default"
+        source = target if in_place else storages[options["source"]]
+
+        moved = missing = 0
+        pending = []
+        # Stream rows instead of loading the whole table
+        queryset = ImageBlob.objects.only("id", "content_hash", "file").order_by("pk")
+        for blob in queryset.iterator(chunk_size=batch_size):
+            old = blob.file.name
+            new = blob_storage_name(target, blob.content_hash, os.path.splitext(old)[1])
+            if in_place and old == new:
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"{old} -> {new}")
+                moved += 1
+                continue
+
+            try:
+                self._move(source, target, old, new)
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f"Missing file for blob {blob.pk}: {old}")
+                continue
+
+            blob.file.name = new
+            pending.append(blob)
+            if len(pending) >= batch_size:
+                ImageBlob.objects.bulk_update(pending, ["file"])
+                moved += len(pending)
+                pending = []
+
+        if pending:
+            ImageBlob.objects.bulk_update(pending, ["file"])
+            moved += len(pending)
+
+        verb = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {moved} blob files ({missing} missing)")
+        )
+
+    @staticmethod
+    def _move(source, target, old: str, new: str) -> None:
+        if target.exists(new):
+            # Names are content-addressed, so this is the same file, left by
+            # an interrupted run; just drop the old copy
+            if source is not target or old != new:
+                source.delete(old)
+            return
+
+        if isinstance(source, FileSystemStorage) and isinstance(
+            target, FileSystemStorage
+        ):
+            # A rename, not a copy, unless the roots are on different devices
+            new_path = target.path(new)
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            try:
+                os.replace(source.path(old), new_path)
+                return
+            except OSError as exc:
+                if exc.errno != errno.EXDEV:
+                    raise
+
+        with source.open(old, "rb") as fh:
+            target.save(new, fh)
+        source.delete(old)
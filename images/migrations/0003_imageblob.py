@@ -0,0 +1,96 @@
+# Generated by Django 4.2.25 on 2025-10-25 09:12
+
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_files_to_blobs(apps, schema_editor):
+    """
+    Point every existing ImageAsset at a blob for its file's content.
+    Files stay where they are; duplicates simply share the first copy's blob
+    (the redundant copies are left for `gc_media`-style cleanup).
+    """
+    ImageAsset = apps.get_model("images", "ImageAsset")
+    ImageBlob = apps.get_model("images", "ImageBlob")
+
+    for asset in ImageAsset.objects.exclude(image="").iterator(chunk_size=500):
+        name = asset.image.name
+        try:
+            with default_storage.open(name, "rb") as fh:
+                hasher = hashlib.sha256()
+                for chunk in iter(lambda: fh.read(64 * 1024), b""):
+                    hasher.update(chunk)
+            size = default_storage.size(name)
+        except (FileNotFoundError, OSError):
+            continue
+
+        blob, _ = ImageBlob.objects.get_or_create(
+            content_hash=hasher.hexdigest(),
+            defaults={"file": name, "size": size},
+        )
+        ImageBlob.objects.filter(pk=blob.pk).update(ref_count=models.F("ref_count") + 1)
+        ImageAsset.objects.filter(pk=asset.pk).update(blob=blob)
+
+
+def blobs_to_files(apps, schema_editor):
+    ImageAsset = apps.get_model("images", "ImageAsset")
+    for asset in ImageAsset.objects.select_related("blob").exclude(blob=None):
+        ImageAsset.objects.filter(pk=asset.pk).update(image=asset.blob.file.name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0002_imageasset_user"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImageBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("content_hash", models.CharField(max_length=64, unique=True)),
+                ("file", models.FileField(max_length=255, upload_to="")),
+                ("size", models.PositiveBigIntegerField()),
+                ("ref_count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="assets",
+                to="images.imageblob",
+            ),
+        ),
+        migrations.RunPython(move_files_to_blobs, blobs_to_files),
+        # Give the old column a default so this migration can be reversed
+        migrations.AlterField(
+            model_name="imageasset",
+            name="image",
+            field=models.ImageField(default="", upload_to="uploads/%Y/%m/%d/"),
+        ),
+        migrations.RemoveField(
+            model_name="imageasset",
+            name="image",
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.25 on 2025-10-27 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0003_imageblob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imageasset",
+            name="byte_size",
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="format",
+            field=models.CharField(blank=True, db_index=True, max_length=10),
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="height",
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="width",
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.25 on 2025-10-28 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0004_imageasset_metadata"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="imageasset",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"],
+                name="images_imag_user_id_3e425f_idx",
+            ),
+        ),
+    ]
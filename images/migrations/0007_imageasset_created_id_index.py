@@ -0,0 +1,19 @@
+# Generated by Django 4.2.25 on 2025-10-28 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0006_uploadsession"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="imageasset",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="images_imag_created_866069_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.25 on 2025-10-28 18:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0007_imageasset_created_id_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imageasset",
+            name="original_blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="original_of",
+                to="images.imageblob",
+            ),
+        ),
+        migrations.AddField(
+            model_name="imageasset",
+            name="original_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
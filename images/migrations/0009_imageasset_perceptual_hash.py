@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0008_imageasset_original"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="imageasset",
+            name="perceptual_hash",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
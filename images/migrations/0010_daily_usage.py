@@ -0,0 +1,82 @@
+# Generated by Django 4.2.30 on 2026-10-16 22:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("images", "0009_imageasset_perceptual_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IpDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("image_count", models.IntegerField(default=0)),
+                ("byte_count", models.BigIntegerField(default=0)),
+                ("last_upload_at", models.DateTimeField(blank=True, null=True)),
+                ("uploader_ip", models.GenericIPAddressField()),
+            ],
+            options={
+                "verbose_name": "IP daily usage",
+                "verbose_name_plural": "IP daily usage",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.CreateModel(
+            name="UserDailyUsage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField()),
+                ("image_count", models.IntegerField(default=0)),
+                ("byte_count", models.BigIntegerField(default=0)),
+                ("last_upload_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_usage",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "user daily usage",
+                "ordering": ["-day"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="ipdailyusage",
+            constraint=models.UniqueConstraint(
+                fields=("uploader_ip", "day"), name="images_ipdailyusage_ip_day"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="userdailyusage",
+            constraint=models.UniqueConstraint(
+                fields=("user", "day"), name="images_userdailyusage_user_day"
+            ),
+        ),
+    ]
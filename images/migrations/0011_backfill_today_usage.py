@@ -0,0 +1,51 @@
+from datetime import datetime, time
+
+from django.db import migrations
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_today(apps, schema_editor):
+    """
+    Count today's uploads into the usage rows. The daily quota is seeded from
+    them, so without this an IP or user would get a fresh quota for the rest
+    of the day of the deploy. Earlier days are left to `reconcile_usage`.
+    """
+    ImageAsset = apps.get_model("images", "ImageAsset")
+    UserDailyUsage = apps.get_model("images", "UserDailyUsage")
+    IpDailyUsage = apps.get_model("images", "IpDailyUsage")
+
+    today = timezone.localdate()
+    start = timezone.make_aware(datetime.combine(today, time.min))
+    images = ImageAsset.objects.filter(created_at__gte=start).order_by()
+    totals = {
+        "image_count": Count("id"),
+        "byte_count": Coalesce(Sum("byte_size"), 0),
+        "last_upload_at": Max("created_at"),
+    }
+    IpDailyUsage.objects.bulk_create(
+        [
+            IpDailyUsage(day=today, **row)
+            for row in images.values("uploader_ip").annotate(**totals)
+        ],
+        ignore_conflicts=True,
+    )
+    UserDailyUsage.objects.bulk_create(
+        [
+            UserDailyUsage(day=today, **row)
+            for row in images.exclude(user=None).values("user_id").annotate(**totals)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0010_daily_usage"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_today, migrations.RunPython.noop),
+    ]
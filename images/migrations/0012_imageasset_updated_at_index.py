@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-16 23:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("images", "0011_backfill_today_usage"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="imageasset",
+            index=models.Index(
+                fields=["updated_at"], name="images_imag_updated_dbffb9_idx"
+            ),
+        ),
+    ]
@@ -4,12 +4,68 @@ from django.db import models
 from core.models import PublicIdMixin, TimeStampedModel
 
 
+def blob_path(content_hash: str, ext: str) -> str:
+    """
+    Logical name for a blob, `blobs/<sha256>.<ext>`. The storage backend fans
+    it out by hash prefix (see `core.storage`); use `blob_storage_name()` for
+    the name actually stored.
+    """
+    return f"blobs/{content_hash}{ext.lower()}"
+
+
+def blob_storage_name(storage, content_hash: str, ext: str) -> str:
+    return storage.generate_filename(blob_path(content_hash, ext))
+
+
+class ImageBlob(TimeStampedModel):
+    """
+    Content-addressed file, shared by every ImageAsset with the same bytes.
+    `ref_count` is the number of assets pointing at it; the file is removed
+    when it drops to zero (see `images.services.release_blob`).
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self) -> str:
+        return self.content_hash
+
+
 class ImageAsset(PublicIdMixin, TimeStampedModel):
     """
     Minimal, explicit domain model for uploaded images.
     """
 
-    image = models.ImageField(upload_to="uploads/%Y/%m/%d/")
+    # Nullable only for legacy rows whose file was already missing when blobs
+    # were introduced; new uploads always have one.
+    blob = models.ForeignKey(
+        ImageBlob,
+        on_delete=models.PROTECT,
+        related_name="assets",
+        null=True,
+        blank=True,
+    )
+    # The upload as received, when `blob` holds its optimized version (see
+    # images.optimization): its content hash, and its blob if originals are kept
+    original_hash = models.CharField(max_length=64, blank=True)
+    original_blob = models.ForeignKey(
+        ImageBlob,
+        on_delete=models.PROTECT,
+        related_name="original_of",
+        null=True,
+        blank=True,
+    )
+    # Header metadata captured at upload (NULL/blank until backfilled for
+    # rows that predate it; see `manage.py backfill_image_metadata`)
+    width = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    height = models.PositiveIntegerField(null=True, blank=True, db_index=True)
+    format = models.CharField(max_length=10, blank=True, db_index=True)
+    byte_size = models.PositiveBigIntegerField(null=True, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # 64-bit dHash, stored signed (see images.similarity)
+    perceptual_hash = models.BigIntegerField(null=True, blank=True)
     uploader_ip = models.GenericIPAddressField()
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -22,8 +78,104 @@ class ImageAsset(PublicIdMixin, TimeStampedModel):
     class Meta:
         indexes = [
             models.Index(fields=["uploader_ip", "created_at"]),
+            # Keyset pagination of a user's images (see ImageListView)
+            models.Index(fields=["user", "-created_at", "-id"]),
+            # Keyset pagination of the admin changelist
+            models.Index(fields=["-created_at", "-id"]),
+            # Rows the similarity index re-reads on refresh (images.similarity)
+            models.Index(fields=["updated_at"]),
         ]
         ordering = ["-created_at"]
 
     def __str__(self) -> str:
         return f"{self.public_id}"
+
+    @property
+    def image(self):
+        """The stored file (a FieldFile), or None."""
+        return self.blob.file if self.blob_id else None
+
+    def fit_within(self, max_edge: int):
+        """(width, height) once scaled to fit a `max_edge` box, or None if unknown."""
+        if not self.width or not self.height:
+            return None
+        scale = min(max_edge / max(self.width, self.height), 1.0)
+        return max(round(self.width * scale), 1), max(round(self.height * scale), 1)
+
+
+class DailyUsage(models.Model):
+    """
+    Images uploaded on one (local) day that still exist, and their bytes.
+    Kept in step with ImageAsset by `images.usage`.
+    """
+
+    day = models.DateField()
+    # Signed, so a row that drifted can't make a delete fail
+    image_count = models.IntegerField(default=0)
+    byte_count = models.BigIntegerField(default=0)
+    last_upload_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class UserDailyUsage(DailyUsage):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="daily_usage",
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day"], name="images_userdailyusage_user_day"
+            )
+        ]
+        ordering = ["-day"]
+        verbose_name_plural = "user daily usage"
+
+    def __str__(self) -> str:
+        return f"{self.user_id} {self.day}"
+
+
+class IpDailyUsage(DailyUsage):
+    uploader_ip = models.GenericIPAddressField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["uploader_ip", "day"], name="images_ipdailyusage_ip_day"
+            )
+        ]
+        ordering = ["-day"]
+        verbose_name = "IP daily usage"
+        verbose_name_plural = "IP daily usage"
+
+    def __str__(self) -> str:
+        return f"{self.uploader_ip} {self.day}"
+
+
+class UploadSession(PublicIdMixin, TimeStampedModel):
+    """
+    A resumable upload in progress (see `images.resumable`). Bytes received so
+    far live in a staging file; `offset` is how many of `length` have arrived.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions",
+    )
+    uploader_ip = models.GenericIPAddressField()
+    filename = models.CharField(max_length=255, blank=True)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.public_id} ({self.offset}/{self.length})"
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.length
@@ -0,0 +1,146 @@
+"""
+Optional upload-time optimization (`IMAGE_OPTIMIZATION`, see the settings).
+
+An upload is re-encoded before it is stored: scaled down to fit
+`IMAGE_OPTIMIZE_MAX_EDGE`, turned upright according to its EXIF orientation,
+converted to sRGB, and saved without EXIF or ICC data. The result is WebP
+(lossy, or lossless with `IMAGE_OPTIMIZE_LOSSLESS`) or a progressive,
+optimized JPEG. It replaces the upload only when it is smaller.
+
+Uploads up to `IMAGE_OPTIMIZE_INLINE_MAX_BYTES` are optimized in the request
+(see `images.services.create_image_asset`). Larger ones are stored as they
+are and optimized by the `images.process_upload` job
+(`images.services.optimize_stored_asset`). The original is kept as the
+asset's `original_blob` with `IMAGE_KEEP_ORIGINALS`, and dropped otherwise.
+"""
+
+from __future__ import annotations
+
+import logging
+from io import BytesIO
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+try:
+    from PIL import ImageCms
+except ImportError:  # Pillow built without LittleCMS
+    ImageCms = None
+
+from .inspection import ImageInfo
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_EDGE = 4096
+DEFAULT_QUALITY = 82
+DEFAULT_INLINE_MAX_BYTES = 1024 * 1024
+
+
+class Optimized(NamedTuple):
+    data: bytes
+    format: str
+    width: int
+    height: int
+
+
+def is_enabled() -> bool:
+    return getattr(settings, "IMAGE_OPTIMIZATION", False)
+
+
+def inline_max_bytes() -> int:
+    return getattr(
+        settings, "IMAGE_OPTIMIZE_INLINE_MAX_BYTES", DEFAULT_INLINE_MAX_BYTES
+    )
+
+
+def keep_originals() -> bool:
+    return getattr(settings, "IMAGE_KEEP_ORIGINALS", False)
+
+
+def _save_options(has_alpha: bool):
+    """(format, Pillow save options) for the configured output."""
+    quality = getattr(settings, "IMAGE_OPTIMIZE_QUALITY", DEFAULT_QUALITY)
+    lossless = getattr(settings, "IMAGE_OPTIMIZE_LOSSLESS", False)
+    output_format = getattr(settings, "IMAGE_OPTIMIZE_FORMAT", "WEBP")
+    if output_format == "JPEG" and not (lossless or has_alpha):
+        return "JPEG", {"quality": quality, "optimize": True, "progressive": True}
+    if output_format == "JPEG":
+        # JPEG can neither keep transparency nor be lossless
+        return "PNG", {"optimize": True}
+    if lossless:
+        # For lossless WebP `quality` is the compression effort
+        return "WEBP", {"lossless": True, "quality": 80, "method": 4}
+    return "WEBP", {"quality": quality, "method": 4}
+
+
+def _to_srgb(image: Image.Image) -> Image.Image:
+    icc_profile = image.info.get("icc_profile")
+    if not icc_profile or ImageCms is None or image.mode not in ("RGB", "RGBA"):
+        return image
+    try:
+        source = ImageCms.ImageCmsProfile(BytesIO(icc_profile))
+        srgb = ImageCms.createProfile("sRGB")
+        return ImageCms.profileToProfile(source, srgb, image, outputMode=image.mode)
+    except (OSError, ImageCms.PyCMSError):
+        # Without a usable profile the pixels are taken to be sRGB already
+        return image
+
+
+def optimize(source, byte_size: int) -> Optional[Optimized]:
+    """
+    Optimized encoding of `source` (a path or file object of `byte_size`
+    bytes), or None when it would not be smaller. Animations are left alone,
+    and so are files Pillow fails to decode.
+    """
+    try:
+        return _optimize(source, byte_size)
+    except OSError:
+        logger.warning("Could not optimize an image; storing it as is", exc_info=True)
+        return None
+
+
+def _optimize(source, byte_size: int) -> Optional[Optimized]:
+    max_edge = getattr(settings, "IMAGE_OPTIMIZE_MAX_EDGE", DEFAULT_MAX_EDGE)
+    with Image.open(source) as image:
+        if getattr(image, "n_frames", 1) > 1:
+            return None
+        if max_edge:
+            # No-op for formats without draft support
+            image.draft("RGB", (max_edge * 2, max_edge * 2))
+        # Applies the orientation to the pixels, so the tag can go
+        image = ImageOps.exif_transpose(image)
+        if max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        image = _to_srgb(image)
+        output_format, options = _save_options(has_alpha)
+        if output_format == "JPEG":
+            image = image.convert("RGB")
+        # Leave EXIF, ICC and every other ancillary chunk behind
+        image.info = {}
+
+        out = BytesIO()
+        image.save(out, output_format, **options)
+    data = out.getvalue()
+    if len(data) >= byte_size:
+        return None
+    return Optimized(data, output_format, image.width, image.height)
+
+
+def as_upload(result: Optimized, original_hash: str) -> ContentFile:
+    """
+    `result` as a file that `images.services` stores like an inspected
+    upload. `original_hash` is the content hash of the upload it replaces.
+    """
+    f = ContentFile(result.data, name=f"optimized.{result.format.lower()}")
+    f.image_format = result.format
+    f.image_info = ImageInfo(
+        result.width, result.height, result.format, len(result.data), None
+    )
+    f.original_hash = original_hash
+    return f
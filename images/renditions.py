@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+try:
+    import fcntl
+except ImportError:  # Windows: the size record is only locked per process
+    fcntl = None
+
+DEFAULT_PRESETS = {
+    "thumb": 200,
+    "medium": 800,
+}
+
+# Output format -> (file extension, content type, Pillow save options)
+OUTPUT_FORMATS = {
+    "WEBP": (".webp", "image/webp", {"quality": 80, "method": 4}),
+    "JPEG": (
+        ".jpg",
+        "image/jpeg",
+        {"quality": 82, "optimize": True, "progressive": True},
+    ),
+    "PNG": (".png", "image/png", {"optimize": True}),
+}
+
+
+def get_presets() -> Dict[str, int]:
+    """Preset name -> longest edge in pixels."""
+    return getattr(settings, "IMAGE_RENDITION_PRESETS", DEFAULT_PRESETS)
+
+
+def negotiate_format(accept: str) -> str:
+    """WebP for clients that advertise it, JPEG otherwise."""
+    return "WEBP" if "image/webp" in (accept or "") else "JPEG"
+
+
+def render(source, max_edge: int, output_format: str) -> Tuple[bytes, str]:
+    """
+    Resize `source` (a path or file object) to fit in `max_edge` and encode it.
+    Returns the encoded bytes and the format actually used.
+    JPEG sources are decoded in draft mode, so the decoder only produces a
+    DCT-scaled image close to the target size instead of the full bitmap.
+    """
+    with Image.open(source) as image:
+        # No-op for formats without draft support
+        image.draft("RGB", (max_edge * 2, max_edge * 2))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        if output_format == "JPEG" and has_alpha:
+            # Keep transparency for clients without WebP support
+            output_format = "PNG"
+        if output_format == "JPEG":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        _, _, options = OUTPUT_FORMATS[output_format]
+        out = BytesIO()
+        image.save(out, output_format, **options)
+        return out.getvalue(), output_format
+
+
+class RenditionCache:
+    """
+    Size-bounded on-disk LRU cache of rendered variants.
+
+    Recency is tracked through file mtimes (touched on every hit), so it
+    survives restarts and is shared by all workers using the same directory.
+    So is the size: a `.size` file in the directory, updated under an
+    exclusive lock by every write, holds the total (scanned once, and again
+    on every eviction). When it crosses `max_bytes`, the least recently used
+    files are removed until the cache is back under `low_water` of the limit.
+    """
+
+    SIZE_FILE = ".size"
+
+    def __init__(self, directory: str, max_bytes: int, low_water: float = 0.9):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+
+    def path_for(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}{ext}")
+
+    def get(self, key: str, ext: str) -> Optional[str]:
+        path = self.path_for(key, ext)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, ext: str, data: bytes) -> str:
+        path = self.path_for(key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+
+        with self._size_record() as record:
+            size = record.read()
+            # First write to the directory: count what is there, this included
+            size = int(size) + len(data) if size.isdigit() else self.scan_size()
+            if size > self.max_bytes:
+                size = self.evict(int(self.max_bytes * self.low_water))
+            record.seek(0)
+            record.truncate()
+            record.write(str(size))
+        return path
+
+    @contextmanager
+    def _size_record(self):
+        """The `.size` file, locked against every process sharing the cache."""
+        fd = os.open(
+            os.path.join(self.directory, self.SIZE_FILE), os.O_RDWR | os.O_CREAT
+        )
+        with self._lock, os.fdopen(fd, "r+") as record:
+            if fcntl is not None:
+                fcntl.flock(record.fileno(), fcntl.LOCK_EX)
+            yield record
+
+    def _entries(self):
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    yield entry
+
+    def scan_size(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(entry.stat().st_size for entry in self._entries())
+
+    def evict(self, target_bytes: int) -> int:
+        """Remove least recently used files until at most `target_bytes` remain."""
+        entries = []
+        for entry in self._entries():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= target_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+_cache: Optional[RenditionCache] = None
+
+
+def get_cache() -> RenditionCache:
+    global _cache
+    directory = str(settings.RENDITION_CACHE_DIR)
+    if _cache is None or _cache.directory != directory:
+        _cache = RenditionCache(directory, settings.RENDITION_CACHE_MAX_BYTES)
+    return _cache
+
+
+def get_rendition(blob, preset: str, output_format: str) -> Tuple[str, str]:
+    """
+    Return `(path, content_type)` of `blob` rendered with `preset`, generating
+    and caching it on first use. Keyed by content hash, so duplicate uploads
+    share renditions. Raises KeyError for unknown presets.
+    """
+    max_edge = get_presets()[preset]
+    cache = get_cache()
+
+    # PNG is only ever chosen by render() as a JPEG fallback; check both
+    candidates = [output_format] + (["PNG"] if output_format == "JPEG" else [])
+    for candidate in candidates:
+        ext, content_type, _ = OUTPUT_FORMATS[candidate]
+        path = cache.get(f"{blob.content_hash}-{preset}", ext)
+        if path:
+            return path, content_type
+
+    with blob.file.open("rb") as source:
+        data, produced = render(source, max_edge, output_format)
+    ext, content_type, _ = OUTPUT_FORMATS[produced]
+    return cache.put(f"{blob.content_hash}-{preset}", ext, data), content_type
@@ -0,0 +1,256 @@
+"""
+Resumable (tus-style) uploads.
+
+A client opens a session with the total size, sends the bytes as a series of
+PATCH requests at explicit offsets, asks for the current offset after a
+dropped connection, and finalizes once everything has arrived. Chunks are
+appended to a staging file next to MEDIA_ROOT, so finalizing renames it into
+blob storage instead of copying it. A PATCH holds an exclusive lock on that
+file while it writes, so of two PATCHes at the same offset one gets a 409.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+from datetime import timedelta
+from typing import Iterable, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: PATCHes are not serialized across processes
+    fcntl = None
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.utils import timezone
+
+from core.utils import validate_image_size
+
+from . import similarity
+from .inspection import InspectionError, inspect_image
+from .models import ImageAsset, UploadSession
+from .services import create_image_asset
+from .uploadhandlers import (
+    IMAGE_MIME_TYPES,
+    SNIFF_BYTES,
+    get_staging_dir,
+    sniff_image_format,
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """A request that the session cannot accept; `status_code` says why."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def session_ttl() -> timedelta:
+    return timedelta(seconds=getattr(settings, "UPLOAD_SESSION_TTL_SECONDS", 86400))
+
+
+def staging_path(session: UploadSession) -> str:
+    return os.path.join(get_staging_dir(), f"{session.public_id}.part")
+
+
+def create_session(
+    user, uploader_ip: str, length: int, filename: str = ""
+) -> UploadSession:
+    max_size = getattr(settings, "MAX_UPLOAD_SIZE", 5 * 1024 * 1024)
+    if length <= 0:
+        raise UploadError("Upload-Length must be a positive integer.")
+    if length > max_size:
+        raise UploadError(
+            f"File too large. Max size is {max_size // (1024 * 1024)} MB.", 413
+        )
+    session = UploadSession.objects.create(
+        user=user,
+        uploader_ip=uploader_ip,
+        filename=os.path.basename(filename)[:255],
+        length=length,
+        expires_at=timezone.now() + session_ttl(),
+    )
+    open(staging_path(session), "wb").close()
+    return session
+
+
+def _check_offset(session: UploadSession, offset: int) -> None:
+    if offset != session.offset:
+        raise UploadError(
+            f"Upload-Offset {offset} does not match the current offset {session.offset}.",
+            409,
+        )
+
+
+def _lock(fh) -> bool:
+    """Lock an open staging file for writing, without waiting. False if taken."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def append_chunk(session: UploadSession, offset: int, stream: Iterable[bytes]) -> int:
+    """
+    Write `stream` to the staging file at `offset`, which must be the number
+    of bytes received so far, and return the new offset.
+    """
+    _check_offset(session, offset)
+
+    path = staging_path(session)
+    written = 0
+    try:
+        # The lock is released when the file is closed, after the offset is saved
+        with open(path, "r+b") as fh:
+            if not _lock(fh):
+                raise UploadError("Another request is writing to this upload.", 409)
+            # A writer that held the lock until just now has moved the offset
+            current = (
+                UploadSession.objects.filter(pk=session.pk)
+                .values_list("offset", flat=True)
+                .first()
+            )
+            if current is None:
+                raise UploadError("Upload session no longer exists.", 404)
+            session.offset = current
+            _check_offset(session, offset)
+
+            fh.seek(offset)
+            try:
+                for data in stream:
+                    if offset + written + len(data) > session.length:
+                        raise UploadError("Chunk runs past Upload-Length.", 413)
+                    if offset == 0 and written == 0 and len(data) >= SNIFF_BYTES:
+                        if sniff_image_format(data) is None:
+                            raise UploadError(
+                                "Unsupported file type. "
+                                "Upload a JPEG, PNG, GIF or WebP image.",
+                                415,
+                            )
+                    fh.write(data)
+                    written += len(data)
+            finally:
+                # Keep whatever arrived before a dropped connection or a bad
+                # chunk
+                fh.flush()
+                if written:
+                    _save_offset(session, offset, offset + written)
+    except FileNotFoundError:
+        raise UploadError("Upload session has no staging file.", 404)
+    return session.offset
+
+
+def _save_offset(session: UploadSession, offset: int, new_offset: int) -> None:
+    # Conditional, in case a writer got in on a platform without file locks
+    if UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+        offset=new_offset,
+        expires_at=timezone.now() + session_ttl(),
+        updated_at=timezone.now(),
+    ):
+        session.offset = new_offset
+
+
+class StagedFile(UploadedFile):
+    """A finished resumable upload, presented like a streamed multipart file."""
+
+    def __init__(self, path: str, name: str, size: int):
+        super().__init__(open(path, "rb"), name or "upload", None, size, None)
+        self.path = path
+        self.sha256: Optional[str] = None
+        self.image_format: Optional[str] = None
+
+    def temporary_file_path(self) -> str:
+        # FileSystemStorage moves files that have one instead of copying them
+        return self.path
+
+
+def _describe(f: StagedFile) -> None:
+    hasher = hashlib.sha256()
+    head = b""
+    for data in f.chunks(CHUNK_SIZE):
+        if len(head) < SNIFF_BYTES:
+            head += data[:SNIFF_BYTES]
+        hasher.update(data)
+    f.seek(0)
+    f.sha256 = hasher.hexdigest()
+    f.image_format = sniff_image_format(head)
+
+
+def finalize_session(session: UploadSession) -> ImageAsset:
+    """
+    Turn a complete session into an ImageAsset. The caller holds the quota
+    slot. Invalid content ends the session (its bytes can never become
+    valid); `UploadError` with 409 means more bytes are still expected.
+    """
+    if not session.is_complete:
+        raise UploadError(
+            f"Upload incomplete: {session.offset} of {session.length} bytes.", 409
+        )
+
+    path = staging_path(session)
+    if not os.path.exists(path):
+        raise UploadError("Upload session has no staging file.", 404)
+    staged = StagedFile(path, session.filename, session.length)
+    try:
+        _describe(staged)
+        if staged.image_format is None:
+            raise InspectionError(
+                "Unsupported file type. Upload a JPEG, PNG, GIF or WebP image."
+            )
+        staged.content_type = IMAGE_MIME_TYPES[staged.image_format]
+        staged.image_info = inspect_image(staged, staged.sha256)
+        validate_image_size(staged)
+        similarity.validate_not_near_duplicate(staged, session.user)
+    except (InspectionError, ValidationError) as exc:
+        staged.close()
+        discard_session(session)
+        message = exc.messages[0] if isinstance(exc, ValidationError) else str(exc)
+        raise UploadError(message, 400) from exc
+
+    try:
+        with transaction.atomic():
+            # Deleting the row claims the session, so a concurrent finalize
+            # of the same upload stops here instead of creating a duplicate
+            if not UploadSession.objects.filter(pk=session.pk).delete()[0]:
+                raise UploadError("Upload already finalized.", 409)
+            image_obj = create_image_asset(
+                staged, uploader_ip=session.uploader_ip, user=session.user
+            )
+    finally:
+        staged.close()
+    # Gone already if it was moved into storage; left over if the content
+    # was a duplicate of an existing blob
+    _remove_staging_file(session)
+    return image_obj
+
+
+def _remove_staging_file(session: UploadSession) -> None:
+    try:
+        os.remove(staging_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def discard_session(session: UploadSession) -> None:
+    """Delete a session and whatever is left of its staging file."""
+    _remove_staging_file(session)
+    session.delete()
+
+
+def expire_sessions(now=None) -> int:
+    """Discard sessions nobody has written to within the TTL; returns how many."""
+    expired = UploadSession.objects.filter(expires_at__lt=now or timezone.now())
+    count = 0
+    for session in expired.iterator():
+        discard_session(session)
+        count += 1
+    return count
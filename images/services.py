@@ -1,36 +1,389 @@
 from __future__ import annotations
 
-from datetime import date, timedelta
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from django.db.models import Count
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.utils import timezone
 
-from .models import ImageAsset
+from core import metrics
+from core.ratelimit import (
+    FixedWindowLimiter,
+    Reservation,
+    SlidingWindowLimiter,
+)
 
+from jobs.queue import enqueue_many
 
-def is_daily_quota_exceeded(ip: str, max_uploads: int = 10) -> bool:
+from . import optimization, similarity, usage
+from .cleanup import schedule_sweep
+from .inspection import inspect_image
+from .models import ImageAsset, ImageBlob, blob_storage_name
+
+DEFAULT_MAX_UPLOADS = 10
+
+
+def _count_uploads(ip: str, start: datetime, end: datetime) -> int:
+    """Seed for a cold counter: only runs once per IP and window."""
+    return ImageAsset.objects.filter(
+        uploader_ip=ip, created_at__gte=start, created_at__lt=end
+    ).count()
+
+
+def _count_uploads_on_day(ip: str, start: datetime, end: datetime) -> int:
+    """`_count_uploads` for a calendar day, read from the IP's usage row."""
+    return usage.ip_usage(ip, timezone.localdate(start)).images
+
+
+def _calendar_day(now: datetime) -> Tuple[datetime, datetime]:
+    start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, start + timedelta(days=1)
+
+
+def daily_upload_limiter(max_uploads: int = DEFAULT_MAX_UPLOADS) -> FixedWindowLimiter:
+    """Per-IP quota that resets at local midnight."""
+    return FixedWindowLimiter(
+        "upload-daily", max_uploads, window=_calendar_day, seed=_count_uploads_on_day
+    )
+
+
+def rolling_upload_limiter(
+    max_uploads: int = DEFAULT_MAX_UPLOADS,
+) -> SlidingWindowLimiter:
+    """Per-IP quota over the trailing 24 hours (sliding-window counter)."""
+    return SlidingWindowLimiter(
+        "upload-24h", max_uploads, period=timedelta(hours=24), seed=_count_uploads
+    )
+
+
+UPLOAD_LIMITERS = {
+    "daily": daily_upload_limiter,
+    "24h": rolling_upload_limiter,
+}
+
+
+def upload_limiter():
+    """The limiter selected by `UPLOAD_QUOTA_POLICY` / `UPLOAD_QUOTA_PER_IP`."""
+    policy = getattr(settings, "UPLOAD_QUOTA_POLICY", "daily")
+    max_uploads = getattr(settings, "UPLOAD_QUOTA_PER_IP", DEFAULT_MAX_UPLOADS)
+    return UPLOAD_LIMITERS[policy](max_uploads)
+
+
+def is_daily_quota_exceeded(ip: str, max_uploads: int = DEFAULT_MAX_UPLOADS) -> bool:
     """
     Returns True if the given IP has reached its daily upload quota (resets at midnight).
     This is the simpler version (per calendar day).
     """
-    today = date.today()
-    return (
-        ImageAsset.objects.filter(uploader_ip=ip, created_at__date=today).aggregate(
-            count=Count("id")
-        )["count"]
-        >= max_uploads
-    )
+    return daily_upload_limiter(max_uploads).is_exceeded(ip)
 
 
-def is_24h_quota_exceeded(ip: str, max_uploads: int = 10) -> bool:
+def is_24h_quota_exceeded(ip: str, max_uploads: int = DEFAULT_MAX_UPLOADS) -> bool:
     """
     Returns True if the given IP has reached its quota within the *last 24 hours*.
     This is stricter and not tied to calendar reset.
     """
-    window_start = timezone.now() - timedelta(hours=24)
-    return (
-        ImageAsset.objects.filter(
-            uploader_ip=ip, created_at__gte=window_start
-        ).aggregate(count=Count("id"))["count"]
-        >= max_uploads
+    return rolling_upload_limiter(max_uploads).is_exceeded(ip)
+
+
+def is_upload_quota_exceeded(ip: str) -> bool:
+    """Cheap pre-check against the configured policy; does not take a slot."""
+    exceeded = upload_limiter().is_exceeded(ip)
+    if exceeded:
+        metrics.inc("quota_rejections_total")
+    return exceeded
+
+
+def reserve_upload_slot(ip: str, count: int = 1) -> Optional[Reservation]:
+    """
+    Atomically take `count` upload slots for `ip` under the configured policy.
+    Returns None if the quota would be exceeded. Pass the reservation to
+    `release_upload_slot()` if the upload does not go through.
+    """
+    reservation = upload_limiter().reserve(ip, count)
+    if reservation is None:
+        metrics.inc("quota_rejections_total", count)
+    return reservation
+
+
+def release_upload_slot(reservation: Optional[Reservation]) -> None:
+    upload_limiter().release(reservation)
+
+
+def _content_hash(uploaded_file) -> str:
+    # Streamed uploads arrive pre-hashed (see StreamingImageUploadHandler)
+    content_hash = getattr(uploaded_file, "sha256", None)
+    if content_hash:
+        return content_hash
+    hasher = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        hasher.update(chunk)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+def _blob_ext(uploaded_file) -> str:
+    image_format = getattr(uploaded_file, "image_format", None)
+    if image_format:
+        return ".jpg" if image_format == "JPEG" else f".{image_format.lower()}"
+    return os.path.splitext(uploaded_file.name or "")[1]
+
+
+def acquire_blob(uploaded_file) -> ImageBlob:
+    """
+    Return the blob for `uploaded_file`'s content with one more reference taken.
+    Only the first upload of some content writes a file; later ones just bump
+    the reference count.
+
+    Must run inside a transaction. The row is inserted before the file is
+    written, so a concurrent upload of the same content waits on the unique
+    index and never sees a blob whose file is missing.
+    """
+    content_hash = _content_hash(uploaded_file)
+
+    for _ in range(3):
+        if ImageBlob.objects.filter(content_hash=content_hash).update(
+            ref_count=F("ref_count") + 1
+        ):
+            return ImageBlob.objects.get(content_hash=content_hash)
+
+        storage = ImageBlob._meta.get_field("file").storage
+        name = blob_storage_name(storage, content_hash, _blob_ext(uploaded_file))
+        try:
+            with transaction.atomic():
+                blob = ImageBlob.objects.create(
+                    content_hash=content_hash,
+                    file=name,
+                    size=uploaded_file.size,
+                    ref_count=1,
+                )
+        except IntegrityError:
+            # Lost the race to create it; take a reference on the winner's row
+            continue
+
+        # A leftover file with this name necessarily has this content
+        if not storage.exists(name):
+            blob.file.name = storage.save(name, uploaded_file)
+            if blob.file.name != name:
+                blob.save(update_fields=["file"])
+        return blob
+
+    raise RuntimeError(f"Could not acquire blob {content_hash}")
+
+
+def release_blob(blob_id: int) -> None:
+    """
+    Drop one reference to a blob. A blob left with none is deleted, row and
+    file, by a worker after commit (see images.cleanup), so deleting an image
+    never waits on storage. Must run inside a transaction.
+    """
+    ImageBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(
+        ref_count=F("ref_count") - 1
     )
+    if ImageBlob.objects.filter(pk=blob_id, ref_count=0).exists():
+        schedule_sweep()
+
+
+def _upload_info(uploaded_file):
+    return getattr(uploaded_file, "image_info", None) or inspect_image(uploaded_file)
+
+
+def _prepare_upload(uploaded_file) -> Tuple[object, Optional[object]]:
+    """
+    `(file to store, original to keep or None)` for an upload. The file is its
+    optimized version (see images.optimization) when optimization is on, the
+    upload is small enough to optimize in the request and the result is
+    smaller; otherwise the upload itself. Either carries the upload's
+    perceptual hash if near-duplicate validation computed one. Runs outside
+    any transaction.
+    """
+    if not optimization.is_enabled():
+        return uploaded_file, None
+    info = _upload_info(uploaded_file)
+    uploaded_file.image_info = info
+    if info.byte_size > optimization.inline_max_bytes():
+        # Left to the images.process_upload job
+        return uploaded_file, None
+    result = optimization.optimize(uploaded_file, info.byte_size)
+    uploaded_file.seek(0)
+    if result is None:
+        return uploaded_file, None
+    optimized = optimization.as_upload(result, _content_hash(uploaded_file))
+    if hasattr(uploaded_file, "perceptual_hash"):
+        optimized.perceptual_hash = uploaded_file.perceptual_hash
+    return optimized, uploaded_file if optimization.keep_originals() else None
+
+
+def _new_asset(uploaded_file, uploader_ip: str, user=None, original=None) -> ImageAsset:
+    """
+    Unsaved ImageAsset for an upload, holding a reference to its blob (and to
+    the blob of `original`, the upload it was optimized from, if given).
+    """
+    info = _upload_info(uploaded_file)
+    # Only hashed in the request to reject near duplicates; otherwise the
+    # images.process_upload job does it (see hash_stored_asset)
+    phash = getattr(uploaded_file, "perceptual_hash", None)
+    blob = acquire_blob(uploaded_file)
+    return ImageAsset(
+        blob=blob,
+        original_blob=acquire_blob(original) if original is not None else None,
+        original_hash=getattr(uploaded_file, "original_hash", ""),
+        perceptual_hash=similarity.to_db(phash) if phash is not None else None,
+        width=info.width,
+        height=info.height,
+        format=info.format,
+        byte_size=info.byte_size,
+        content_hash=blob.content_hash,
+        uploader_ip=uploader_ip,
+        user=user,
+    )
+
+
+def create_image_asset(uploaded_file, uploader_ip: str, user=None) -> ImageAsset:
+    """
+    Store an upload (deduplicated by content, optimized if configured) and
+    create its ImageAsset, recording the header metadata found by the upload
+    form.
+    """
+    stored, original = _prepare_upload(uploaded_file)
+    with transaction.atomic():
+        image_obj = _new_asset(stored, uploader_ip, user, original)
+        image_obj.save()
+    metrics.inc("upload_bytes_total", image_obj.byte_size)
+    return image_obj
+
+
+def create_image_assets(
+    uploaded_files, uploader_ip: str, user=None
+) -> List[ImageAsset]:
+    """
+    Batch version of `create_image_asset`: one transaction and a single
+    INSERT for all the assets (and one for their processing jobs).
+    """
+    prepared = [_prepare_upload(f) for f in uploaded_files]
+    with transaction.atomic():
+        assets = [
+            _new_asset(stored, uploader_ip, user, original)
+            for stored, original in prepared
+        ]
+        ImageAsset.objects.bulk_create(assets)
+        # bulk_create() sends no post_save, so do what images.signals would
+        usage.record_uploads(assets)
+        payloads = [{"public_id": str(a.public_id)} for a in assets]
+        transaction.on_commit(lambda: enqueue_many("images.process_upload", payloads))
+        if user is not None:
+            transaction.on_commit(lambda: bump_collection_version(user.pk))
+    metrics.inc("upload_bytes_total", sum(a.byte_size for a in assets))
+    return assets
+
+
+def optimize_stored_asset(image_obj: ImageAsset) -> bool:
+    """
+    Optimize an upload that was too large to optimize in its request (see
+    images.optimization) and move the asset onto the smaller blob. Returns
+    whether it did.
+    """
+    blob = image_obj.blob
+    if (
+        not optimization.is_enabled()
+        or blob is None
+        or image_obj.original_hash
+        or blob.size <= optimization.inline_max_bytes()
+    ):
+        return False
+    with blob.file.open("rb") as source:
+        result = optimization.optimize(source, blob.size)
+    if result is None:
+        return False
+    optimized = optimization.as_upload(result, blob.content_hash)
+
+    with transaction.atomic():
+        # Skip it if it was deleted or optimized while we were encoding
+        locked = (
+            ImageAsset.objects.select_for_update()
+            .filter(pk=image_obj.pk, blob_id=blob.pk, original_hash="")
+            .first()
+        )
+        if locked is None:
+            return False
+        new_blob = acquire_blob(optimized)
+        if optimization.keep_originals():
+            # The asset's reference to the old blob carries over
+            locked.original_blob = blob
+        else:
+            release_blob(blob.pk)
+        locked.blob = new_blob
+        locked.original_hash = blob.content_hash
+        locked.width = result.width
+        locked.height = result.height
+        locked.format = result.format
+        locked.byte_size = new_blob.size
+        locked.content_hash = new_blob.content_hash
+        locked.save()
+        usage.record_resize(locked, blob.size)
+    image_obj.refresh_from_db()
+    return True
+
+
+def hash_stored_asset(image_obj: ImageAsset) -> bool:
+    """
+    Store the perceptual hash of an image uploaded without one and add it to
+    this process's similarity index (other processes pick it up on their next
+    refresh). Returns whether it did.
+    """
+    blob = image_obj.blob
+    if image_obj.perceptual_hash is not None or blob is None:
+        return False
+    try:
+        with blob.file.open("rb") as source:
+            value = similarity.perceptual_hash(source)
+    except OSError:
+        # Not decodable: it stays out of the index, as it would have when
+        # hashed in the request
+        return False
+    stored = similarity.to_db(value)
+    # updated_at is how other processes' indexes find rows hashed late
+    if not ImageAsset.objects.filter(
+        pk=image_obj.pk, perceptual_hash__isnull=True
+    ).update(perceptual_hash=stored, updated_at=timezone.now()):
+        return False
+    image_obj.perceptual_hash = stored
+    similarity.remember(image_obj.pk, value, image_obj.user_id)
+    return True
+
+
+def _collection_version_key(user_id: int) -> str:
+    return f"images:collection-version:{user_id}"
+
+
+def get_collection_version(user_id: int) -> str:
+    """
+    Opaque token that changes whenever the user's image collection changes.
+    A missing (evicted) token is replaced by a fresh one, which only costs
+    clients a full response.
+    """
+    key = _collection_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, str(time.time_ns()), None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_collection_version(user_id: int) -> str:
+    """Async version of `get_collection_version`."""
+    key = _collection_version_key(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, str(time.time_ns()), None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_collection_version(user_id: int) -> None:
+    cache.set(_collection_version_key(user_id), str(time.time_ns()), None)
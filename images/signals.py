@@ -0,0 +1,69 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from jobs.queue import enqueue_on_commit
+
+from . import fragments, similarity, usage
+from .models import ImageAsset
+from .services import bump_collection_version, release_blob
+
+
+@receiver(post_save, sender=ImageAsset)
+def enqueue_upload_processing(
+    sender, instance: ImageAsset, created: bool, **kwargs
+) -> None:
+    """Hand post-upload work to the job queue once the upload has committed."""
+    if created:
+        enqueue_on_commit("images.process_upload", public_id=str(instance.public_id))
+
+
+@receiver(post_delete, sender=ImageAsset)
+def release_asset_blob(sender, instance: ImageAsset, **kwargs) -> None:
+    """
+    Drop the asset's blob references (its file and any kept original) however
+    it was deleted (view, admin, queryset delete or a cascade from its user).
+    Runs inside the delete's transaction.
+    """
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+    if instance.original_blob_id:
+        release_blob(instance.original_blob_id)
+
+
+@receiver(post_save, sender=ImageAsset)
+@receiver(post_delete, sender=ImageAsset)
+def bump_owner_collection_version(sender, instance: ImageAsset, **kwargs) -> None:
+    """
+    Invalidate the owner's cached list pages (see ImageListView). Bumped after
+    commit so a concurrent reader can't pair the new version with old rows.
+    """
+    if instance.user_id:
+        user_id = instance.user_id
+        transaction.on_commit(lambda: bump_collection_version(user_id))
+
+
+@receiver(post_delete, sender=ImageAsset)
+def forget_cached_cards(sender, instance: ImageAsset, **kwargs) -> None:
+    """Drop the image's cached HTML cards (see images.fragments) after commit."""
+    transaction.on_commit(lambda: fragments.forget(instance))
+
+
+@receiver(post_delete, sender=ImageAsset)
+def forget_perceptual_hash(sender, instance: ImageAsset, **kwargs) -> None:
+    """Drop the image from this process's similarity index after commit."""
+    pk = instance.pk
+    transaction.on_commit(lambda: similarity.forget(pk))
+
+
+@receiver(post_save, sender=ImageAsset)
+def count_upload_usage(sender, instance: ImageAsset, created: bool, **kwargs) -> None:
+    """Add a new image to its user's and IP's usage, in the upload's transaction."""
+    if created:
+        usage.record_uploads([instance])
+
+
+@receiver(post_delete, sender=ImageAsset)
+def uncount_deleted_usage(sender, instance: ImageAsset, **kwargs) -> None:
+    """Take a deleted image off its user's and IP's usage, in its transaction."""
+    usage.record_delete(instance)
@@ -0,0 +1,396 @@
+"""
+Near-duplicate detection with perceptual hashes.
+
+Every upload gets a 64-bit difference hash (dHash) of a 9x8 grayscale
+downsample. Re-encoded, resized or lightly edited copies of a picture hash
+within a few bits of each other, so "near duplicate" means a small Hamming
+distance. The hash is stored on `ImageAsset.perceptual_hash`, which is signed
+like the database's bigint.
+
+`SimilarityIndex` keeps every hash in memory, one per process. It is a
+multi-index hashing table: a hash is split into three chunks of 21-22 bits
+(about log2 of a few million, so most buckets hold an image or none), and
+each chunk value has a bucket of images. Two hashes within `r` bits of each
+other are within `r // 3` bits on one of the first `r % 3 + 1` chunks or
+within `r // 3 - 1` bits on one of the others, so a search probes a few
+hundred buckets and checks only their images. Wider searches scan every hash
+instead, with NumPy if it is installed.
+
+The index is loaded from the database in chunks the first time it is used
+(by `core.warmup` before gunicorn forks its workers), and later catches up
+on rows added since (`SIMILARITY_INDEX_REFRESH_SECONDS`): those past the
+highest primary key loaded, plus any updated within REFRESH_OVERLAP_SECONDS
+before the previous refresh. That catches rows whose transaction committed
+after a higher key had already been loaded, and rows hashed after the
+upload by the images.process_upload job (uploads are only hashed in the
+request when near duplicates are rejected). Deletes in this
+process leave it at once; candidates are checked against the database, so
+images deleted elsewhere never come back.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:  # Wide searches fall back to a Python loop
+    numpy = None
+
+from .models import ImageAsset
+
+HASH_BITS = 64
+CHUNK_BITS = (22, 21, 21)
+CHUNKS = len(CHUNK_BITS)
+# Beyond this many differing bits per chunk, probing buckets costs more than
+# a scan of every hash
+MAX_PROBE_BITS = 3
+
+DEFAULT_MAX_DISTANCE = 6
+DEFAULT_REFRESH_SECONDS = 5
+LOAD_CHUNK_SIZE = 10_000
+# Longest a row's transaction may stay open and still be picked up
+REFRESH_OVERLAP_SECONDS = 60
+
+# What ImageOps.exif_transpose() does for each EXIF orientation
+_ORIENTATION = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def to_db(value: int) -> int:
+    """An unsigned 64-bit hash as the signed value a bigint column holds."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_db(value: int) -> int:
+    return value & ((1 << HASH_BITS) - 1)
+
+
+def perceptual_hash(source) -> int:
+    """
+    dHash of an image (a path or file object): one bit per pair of
+    horizontally adjacent pixels of its upright, 9x8 grayscale downsample,
+    set where the left one is brighter.
+    """
+    with Image.open(source) as image:
+        orientation = image.getexif().get(0x0112, 1)
+        # JPEGs decode straight to a fraction of their size
+        image.draft("L", (64, 64))
+        gray = image.convert("L")
+    gray.thumbnail((128, 128))
+    if orientation in _ORIENTATION:
+        gray = gray.transpose(_ORIENTATION[orientation])
+    pixels = list(gray.resize((9, 8), Image.Resampling.LANCZOS).getdata())
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            value = (value << 1) | (left > pixels[row * 9 + col + 1])
+    return value
+
+
+def hash_upload(uploaded_file) -> Optional[int]:
+    """
+    Perceptual hash of an upload, kept on the file as `perceptual_hash` so
+    the upload path computes it once. None if Pillow cannot decode it.
+    """
+    if not hasattr(uploaded_file, "perceptual_hash"):
+        source = (
+            uploaded_file.temporary_file_path()
+            if hasattr(uploaded_file, "temporary_file_path")
+            else uploaded_file
+        )
+        try:
+            uploaded_file.perceptual_hash = perceptual_hash(source)
+        except OSError:
+            uploaded_file.perceptual_hash = None
+        finally:
+            uploaded_file.seek(0)
+    return uploaded_file.perceptual_hash
+
+
+def _chunks(value: int) -> List[int]:
+    chunks = []
+    for bits in CHUNK_BITS:
+        chunks.append(value & ((1 << bits) - 1))
+        value >>= bits
+    return chunks
+
+
+def _masks(bits: int) -> List[List[int]]:
+    """XOR masks of a chunk of `bits` bits, by how many bits they flip."""
+    return [
+        [sum(1 << bit for bit in flipped) for flipped in combinations(range(bits), n)]
+        for n in range(MAX_PROBE_BITS + 1)
+    ]
+
+
+# Per chunk width
+_PROBES = {bits: _masks(bits) for bits in set(CHUNK_BITS)}
+
+
+class SimilarityIndex:
+    """In-memory perceptual hashes of images, by primary key (see above)."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # pk -> (hash, user id)
+        self._entries: Dict[int, Tuple[int, Optional[int]]] = {}
+        self._buckets: List[Dict[int, Set[int]]] = [{} for _ in range(CHUNKS)]
+        # Column arrays for NumPy scans, rebuilt after a change
+        self._arrays = None
+        self._last_pk = 0
+        self._refreshed_at: Optional[float] = None
+        # Rows updated since then are read again, in case they committed (or
+        # were hashed) late
+        self._recheck_since: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, pk: int, value: int, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            self.discard(pk)
+            self._entries[pk] = (value, user_id)
+            for bucket, chunk in zip(self._buckets, _chunks(value)):
+                bucket.setdefault(chunk, set()).add(pk)
+            self._arrays = None
+
+    def discard(self, pk: int) -> None:
+        with self._lock:
+            entry = self._entries.pop(pk, None)
+            if entry is None:
+                return
+            for bucket, chunk in zip(self._buckets, _chunks(entry[0])):
+                members = bucket[chunk]
+                members.discard(pk)
+                if not members:
+                    del bucket[chunk]
+            self._arrays = None
+
+    def search(
+        self, value: int, max_distance: int, user_id: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """
+        `(pk, distance)` of every image within `max_distance` bits of
+        `value` (only `user_id`'s if given), nearest first.
+        """
+        with self._lock:
+            if max_distance // CHUNKS > MAX_PROBE_BITS:
+                hits = self._scan(value, max_distance, user_id)
+            else:
+                hits = self._probe(value, max_distance, user_id)
+        return sorted(hits, key=lambda hit: (hit[1], hit[0]))
+
+    def _probe(self, value, max_distance, user_id):
+        radius, extra = divmod(max_distance, CHUNKS)
+        seen: Set[int] = set()
+        hits = []
+        for i, (bucket, chunk) in enumerate(zip(self._buckets, _chunks(value))):
+            chunk_radius = radius if i <= extra else radius - 1
+            for masks in _PROBES[CHUNK_BITS[i]][: chunk_radius + 1]:
+                for mask in masks:
+                    for pk in bucket.get(chunk ^ mask, ()):
+                        if pk in seen:
+                            continue
+                        seen.add(pk)
+                        other, owner = self._entries[pk]
+                        if user_id is not None and owner != user_id:
+                            continue
+                        distance = hamming(value, other)
+                        if distance <= max_distance:
+                            hits.append((pk, distance))
+        return hits
+
+    def _scan(self, value, max_distance, user_id):
+        if numpy is None:
+            return [
+                (pk, distance)
+                for pk, (other, owner) in self._entries.items()
+                if user_id is None or owner == user_id
+                for distance in (hamming(value, other),)
+                if distance <= max_distance
+            ]
+        if self._arrays is None:
+            pks = numpy.fromiter(self._entries, dtype=numpy.int64)
+            values = numpy.fromiter(
+                (v for v, _ in self._entries.values()), dtype=numpy.uint64
+            )
+            owners = numpy.fromiter(
+                (-1 if u is None else u for _, u in self._entries.values()),
+                dtype=numpy.int64,
+            )
+            self._arrays = pks, values, owners
+        pks, values, owners = self._arrays
+        xor = numpy.bitwise_xor(values, numpy.uint64(value))
+        distances = _POPCOUNT[xor.view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+        keep = distances <= max_distance
+        if user_id is not None:
+            keep &= owners == user_id
+        return list(zip(pks[keep].tolist(), distances[keep].tolist()))
+
+    def refresh(self, max_age: float = 0) -> None:
+        """
+        Load the images added since the last refresh (all of them the first
+        time), in primary key order and chunks of LOAD_CHUNK_SIZE. Does
+        nothing if the last refresh is less than `max_age` seconds old.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._refreshed_at is not None and now - self._refreshed_at < max_age:
+                return
+            started = timezone.now()
+            queryset = ImageAsset.objects.filter(
+                perceptual_hash__isnull=False
+            ).order_by("pk")
+            if self._recheck_since is not None:
+                late = queryset.filter(
+                    pk__lte=self._last_pk, updated_at__gte=self._recheck_since
+                ).values_list("pk", "perceptual_hash", "user_id")
+                for pk, value, user_id in late.iterator(chunk_size=LOAD_CHUNK_SIZE):
+                    if pk not in self._entries:
+                        self.add(pk, from_db(value), user_id)
+            while True:
+                rows = list(
+                    queryset.filter(pk__gt=self._last_pk).values_list(
+                        "pk", "perceptual_hash", "user_id"
+                    )[:LOAD_CHUNK_SIZE]
+                )
+                for pk, value, user_id in rows:
+                    self.add(pk, from_db(value), user_id)
+                if rows:
+                    self._last_pk = rows[-1][0]
+                if len(rows) < LOAD_CHUNK_SIZE:
+                    break
+            self._refreshed_at = now
+            self._recheck_since = started - timedelta(seconds=REFRESH_OVERLAP_SECONDS)
+
+
+if numpy is not None:
+    _POPCOUNT = numpy.array([bin(i).count("1") for i in range(256)], numpy.uint8)
+
+_index: Optional[SimilarityIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index(max_age: Optional[float] = None) -> SimilarityIndex:
+    """
+    This process's index, caught up with the database if its last refresh
+    is older than `max_age` seconds (SIMILARITY_INDEX_REFRESH_SECONDS).
+    """
+    global _index
+    if max_age is None:
+        max_age = getattr(
+            settings, "SIMILARITY_INDEX_REFRESH_SECONDS", DEFAULT_REFRESH_SECONDS
+        )
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+    _index.refresh(max_age)
+    return _index
+
+
+def remember(pk: int, value: int, user_id: Optional[int] = None) -> None:
+    """Add a newly hashed image to this process's index, if it is loaded."""
+    if _index is not None:
+        _index.add(pk, value, user_id)
+
+
+def forget(pk: int) -> None:
+    """Drop a deleted image from this process's index, if it is loaded."""
+    if _index is not None:
+        _index.discard(pk)
+
+
+def near_duplicate_distance() -> int:
+    return getattr(settings, "NEAR_DUPLICATE_MAX_DISTANCE", DEFAULT_MAX_DISTANCE)
+
+
+class Match(NamedTuple):
+    public_id: uuid.UUID
+    distance: int
+
+
+def find_similar(
+    public_id, max_distance: Optional[int] = None, user=None
+) -> List[Match]:
+    """
+    Images within `max_distance` bits (NEAR_DUPLICATE_MAX_DISTANCE) of the
+    image `public_id`, nearest first; only `user`'s if given. Empty if that
+    image is unknown or has no hash.
+    """
+    if max_distance is None:
+        max_distance = near_duplicate_distance()
+    row = (
+        ImageAsset.objects.filter(public_id=public_id)
+        .values_list("pk", "perceptual_hash")
+        .first()
+    )
+    if row is None or row[1] is None:
+        return []
+    pk, value = row
+    hits = [
+        hit
+        for hit in get_index().search(
+            from_db(value), max_distance, user.pk if user is not None else None
+        )
+        if hit[0] != pk
+    ]
+    if not hits:
+        return []
+    # Skips images deleted by other processes since the index saw them
+    public_ids = dict(
+        ImageAsset.objects.filter(pk__in=[p for p, _ in hits]).values_list(
+            "pk", "public_id"
+        )
+    )
+    return [Match(public_ids[p], d) for p, d in hits if p in public_ids]
+
+
+def validate_not_near_duplicate(uploaded_file, user) -> None:
+    """
+    With REJECT_NEAR_DUPLICATES, raise ValidationError when `user` already
+    has an image within NEAR_DUPLICATE_MAX_DISTANCE bits of the upload.
+    """
+    if not getattr(settings, "REJECT_NEAR_DUPLICATES", False) or user is None:
+        return
+    value = hash_upload(uploaded_file)
+    if value is None:
+        return
+    # Caught up first, so the user's latest upload counts
+    hits = get_index(max_age=0).search(value, near_duplicate_distance(), user.pk)
+    if not hits:
+        return
+    duplicate = (
+        ImageAsset.objects.filter(pk__in=[p for p, _ in hits], user=user)
+        .values_list("public_id", flat=True)
+        .first()
+    )
+    if duplicate is not None:
+        raise ValidationError(
+            "You have already uploaded this image (%(public_id)s).",
+            code="near_duplicate",
+            params={"public_id": duplicate},
+        )
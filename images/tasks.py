@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from jobs.queue import task
+
+from .cleanup import (
+    DELETE_TASK,
+    SWEEP_TASK,
+    delete_assets_in_batches,
+    selected_assets,
+    sweep_unreferenced_blobs,
+)
+from .models import ImageAsset
+from .renditions import get_presets, get_rendition
+from .services import hash_stored_asset, optimize_stored_asset
+
+
+@task("images.process_upload")
+def process_upload(public_id: str) -> None:
+    """
+    Post-upload processing: optimize an upload too large to optimize in its
+    request (see images.optimization), hash it for near-duplicate search if
+    the request did not, then pre-render every rendition preset.
+    """
+    image_obj = (
+        ImageAsset.objects.select_related("blob").filter(public_id=public_id).first()
+    )
+    if image_obj is None or image_obj.blob is None:
+        # Deleted before we got to it
+        return
+    optimize_stored_asset(image_obj)
+    hash_stored_asset(image_obj)
+    for preset in get_presets():
+        for output_format in ("WEBP", "JPEG"):
+            get_rendition(image_obj.blob, preset, output_format)
+
+
+@task(SWEEP_TASK)
+def sweep_blobs() -> None:
+    """Delete blobs whose last image is gone (see images.cleanup)."""
+    sweep_unreferenced_blobs()
+
+
+@task(DELETE_TASK)
+def delete_images(pks, filters, search, last_pk) -> None:
+    """Delete the images picked by an admin bulk action (see images.cleanup)."""
+    delete_assets_in_batches(selected_assets(pks, filters, search, last_pk))
@@ -0,0 +1,19 @@
+from django import template
+from django.utils.html import format_html
+
+from images.renditions import get_presets
+
+register = template.Library()
+
+
+@register.filter
+def rendition_size_attrs(image, preset: str) -> str:
+    """
+    `width`/`height` attributes for an image's rendition, from the stored
+    metadata, so the browser can lay the page out before images arrive.
+    """
+    max_edge = get_presets()[preset]
+    size = image.fit_within(max_edge)
+    if size is None:
+        return format_html('width="{}"', max_edge)
+    return format_html('width="{}" height="{}"', *size)
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class TempMediaMixin:
+    """
+    Run each test against its own temporary MEDIA_ROOT, with the upload
+    staging directory and the rendition cache inside it, so nothing is left
+    in the project's media/ or cache/ directories. The settings pin those
+    two paths, so overriding MEDIA_ROOT alone does not move them.
+    """
+
+    def setUp(self):
+        super().setUp()
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.media_root = os.path.join(temp_dir, "media")
+        self.staging_dir = os.path.join(self.media_root, ".staging")
+        self.rendition_dir = os.path.join(temp_dir, "renditions")
+        os.makedirs(self.media_root)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            UPLOAD_STAGING_DIR=self.staging_dir,
+            RENDITION_CACHE_DIR=self.rendition_dir,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
@@ -0,0 +1,176 @@
+import os
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from core.pagination import encode_cursor, estimated_count, table_row_estimate
+from images.admin import ImageAssetAdmin, asset_search_lookup
+from images.cleanup import DELETE_TASK, selected_assets
+from images.models import ImageAsset, ImageBlob
+from images.services import create_image_asset
+from images.tests.mixins import TempMediaMixin
+from images.tests.test_blobs import _png
+from jobs.models import Job
+from jobs.queue import enqueue, run_job
+
+User = get_user_model()
+
+
+class ImageAssetAdminTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.admin = User.objects.create_superuser("root", "root@example.com", "pw")
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:images_imageasset_changelist")
+
+    def _asset(self, color="white", ip="10.0.0.1"):
+        upload = SimpleUploadedFile("a.png", _png(color), content_type="image/png")
+        return create_image_asset(upload, ip)
+
+    def test_search_terms_map_to_indexed_lookups(self):
+        self.assertEqual(
+            asset_search_lookup(" 2001:DB8::1 "), asset_search_lookup("2001:db8::1")
+        )
+        self.assertIn("content_hash__startswith", str(asset_search_lookup("abcdef12")))
+        self.assertIn("pk", str(asset_search_lookup("123456")))
+        self.assertIsNone(asset_search_lookup("abc"))
+        self.assertIsNone(asset_search_lookup("photo.png"))
+
+    def test_search(self):
+        white = self._asset("white", "10.0.0.1")
+        black = self._asset("black", "10.0.0.2")
+        cases = {
+            str(white.public_id): [white],
+            "10.0.0.2": [black],
+            black.content_hash[:10]: [black],
+            "10.0.0": [],
+        }
+        for term, expected in cases.items():
+            with self.subTest(term=term):
+                response = self.client.get(self.url, {"q": term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    list(response.context["cl"].result_list),
+                    expected,
+                )
+
+    def test_changelist_pages_with_a_cursor(self):
+        assets = [self._asset(color) for color in ("white", "black", "red")]
+        newest_first = assets[::-1]
+        with mock.patch.object(ImageAssetAdmin, "list_per_page", 2):
+            first = self.client.get(self.url).context["cl"]
+            self.assertEqual(list(first.result_list), newest_first[:2])
+            self.assertIsNone(first.previous_url)
+            self.assertEqual(first.result_count_display, "3")
+
+            second = self.client.get(self.url + first.next_url).context["cl"]
+            self.assertEqual(list(second.result_list), newest_first[2:])
+            self.assertIsNone(second.next_url)
+            # Filter links start again from the first page
+            self.assertNotIn("cursor", second.get_query_string({"format": "PNG"}))
+
+            back = self.client.get(self.url + second.previous_url).context["cl"]
+            self.assertEqual(list(back.result_list), newest_first[:2])
+
+    def test_changelist_ignores_a_tampered_cursor(self):
+        asset = self._asset()
+        response = self.client.get(self.url, {"cursor": encode_cursor((12345, 1))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["cl"].result_list), [asset])
+
+    def test_counts_are_capped(self):
+        for color in ("white", "black", "red"):
+            self._asset(color)
+        self.assertEqual(estimated_count(ImageAsset.objects.all(), limit=5), (3, True))
+        self.assertEqual(
+            estimated_count(ImageAsset.objects.filter(format="PNG"), limit=2),
+            (2, False),
+        )
+        # An unfiltered count above the limit comes from the table statistics
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(table_row_estimate(ImageAsset), 3)
+        self.assertEqual(estimated_count(ImageAsset.objects.all(), limit=2), (3, False))
+
+    def test_delete_in_background(self):
+        keep = self._asset("white", "10.0.0.1")
+        doomed = [self._asset("black", "10.0.0.2"), self._asset("red", "10.0.0.2")]
+        paths = [asset.image.path for asset in doomed]
+        data = {
+            "action": "delete_in_background",
+            "_selected_action": [str(doomed[0].pk)],
+            "select_across": "1",
+        }
+
+        # Everything matching the search, not just the ticked row
+        confirm = self.client.post(self.url + "?q=10.0.0.2", data)
+        self.assertContains(confirm, "Delete 2 image assets?")
+        self.assertEqual(ImageAsset.objects.count(), 3)
+
+        response = self.client.post(self.url + "?q=10.0.0.2", {**data, "post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(task=DELETE_TASK)
+        # Uploads after the action are not part of it
+        late = self._asset("blue", "10.0.0.2")
+
+        run_job(job.pk)
+        self.assertEqual(
+            set(ImageAsset.objects.values_list("pk", flat=True)), {keep.pk, late.pk}
+        )
+        self.assertEqual(ImageBlob.objects.count(), 2)
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_delete_in_background_carries_the_selection_as_json(self):
+        ticked, other = self._asset("black"), self._asset("red")
+        response = self.client.post(
+            self.url + "?format__exact=PNG",
+            {
+                "action": "delete_in_background",
+                "_selected_action": [str(ticked.pk)],
+                "post": "yes",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        job = Job.objects.get(task=DELETE_TASK)
+        self.assertEqual(job.payload["pks"], [ticked.pk])
+        run_job(job.pk)
+        self.assertEqual(list(ImageAsset.objects.all()), [other])
+
+        self.assertEqual(
+            list(selected_assets(filters={"format__exact": "PNG"}, search="")),
+            [other],
+        )
+        with self.assertRaises(ValueError):
+            selected_assets(filters={"user__password__startswith": "pbkdf2"})
+
+    def test_jobs_cannot_be_written_from_the_admin(self):
+        self.assertEqual(
+            self.client.get(reverse("admin:jobs_job_add")).status_code, 403
+        )
+        job = enqueue(DELETE_TASK, pks=[], filters={}, search="", last_pk=0)
+        form = self.client.get(reverse("admin:jobs_job_change", args=[job.pk]))
+        self.assertNotIn("task", form.context["adminform"].form.fields)
+        self.assertNotIn("payload", form.context["adminform"].form.fields)
+
+    def test_blob_references_cannot_be_edited(self):
+        asset = self._asset()
+        add = reverse("admin:images_imageasset_add")
+        self.assertEqual(self.client.get(add).status_code, 403)
+        change = reverse("admin:images_imageasset_change", args=[asset.pk])
+        fields = self.client.get(change).context["adminform"].form.fields
+        self.assertNotIn("blob", fields)
+        self.assertNotIn("original_blob", fields)
+
+    def test_default_bulk_delete_is_not_offered(self):
+        form = self.client.get(self.url).context["action_form"]
+        actions = [name for name, _ in form.fields["action"].choices]
+        self.assertIn("delete_in_background", actions)
+        self.assertNotIn("delete_selected", actions)
@@ -0,0 +1,70 @@
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png():
+    buf = BytesIO()
+    Image.new("RGB", (6, 4), color="teal").save(buf, "PNG")
+    return SimpleUploadedFile("teal.png", buf.getvalue(), content_type="image/png")
+
+
+class AsyncViewTests(TempMediaMixin, TestCase):
+    """The upload, detail and list views driven through the async handler."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.async_client.force_login(self.user)
+
+    async def test_upload_then_detail_and_list(self):
+        response = await self.async_client.post(
+            reverse("image_upload"), {"image": _png()}
+        )
+        self.assertEqual(response.status_code, 302)
+        image_obj = await ImageAsset.objects.aget()
+        self.assertEqual((image_obj.width, image_obj.height), (6, 4))
+
+        response = await self.async_client.get(response.url)
+        self.assertContains(response, str(image_obj.public_id))
+        etag = response["ETag"]
+        response = await self.async_client.get(
+            reverse("image_detail", args=[image_obj.public_id]),
+            headers={"If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.get(reverse("image_list"))
+        self.assertEqual(list(response.context["images"]), [image_obj])
+        response = await self.async_client.get(reverse("image_list"), {"page": 1})
+        self.assertEqual(list(response.context["images"]), [image_obj])
+
+    async def test_upload_rejection(self):
+        bad = SimpleUploadedFile("x.png", b"not an image at all", "image/png")
+        response = await self.async_client.post(reverse("image_upload"), {"image": bad})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_detail_404(self):
+        response = await self.async_client.get(
+            reverse("image_detail", args=["00000000-0000-0000-0000-000000000000"])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class AsyncLoginTests(TestCase):
+    async def test_anonymous_is_redirected_to_login(self):
+        response = await self.async_client.get(reverse("image_list"))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(reverse("login"), response.url)
@@ -0,0 +1,91 @@
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+from jobs.models import Job
+
+User = get_user_model()
+
+
+def _png(name, color="red"):
+    buf = BytesIO()
+    Image.new("RGB", (3, 2), color=color).save(buf, "PNG")
+    return SimpleUploadedFile(name, buf.getvalue(), content_type="image/png")
+
+
+class BatchUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+        self.url = reverse("image_batch_upload")
+
+    def _post(self, files):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {"images": files})
+
+    def test_batch_creates_all_with_one_insert(self):
+        colors = ["red", "green", "blue", "white"]
+        files = [_png(f"{c}.png", c) for c in colors]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._post(files)
+
+        self.assertEqual(response.status_code, 201, response.content)
+        body = response.json()
+        self.assertEqual(body["created"], 4)
+        self.assertEqual(
+            [r["name"] for r in body["results"]], [f"{c}.png" for c in colors]
+        )
+        self.assertEqual(ImageAsset.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Job.objects.filter(task="images.process_upload").count(), 4)
+
+        asset_inserts = [
+            q
+            for q in ctx.captured_queries
+            if q["sql"].startswith('INSERT INTO "images_imageasset"')
+        ]
+        self.assertEqual(len(asset_inserts), 1)
+
+    def test_partial_failure_is_reported_per_file(self):
+        bad = SimpleUploadedFile("notes.png", b"definitely not an image", "image/png")
+        response = self._post([_png("a.png"), bad, _png("b.png", "blue")])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()["results"]
+        self.assertEqual([r["status"] for r in results], [201, 400, 201])
+        self.assertIn("Unsupported file type", results[1]["error"])
+        self.assertEqual(ImageAsset.objects.count(), 2)
+
+    @override_settings(UPLOAD_QUOTA_PER_IP=3)
+    def test_batch_takes_its_quota_in_one_reservation(self):
+        response = self._post(
+            [_png(f"{i}.png", c) for i, c in enumerate(["red", "blue"])]
+        )
+        self.assertEqual(response.status_code, 201)
+
+        # Two more would exceed the remaining single slot: nothing is stored
+        response = self._post([_png("c.png", "green"), _png("d.png", "white")])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(ImageAsset.objects.count(), 2)
+
+        response = self._post([_png("e.png", "green")])
+        self.assertEqual(response.status_code, 201)
+
+    @override_settings(MAX_BATCH_UPLOAD_FILES=2)
+    def test_files_over_the_batch_limit_are_rejected(self):
+        colors = ["red", "green", "blue"]
+        response = self._post([_png(f"{c}.png", c) for c in colors])
+        results = response.json()["results"]
+        self.assertEqual([r["status"] for r in results], [201, 201, 400])
+        self.assertIn("Too many files", results[2]["error"])
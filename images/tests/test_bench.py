@@ -0,0 +1,82 @@
+import random
+from collections import Counter
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from images import bench
+from images.models import ImageAsset, ImageBlob
+from images.tests.mixins import TempMediaMixin
+
+
+class BenchSeedTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        bench.seed(300, users=20, ips=50, rng=random.Random(1), days=30, batch_size=128)
+
+    def test_seed_is_skewed_and_spread_out(self):
+        self.assertEqual(ImageAsset.objects.count(), 300)
+        data = bench.load(random.Random(1), ips=50)
+        per_user = Counter(ImageAsset.objects.values_list("user_id", flat=True))
+        # The first bench user is the heaviest uploader
+        self.assertEqual(per_user.most_common(1)[0][0], data.users[0].pk)
+        self.assertTrue(
+            all(
+                ip.startswith("198.")
+                for ip in ImageAsset.objects.values_list("uploader_ip", flat=True)
+            )
+        )
+        dates = ImageAsset.objects.dates("created_at", "day")
+        self.assertGreater(len(dates), 10)
+        # Rows share the sample blobs, with correct reference counts
+        self.assertEqual(ImageBlob.objects.count(), len(bench.SAMPLE_SIZES))
+        self.assertEqual(
+            sum(ImageBlob.objects.values_list("ref_count", flat=True)), 300
+        )
+
+    def test_scenarios_run_and_count_queries(self):
+        data = bench.load(random.Random(2), ips=50)
+        for name in ("detail", "list_deep", "quota_check"):
+            op = bench.SCENARIOS[name](data, iterations=5, depth=2)
+            summary = bench.summarize(bench.measure(op, 5, warmup=1))
+            self.assertEqual(summary["iterations"], 5)
+            self.assertGreater(summary["queries_per_op"], 0, name)
+            self.assertLessEqual(summary["p50_ms"], summary["p99_ms"])
+
+
+class BenchReportTests(TestCase):
+    def test_percentiles_use_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(bench.percentile(values, 50), 50)
+        self.assertEqual(bench.percentile(values, 99), 99)
+        self.assertEqual(bench.percentile([7], 95), 7)
+
+    def test_compare_flags_slowdowns_and_extra_queries(self):
+        baseline = {
+            "scenarios": {
+                "list": {"p50_ms": 10, "p95_ms": 20, "p99_ms": 30, "queries_per_op": 3},
+                "quota_check": {
+                    "p50_ms": 0.1,
+                    "p95_ms": 0.1,
+                    "p99_ms": 0.1,
+                    "queries_per_op": 0,
+                },
+            }
+        }
+        results = {
+            "scenarios": {
+                "list": {"p50_ms": 11, "p95_ms": 30, "p99_ms": 31, "queries_per_op": 4},
+                # Slower by 100%, but within the noise floor
+                "quota_check": {
+                    "p50_ms": 0.2,
+                    "p95_ms": 0.2,
+                    "p99_ms": 0.2,
+                    "queries_per_op": 0,
+                },
+            }
+        }
+        regressions = bench.compare(results, baseline, tolerance=0.2)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith("list: p95_ms"))
+        self.assertIn("queries_per_op 3 -> 4", regressions[1])
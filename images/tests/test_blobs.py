@@ -0,0 +1,80 @@
+import os
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from images.cleanup import sweep_unreferenced_blobs
+from images.models import ImageAsset, ImageBlob
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png(color="white"):
+    buf = BytesIO()
+    Image.new("RGB", (2, 2), color=color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class ContentAddressedStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, data, name="a.png"):
+        response = self.client.post(
+            reverse("image_upload"),
+            {"image": SimpleUploadedFile(name, data, content_type="image/png")},
+        )
+        self.assertEqual(response.status_code, 302)
+        return ImageAsset.objects.get(public_id=response.url.split("/")[-2])
+
+    def _blob_files(self):
+        found = []
+        for root, _, files in os.walk(os.path.join(self.media_root, "blobs")):
+            found.extend(os.path.join(root, f) for f in files)
+        return found
+
+    def test_same_content_is_stored_once(self):
+        first = self._upload(_png(), "one.png")
+        second = self._upload(_png(), "two.png")
+        third = self._upload(_png("black"), "three.png")
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertNotEqual(first.blob_id, third.blob_id)
+        self.assertEqual(ImageBlob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertEqual(len(self._blob_files()), 2)
+        self.assertTrue(first.image.name.startswith("blobs/"))
+
+    def test_file_removed_only_with_last_reference(self):
+        first = self._upload(_png())
+        second = self._upload(_png())
+        path = first.image.path
+
+        self.client.post(reverse("image_delete", args=[first.public_id]))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 1)
+
+        self.client.post(reverse("image_delete", args=[second.public_id]))
+        # The file goes in the background sweep, not in the request
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get().ref_count, 0)
+        self.assertEqual(sweep_unreferenced_blobs(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_user_cascade_releases_blobs(self):
+        self._upload(_png())
+        self._upload(_png("black"))
+        self.user.delete()
+        self.assertEqual(sweep_unreferenced_blobs(), 2)
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertEqual(self._blob_files(), [])
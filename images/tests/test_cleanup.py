@@ -0,0 +1,88 @@
+import os
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from images import cleanup
+from images.models import ImageAsset, ImageBlob
+from images.tests.mixins import TempMediaMixin
+from images.tests.test_blobs import _png
+from jobs.models import Job
+
+User = get_user_model()
+
+
+class CleanupTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, data):
+        response = self.client.post(
+            reverse("image_upload"),
+            {"image": SimpleUploadedFile("a.png", data, content_type="image/png")},
+        )
+        self.assertEqual(response.status_code, 302)
+        return ImageAsset.objects.get(public_id=response.url.split("/")[-2])
+
+    def _stray(self, relpath, age=7200):
+        path = os.path.join(self.media_root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as fh:
+            fh.write(b"x" * 10)
+        stamp = time.time() - age
+        os.utime(path, (stamp, stamp))
+        return path
+
+    def test_deletes_queue_a_single_sweep(self):
+        first, second = self._upload(_png()), self._upload(_png("black"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("image_delete", args=[first.public_id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("image_delete", args=[second.public_id]))
+        self.assertEqual(Job.objects.filter(task=cleanup.SWEEP_TASK).count(), 1)
+
+    def test_released_blob_is_revived_by_a_new_upload(self):
+        first = self._upload(_png())
+        path = first.image.path
+        self.client.post(reverse("image_delete", args=[first.public_id]))
+        second = self._upload(_png())
+        self.assertEqual(second.blob_id, first.blob_id)
+        self.assertEqual(cleanup.sweep_unreferenced_blobs(), 0)
+        self.assertTrue(os.path.exists(path))
+
+    def test_gc_media_removes_only_old_unreferenced_files(self):
+        kept = self._upload(_png()).image.path
+        old = self._stray("blobs/ff/ee/ffee.png")
+        young = self._stray("blobs/aa/bb/aabb.png", age=60)
+        staged = self._stray(".staging/abandoned.part", age=3 * 86400)
+        live = self._stray(".staging/live.part", age=60)
+
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        self.assertIn(old, out.getvalue())
+        self.assertTrue(os.path.exists(old))
+
+        call_command("gc_media", "--workers", "2", stdout=StringIO())
+        self.assertFalse(os.path.exists(old))
+        self.assertFalse(os.path.exists(staged))
+        for path in (kept, young, live):
+            self.assertTrue(os.path.exists(path), path)
+
+    def test_fingerprints_match_blob_names(self):
+        self._upload(_png())
+        self._upload(_png("black"))
+        fingerprints = cleanup.referenced_fingerprints(batch_size=1)
+        self.assertEqual(list(fingerprints), sorted(fingerprints))
+        for name in ImageBlob.objects.values_list("file", flat=True):
+            self.assertTrue(cleanup.is_referenced(fingerprints, name))
+        self.assertFalse(cleanup.is_referenced(fingerprints, "blobs/missing.png"))
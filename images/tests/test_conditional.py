@@ -0,0 +1,84 @@
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png(color="white"):
+    buf = BytesIO()
+    Image.new("RGB", (2, 2), color=color).save(buf, "PNG")
+    return SimpleUploadedFile("a.png", buf.getvalue(), content_type="image/png")
+
+
+class ConditionalGetTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, color="white"):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("image_upload"), {"image": _png(color)})
+        return ImageAsset.objects.order_by("-id").first()
+
+    def _image_queries(self, path, **headers):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path, **headers)
+        touched = [
+            q["sql"] for q in ctx.captured_queries if "images_imageasset" in q["sql"]
+        ]
+        return response, touched
+
+    def test_detail_revalidates_with_304(self):
+        image_obj = self._upload()
+        url = reverse("image_detail", args=[image_obj.public_id])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+
+        response, touched = self._image_queries(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        # Only the single-column ETag lookup
+        self.assertEqual(len(touched), 1)
+        self.assertIn("updated_at", touched[0])
+
+    def test_list_304_skips_image_query_until_collection_changes(self):
+        self._upload()
+        url = reverse("image_list")
+        etag = self.client.get(url)["ETag"]
+
+        response, touched = self._image_queries(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(touched, [])
+
+        # Another page is another representation
+        other = self.client.get(url + "?page=2", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(other.status_code, 200)
+
+        self._upload("black")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_per_user(self):
+        image_obj = self._upload()
+        url = reverse("image_detail", args=[image_obj.public_id])
+        etag = self.client.get(url)["ETag"]
+
+        User.objects.create_user(username="other", password="other123")
+        self.client.login(username="other", password="other123")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Delete Image")
@@ -0,0 +1,121 @@
+import zipfile
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from images import export
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png(name, color="red"):
+    buf = BytesIO()
+    Image.new("RGB", (3, 2), color=color).save(buf, "PNG")
+    return SimpleUploadedFile(name, buf.getvalue(), content_type="image/png")
+
+
+class ExportTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+        self.async_client.force_login(self.user)
+        self.client.post(
+            reverse("image_batch_upload"),
+            {"images": [_png("a.png"), _png("b.png", "green"), _png("c.png", "blue")]},
+        )
+
+    def _download(self, **kwargs):
+        response = self.client.get(reverse("image_export"), **kwargs)
+        return response, b"".join(response.streaming_content)
+
+    def test_archive_holds_every_image_and_matches_its_length(self):
+        # Another user's image stays out
+        other = User.objects.create_user(username="bina", password="bina123")
+        self.client.force_login(other)
+        self.client.post(reverse("image_upload"), {"image": _png("d.png", "white")})
+        self.client.force_login(self.user)
+
+        response, body = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertEqual(int(response["Content-Length"]), len(body))
+
+        archive = zipfile.ZipFile(BytesIO(body))
+        self.assertIsNone(archive.testzip())
+        images = ImageAsset.objects.filter(user=self.user).order_by("created_at", "id")
+        self.assertEqual(archive.namelist(), [export.entry_name(i) for i in images])
+        for image_obj in images:
+            with image_obj.blob.file.open("rb") as fh:
+                self.assertEqual(archive.read(export.entry_name(image_obj)), fh.read())
+
+    def test_zip64_records_when_needed(self):
+        queryset = export.export_queryset(self.user)
+        # As if the archive were too big for plain ZIP
+        with mock.patch.object(export.ExportPlan, "zip64", property(lambda p: True)):
+            plan = export.plan_export(queryset)
+            body = b"".join(export.archive_chunks(queryset, plan))
+            self.assertEqual(len(body), plan.length)
+        self.assertIsNone(zipfile.ZipFile(BytesIO(body)).testzip())
+
+    def test_range_resumes_the_same_archive(self):
+        response, full = self._download()
+        etag = response["ETag"]
+
+        response, tail = self._download(HTTP_RANGE="bytes=100-", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(
+            response["Content-Range"], f"bytes 100-{len(full) - 1}/{len(full)}"
+        )
+        self.assertEqual(tail, full[100:])
+
+        response, middle = self._download(HTTP_RANGE="bytes=50-59")
+        self.assertEqual(middle, full[50:60])
+
+        # The images changed since: the whole new archive instead
+        self.client.post(reverse("image_upload"), {"image": _png("e.png", "black")})
+        response, body = self._download(HTTP_RANGE="bytes=100-", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(body)).namelist()), 4)
+
+        response = self.client.get(
+            reverse("image_export"), HTTP_RANGE=f"bytes={len(body) + 10}-"
+        )
+        self.assertEqual(response.status_code, 416)
+
+    def test_date_range(self):
+        last_week = timezone.now() - timedelta(days=7)
+        ImageAsset.objects.filter(pk=ImageAsset.objects.first().pk).update(
+            created_at=last_week
+        )
+        today = timezone.localdate()
+
+        _, body = self._download(data={"since": today.isoformat()})
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(body)).namelist()), 2)
+        _, body = self._download(
+            data={"until": (today - timedelta(days=1)).isoformat()}
+        )
+        [name] = zipfile.ZipFile(BytesIO(body)).namelist()
+        self.assertTrue(name.startswith(timezone.localdate(last_week).isoformat()))
+
+        response = self.client.get(reverse("image_export"), {"since": "last week"})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_streams_under_asgi(self):
+        response = await self.async_client.get(reverse("image_export"))
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(body), int(response["Content-Length"]))
+        self.assertEqual(len(zipfile.ZipFile(BytesIO(body)).namelist()), 3)
@@ -0,0 +1,71 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from images import fragments
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+from images.tests.test_conditional import _png
+
+User = get_user_model()
+
+
+class FragmentCacheTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, color="white"):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("image_upload"), {"image": _png(color)})
+        return ImageAsset.objects.order_by("-id").first()
+
+    def _rendered_cards(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            t.name for t in response.templates if t.name in fragments.TEMPLATES
+        ]
+
+    def test_list_page_is_assembled_from_cached_cards(self):
+        first = self._upload("white")
+        response, rendered = self._rendered_cards(reverse("image_list"))
+        self.assertEqual(rendered, [fragments.CARD_TEMPLATE])
+        self.assertContains(response, reverse("image_detail", args=[first.public_id]))
+
+        # Only the new image's card is rendered
+        second = self._upload("black")
+        response, rendered = self._rendered_cards(reverse("image_list"))
+        self.assertEqual(rendered, [fragments.CARD_TEMPLATE])
+        self.assertContains(response, f"Image {first.public_id}")
+        self.assertContains(response, f"Image {second.public_id}")
+
+        response, rendered = self._rendered_cards(reverse("image_list"))
+        self.assertEqual(rendered, [])
+
+    def test_detail_card_is_cached_and_dropped_on_delete(self):
+        image = self._upload()
+        detail = reverse("image_detail", args=[image.public_id])
+        _, rendered = self._rendered_cards(detail)
+        self.assertEqual(rendered, [fragments.DETAIL_CARD_TEMPLATE])
+        response, rendered = self._rendered_cards(detail)
+        self.assertEqual(rendered, [])
+        self.assertContains(response, "Uploaded by:</strong> amir")
+        self.assertContains(response, "Delete Image")
+
+        key = fragments.fragment_key(fragments.DETAIL_CARD_TEMPLATE, image)
+        self.assertIsNotNone(cache.get(key))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("image_delete", args=[image.public_id]))
+        self.assertIsNone(cache.get(key))
+
+    def test_changed_image_gets_a_new_card(self):
+        image = self._upload()
+        self._rendered_cards(reverse("image_list"))
+        image.save()  # bumps updated_at
+        _, rendered = self._rendered_cards(reverse("image_list"))
+        self.assertEqual(rendered, [fragments.CARD_TEMPLATE])
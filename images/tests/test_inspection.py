@@ -0,0 +1,68 @@
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from images.inspection import InspectionError, inspect_image
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _image(fmt="PNG", size=(30, 20)):
+    buf = BytesIO()
+    Image.new("RGB", size, color="red").save(buf, fmt)
+    return SimpleUploadedFile(f"img.{fmt.lower()}", buf.getvalue())
+
+
+class InspectImageTests(TestCase):
+    def test_reads_header_metadata(self):
+        info = inspect_image(_image("JPEG", (64, 48)), content_hash="abc")
+        self.assertEqual((info.width, info.height, info.format), (64, 48, "JPEG"))
+        self.assertEqual(info.content_hash, "abc")
+        self.assertGreater(info.byte_size, 0)
+
+    @override_settings(MAX_IMAGE_PIXELS=100)
+    def test_rejects_decompression_bomb_before_decoding(self):
+        with self.assertRaisesMessage(InspectionError, "too large"):
+            inspect_image(_image(size=(20, 20)))
+
+    def test_rejects_unsupported_format(self):
+        with self.assertRaisesMessage(InspectionError, "Unsupported"):
+            inspect_image(_image("BMP"))
+
+
+class ImageMetadataTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def test_upload_persists_metadata(self):
+        self.client.post(reverse("image_upload"), {"image": _image(size=(30, 20))})
+        image_obj = ImageAsset.objects.get()
+        self.assertEqual((image_obj.width, image_obj.height), (30, 20))
+        self.assertEqual(image_obj.format, "PNG")
+        self.assertEqual(image_obj.byte_size, image_obj.blob.size)
+        self.assertEqual(image_obj.content_hash, image_obj.blob.content_hash)
+
+        response = self.client.get(reverse("image_list"))
+        self.assertContains(response, 'width="30" height="20"')  # never upscaled
+
+    def test_backfill_command(self):
+        self.client.post(reverse("image_upload"), {"image": _image(size=(30, 20))})
+        ImageAsset.objects.update(width=None, height=None, format="", byte_size=None)
+
+        out = StringIO()
+        call_command("backfill_image_metadata", stdout=out)
+        image_obj = ImageAsset.objects.get()
+        self.assertEqual((image_obj.width, image_obj.height), (30, 20))
+        self.assertEqual(image_obj.format, "PNG")
+        self.assertIn("Backfilled 1 images", out.getvalue())
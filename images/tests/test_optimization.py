@@ -0,0 +1,120 @@
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset, ImageBlob
+from images.tests.mixins import TempMediaMixin
+from jobs.models import Job
+from jobs.queue import claim, run_job
+
+User = get_user_model()
+
+
+def _gradient_png(size=(300, 200)):
+    buf = BytesIO()
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    image.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def _rotated_jpeg():
+    """A 60x40 JPEG whose EXIF orientation says to turn it upright (40x60)."""
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = "Camera"
+    buf = BytesIO()
+    Image.linear_gradient("L").resize((60, 40)).convert("RGB").save(
+        buf, "JPEG", quality=100, exif=exif.tobytes()
+    )
+    return buf.getvalue()
+
+
+@override_settings(IMAGE_OPTIMIZATION=True, IMAGE_KEEP_ORIGINALS=False)
+class UploadOptimizationTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, data, name="a.png", content_type="image/png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("image_upload"),
+                {"image": SimpleUploadedFile(name, data, content_type=content_type)},
+            )
+        self.assertEqual(response.status_code, 302)
+        return ImageAsset.objects.get(public_id=response.url.split("/")[-2])
+
+    def test_small_upload_is_stored_optimized(self):
+        data = _gradient_png()
+        image_obj = self._upload(data)
+
+        self.assertEqual(image_obj.format, "WEBP")
+        self.assertLess(image_obj.byte_size, len(data))
+        self.assertEqual(image_obj.byte_size, image_obj.blob.size)
+        self.assertEqual((image_obj.width, image_obj.height), (300, 200))
+        self.assertTrue(image_obj.image.name.endswith(".webp"))
+        self.assertEqual(len(image_obj.original_hash), 64)
+        self.assertIsNone(image_obj.original_blob)
+        self.assertEqual(ImageBlob.objects.count(), 1)
+
+    @override_settings(IMAGE_OPTIMIZE_FORMAT="JPEG")
+    def test_orientation_is_applied_and_metadata_dropped(self):
+        image_obj = self._upload(_rotated_jpeg(), "a.jpg", "image/jpeg")
+
+        self.assertEqual(image_obj.format, "JPEG")
+        self.assertEqual((image_obj.width, image_obj.height), (40, 60))
+        with image_obj.image.open("rb") as fh, Image.open(fh) as stored:
+            self.assertEqual(stored.size, (40, 60))
+            self.assertEqual(len(stored.getexif()), 0)
+            self.assertNotIn("icc_profile", stored.info)
+            self.assertTrue(stored.info.get("progressive"))
+
+    @override_settings(IMAGE_OPTIMIZE_MAX_EDGE=100)
+    def test_large_dimensions_are_scaled_down(self):
+        image_obj = self._upload(_gradient_png())
+        self.assertEqual((image_obj.width, image_obj.height), (100, 67))
+
+    def test_upload_is_kept_when_the_result_is_not_smaller(self):
+        buf = BytesIO()
+        Image.linear_gradient("L").resize((300, 200)).save(buf, "WEBP", quality=5)
+        image_obj = self._upload(buf.getvalue(), "a.webp", "image/webp")
+
+        self.assertEqual(image_obj.byte_size, len(buf.getvalue()))
+        self.assertEqual(image_obj.original_hash, "")
+
+    @override_settings(IMAGE_KEEP_ORIGINALS=True)
+    def test_original_is_kept_by_policy_and_released_on_delete(self):
+        data = _gradient_png()
+        image_obj = self._upload(data)
+
+        self.assertEqual(image_obj.original_blob.size, len(data))
+        self.assertEqual(image_obj.original_blob.content_hash, image_obj.original_hash)
+        self.assertEqual(ImageBlob.objects.filter(ref_count=1).count(), 2)
+
+        image_obj.delete()
+        self.assertEqual(ImageBlob.objects.filter(ref_count=0).count(), 2)
+
+    @override_settings(IMAGE_OPTIMIZE_INLINE_MAX_BYTES=100)
+    def test_large_upload_is_optimized_by_the_worker(self):
+        data = _gradient_png()
+        image_obj = self._upload(data)
+        # Stored as received by the request
+        self.assertEqual(image_obj.format, "PNG")
+        original_blob_id = image_obj.blob_id
+
+        job = Job.objects.get(task="images.process_upload")
+        claim("w")
+        self.assertTrue(run_job(job.pk, "w"))
+
+        image_obj.refresh_from_db()
+        self.assertEqual(image_obj.format, "WEBP")
+        self.assertLess(image_obj.byte_size, len(data))
+        self.assertNotEqual(image_obj.blob_id, original_blob_id)
+        self.assertEqual(ImageBlob.objects.get(pk=original_blob_id).ref_count, 0)
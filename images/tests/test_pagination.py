@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from core.pagination import KeysetPaginator, encode_cursor
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+class KeysetPaginationTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+        now = timezone.now()
+        ImageAsset.objects.bulk_create(
+            ImageAsset(uploader_ip="127.0.0.1", user=self.user) for _ in range(25)
+        )
+        # Pairs share a timestamp so the id tie-breaker is exercised
+        for i, image_obj in enumerate(ImageAsset.objects.order_by("id")):
+            ImageAsset.objects.filter(pk=image_obj.pk).update(
+                created_at=now - timedelta(minutes=25 - i // 2)
+            )
+        self.expected = list(
+            ImageAsset.objects.order_by("-created_at", "-id").values_list(
+                "pk", flat=True
+            )
+        )
+        self.queryset = ImageAsset.objects.filter(user=self.user)
+
+    def test_walks_forward_and_back_without_gaps(self):
+        paginator = KeysetPaginator(self.queryset, 10)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        self.assertEqual([o.pk for p in pages for o in p], self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([o.pk for o in back], [o.pk for o in pages[1]])
+        first = paginator.get_page(back.previous_cursor)
+        self.assertEqual([o.pk for o in first], self.expected[:10])
+        self.assertFalse(first.has_previous())
+
+    def test_unreadable_cursor_falls_back_to_first_page(self):
+        paginator = KeysetPaginator(self.queryset, 10)
+        for cursor in (
+            "garbage",
+            encode_cursor(("not-a-date", 1)),
+            encode_cursor((timezone.now(), "x")),
+            # Values no real cursor holds
+            encode_cursor((12345, 1)),
+            encode_cursor(([1], {})),
+            encode_cursor((timezone.now(), 2**80)),
+            encode_cursor((timezone.now(), float("inf"))),
+            "W10",
+        ):
+            page = paginator.get_page(cursor)
+            self.assertEqual([o.pk for o in page], self.expected[:10])
+
+    def test_list_view_uses_cursor_without_count(self):
+        url = reverse("image_list")
+        response = self.client.get(url)
+        cursor = response.context["page_obj"].next_cursor
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, {"cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(
+            any("COUNT(" in q["sql"].upper() for q in ctx.captured_queries)
+        )
+        self.assertFalse(
+            any("OFFSET" in q["sql"].upper() for q in ctx.captured_queries)
+        )
+        self.assertEqual(
+            [o.pk for o in response.context["images"]], self.expected[10:20]
+        )
+        self.assertContains(response, "?cursor=")
+
+    def test_list_view_ignores_a_tampered_cursor(self):
+        response = self.client.get(
+            reverse("image_list"), {"cursor": encode_cursor((12345, 1))}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([o.pk for o in response.context["images"]], self.expected[:10])
+
+    def test_list_view_keeps_page_numbers(self):
+        response = self.client.get(reverse("image_list"), {"page": 3})
+        self.assertEqual([o.pk for o in response.context["images"]], self.expected[20:])
+        self.assertContains(response, "Page 3 of 3")
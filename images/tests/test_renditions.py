@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.renditions import RenditionCache
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _jpeg(size=(1600, 1200)):
+    buf = BytesIO()
+    Image.new("RGB", size, color="navy").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+class RenditionViewTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+        self.client.post(
+            reverse("image_upload"),
+            {"image": SimpleUploadedFile("big.jpg", _jpeg(), "image/jpeg")},
+        )
+        self.image_obj = ImageAsset.objects.get()
+
+    def _get(self, preset, accept=""):
+        url = reverse("image_rendition", args=[self.image_obj.public_id, preset])
+        return self.client.get(url, HTTP_ACCEPT=accept)
+
+    def test_thumb_is_resized_and_negotiated(self):
+        response = self._get("thumb", accept="image/webp,image/*")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        self.assertIn("Accept", response["Vary"])
+        with Image.open(BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertEqual(image.size, (200, 150))
+
+        response = self._get("thumb", accept="image/*")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+
+    def test_second_request_is_served_from_cache(self):
+        first = b"".join(self._get("medium").streaming_content)
+        with mock.patch("images.renditions.render", side_effect=AssertionError):
+            response = self._get("medium")
+        self.assertEqual(b"".join(response.streaming_content), first)
+
+    def test_unknown_preset_is_404(self):
+        self.assertEqual(self._get("huge").status_code, 404)
+
+
+class RenditionCacheTests(TestCase):
+    def test_evicts_least_recently_used(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        rc = RenditionCache(directory, max_bytes=250, low_water=1.0)
+
+        old = rc.put("aa-old", ".jpg", b"x" * 100)
+        recent = rc.put("bb-recent", ".jpg", b"x" * 100)
+        past = time.time() - 60
+        os.utime(old, (past, past))
+        os.utime(recent, (past, past))
+        # A hit refreshes recency
+        self.assertEqual(rc.get("bb-recent", ".jpg"), recent)
+
+        rc.put("cc-new", ".jpg", b"x" * 100)
+        self.assertIsNone(rc.get("aa-old", ".jpg"))
+        self.assertIsNotNone(rc.get("bb-recent", ".jpg"))
+        self.assertIsNotNone(rc.get("cc-new", ".jpg"))
+
+    def test_size_is_shared_between_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        # Two workers' caches over the same directory
+        first = RenditionCache(directory, max_bytes=250, low_water=1.0)
+        second = RenditionCache(directory, max_bytes=250, low_water=1.0)
+
+        first.put("aa-one", ".jpg", b"x" * 100)
+        second.put("bb-two", ".jpg", b"x" * 100)
+        first.put("cc-three", ".jpg", b"x" * 100)
+        self.assertLessEqual(first.scan_size(), 250)
+        with open(os.path.join(directory, RenditionCache.SIZE_FILE)) as fh:
+            self.assertEqual(int(fh.read()), first.scan_size())
@@ -0,0 +1,135 @@
+import os
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from images import resumable
+from images.models import ImageAsset, UploadSession
+from images.resumable import staging_path
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png_bytes():
+    buf = BytesIO()
+    Image.new("RGB", (40, 30), color="purple").save(buf, "PNG")
+    return buf.getvalue()
+
+
+class ResumableUploadTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _create(self, length):
+        response = self.client.post(
+            reverse("resumable_upload_create"),
+            HTTP_UPLOAD_LENGTH=str(length),
+            HTTP_UPLOAD_METADATA="filename cGhvdG8ucG5n",  # photo.png
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response["Location"]
+
+    def _patch(self, url, offset, data):
+        return self.client.patch(
+            url,
+            data,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_resume_after_interruption_and_finalize(self):
+        data = _png_bytes()
+        url = self._create(len(data))
+        session = UploadSession.objects.get()
+        self.assertEqual(session.filename, "photo.png")
+
+        response = self._patch(url, 0, data[:50])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response["Upload-Offset"], "50")
+
+        # A retry of a chunk that already arrived is refused, not appended twice
+        response = self._patch(url, 0, data[:50])
+        self.assertEqual(response.status_code, 409)
+
+        # After a dropped connection the client asks where to resume
+        response = self.client.head(url)
+        self.assertEqual(response["Upload-Offset"], "50")
+        self._patch(url, 50, data[50:])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("resumable_upload_finalize", args=[session.public_id])
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        image_obj = ImageAsset.objects.get()
+        self.assertEqual((image_obj.width, image_obj.height), (40, 30))
+        with image_obj.image.open("rb") as fh:
+            self.assertEqual(fh.read(), data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(staging_path(session)))
+
+    def test_finalize_refuses_incomplete_upload(self):
+        data = _png_bytes()
+        url = self._create(len(data))
+        self._patch(url, 0, data[:20])
+        session = UploadSession.objects.get()
+
+        response = self.client.post(
+            reverse("resumable_upload_finalize", args=[session.public_id])
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "20")
+        self.assertFalse(ImageAsset.objects.exists())
+
+    def test_rejects_bytes_past_length_and_non_images(self):
+        url = self._create(10)
+        self.assertEqual(self._patch(url, 0, b"x" * 11).status_code, 413)
+
+        url = self._create(100)
+        response = self._patch(url, 0, b"<?php echo 'hi'; ?>")
+        self.assertEqual(response.status_code, 415)
+
+    @skipIf(resumable.fcntl is None, "needs fcntl")
+    def test_a_concurrent_patch_at_the_same_offset_is_refused(self):
+        data = _png_bytes()
+        url = self._create(len(data))
+        session = UploadSession.objects.get()
+        # Another request is writing this chunk
+        with open(staging_path(session), "r+b") as other_writer:
+            resumable.fcntl.flock(other_writer.fileno(), resumable.fcntl.LOCK_EX)
+            response = self._patch(url, 0, data[:50])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "0")
+        self.assertEqual(os.path.getsize(staging_path(session)), 0)
+
+        self.assertEqual(self._patch(url, 0, data[:50]).status_code, 204)
+
+    def test_other_users_cannot_touch_a_session(self):
+        url = self._create(10)
+        User.objects.create_user(username="eve", password="eve12345")
+        self.client.login(username="eve", password="eve12345")
+        self.assertEqual(self.client.head(url).status_code, 404)
+
+    def test_expire_command_removes_abandoned_sessions(self):
+        self._create(10)
+        session = UploadSession.objects.get()
+        path = staging_path(session)
+        self.assertTrue(os.path.exists(path))
+
+        UploadSession.objects.update(expires_at=timezone.now() - timedelta(hours=1))
+        call_command("expire_upload_sessions", stdout=StringIO())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(os.path.exists(path))
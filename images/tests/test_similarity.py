@@ -0,0 +1,206 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from images import similarity
+from images.models import ImageAsset
+from images.similarity import SimilarityIndex, hamming
+from images.tests.mixins import TempMediaMixin
+from jobs.queue import claim, run_job
+
+User = get_user_model()
+
+
+def _picture(size=(240, 160), fmt="PNG", seed=1, **options):
+    """
+    A few random shapes on a gradient, so that pictures differ by seed,
+    scaled to `size`.
+    """
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize((240, 160)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(240), rng.randrange(160)
+        r = rng.randrange(10, 80)
+        fill = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=fill)
+    buf = BytesIO()
+    image.resize(size).save(buf, fmt, **options)
+    return buf.getvalue()
+
+
+class PerceptualHashTests(SimpleTestCase):
+    def test_copies_hash_close_and_other_pictures_far(self):
+        original = similarity.perceptual_hash(BytesIO(_picture()))
+        resized = similarity.perceptual_hash(BytesIO(_picture(size=(120, 80))))
+        recoded = similarity.perceptual_hash(BytesIO(_picture(fmt="JPEG", quality=40)))
+        other = similarity.perceptual_hash(BytesIO(_picture(seed=2)))
+
+        self.assertLessEqual(hamming(original, resized), 6)
+        self.assertLessEqual(hamming(original, recoded), 6)
+        self.assertGreater(hamming(original, other), 12)
+
+    def test_signed_storage_round_trip(self):
+        for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+            stored = similarity.to_db(value)
+            self.assertTrue(-(1 << 63) <= stored < 1 << 63)
+            self.assertEqual(similarity.from_db(stored), value)
+
+
+class SimilarityIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.index = SimilarityIndex()
+        self.hashes = {pk: rng.getrandbits(64) for pk in range(1, 2001)}
+        for pk, value in self.hashes.items():
+            self.index.add(pk, value, user_id=pk % 3)
+        # Near copies of image 1
+        for pk, bits in ((5001, 1), (5002, 5), (5003, 9)):
+            value = self.hashes[1]
+            for bit in rng.sample(range(64), bits):
+                value ^= 1 << bit
+            self.hashes[pk] = value
+            self.index.add(pk, value, user_id=1)
+
+    def _expected(self, value, max_distance, user_id=None):
+        return sorted(
+            (
+                (pk, hamming(value, other))
+                for pk, other in self.hashes.items()
+                if hamming(value, other) <= max_distance
+                and (user_id is None or self.index._entries[pk][1] == user_id)
+            ),
+            key=lambda hit: (hit[1], hit[0]),
+        )
+
+    def test_bucket_probes_find_what_a_full_scan_finds(self):
+        value = self.hashes[1]
+        for max_distance in (0, 3, 6, 10, 11):
+            self.assertEqual(
+                self.index.search(value, max_distance),
+                self._expected(value, max_distance),
+            )
+        self.assertEqual(
+            [pk for pk, _ in self.index.search(value, 10)], [1, 5001, 5002, 5003]
+        )
+
+    def test_wide_searches_scan_every_hash(self):
+        value = self.hashes[1]
+        with mock.patch.object(SimilarityIndex, "_probe") as probe:
+            hits = self.index.search(value, 20)
+        probe.assert_not_called()
+        self.assertEqual(hits, self._expected(value, 20))
+
+        with mock.patch.object(similarity, "numpy", None):
+            self.assertEqual(self.index.search(value, 20), hits)
+
+    def test_filters_by_user_and_forgets_discarded_images(self):
+        value = self.hashes[1]
+        self.assertEqual(
+            self.index.search(value, 6, user_id=1), self._expected(value, 6, 1)
+        )
+        self.index.discard(5001)
+        self.assertNotIn(5001, [pk for pk, _ in self.index.search(value, 6)])
+        self.assertEqual(len(self.index), 2002)
+
+
+class NearDuplicateTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        # A fresh index for each test's rows
+        patcher = mock.patch.object(similarity, "_index", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _upload(self, data, name="a.png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse("image_upload"), {"image": SimpleUploadedFile(name, data)}
+            )
+
+    def _process_uploads(self):
+        for job_id in claim("w", limit=10):
+            run_job(job_id, "w")
+
+    def test_post_upload_job_records_the_hash_and_find_similar_matches_copies(self):
+        self._upload(_picture())
+        self._upload(_picture(size=(120, 80)))
+        self._upload(_picture(seed=2))
+        # Near duplicates are not rejected, so the requests did not hash
+        self.assertFalse(
+            ImageAsset.objects.filter(perceptual_hash__isnull=False).exists()
+        )
+        self._process_uploads()
+        original, resized, other = ImageAsset.objects.order_by("pk")
+
+        self.assertEqual(
+            similarity.from_db(original.perceptual_hash),
+            similarity.perceptual_hash(BytesIO(_picture())),
+        )
+        matches = similarity.find_similar(original.public_id)
+        self.assertEqual([m.public_id for m in matches], [resized.public_id])
+
+        resized.delete()
+        self.assertEqual(similarity.find_similar(original.public_id), [])
+
+    def test_refresh_picks_up_rows_hashed_by_the_job(self):
+        self._upload(_picture())
+        # The job runs well after the upload
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        ImageAsset.objects.update(created_at=an_hour_ago, updated_at=an_hour_ago)
+        loaded = similarity.get_index()
+        # Another process's index, already past the upload's row
+        elsewhere = SimilarityIndex()
+        ImageAsset.objects.bulk_create(
+            [ImageAsset(uploader_ip="10.0.0.1", perceptual_hash=1)]
+        )
+        elsewhere.refresh()
+
+        self._process_uploads()
+        image_obj = ImageAsset.objects.order_by("pk").first()
+        self.assertIn(image_obj.pk, loaded._entries)
+        elsewhere.refresh()
+        self.assertIn(image_obj.pk, elsewhere._entries)
+
+    @override_settings(REJECT_NEAR_DUPLICATES=True)
+    def test_policy_rejects_a_users_own_near_duplicates(self):
+        self.assertEqual(self._upload(_picture()).status_code, 302)
+        # Loaded now, so the next upload has to catch the index up
+        similarity.get_index()
+
+        response = self._upload(_picture(fmt="JPEG", quality=40), "a.jpg")
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(response, "already uploaded", status_code=400)
+        self.assertEqual(self._upload(_picture(seed=2)).status_code, 302)
+
+        # Other users may upload the same picture
+        User.objects.create_user(username="bina", password="bina123")
+        self.client.login(username="bina", password="bina123")
+        self.assertEqual(self._upload(_picture()).status_code, 302)
+        self.assertEqual(ImageAsset.objects.count(), 3)
+
+    def test_refresh_picks_up_rows_that_commit_late(self):
+        index = SimilarityIndex()
+        ImageAsset.objects.bulk_create(
+            [ImageAsset(pk=10, uploader_ip="10.0.0.1", perceptual_hash=1)]
+        )
+        index.refresh()
+        # pk 9 was taken by a transaction that only commits now
+        ImageAsset.objects.bulk_create(
+            [ImageAsset(pk=9, uploader_ip="10.0.0.1", perceptual_hash=3)]
+        )
+        index.refresh()
+        self.assertEqual(sorted(index._entries), [9, 10])
+        self.assertEqual([pk for pk, _ in index.search(1, 1)], [10, 9])
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import unittest
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, storages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from PIL import Image
+
+from core.storage import S3Storage, ShardedFileSystemStorage, shard_name
+from images.models import ImageBlob
+from images.services import create_image_asset
+from images.tests.mixins import TempMediaMixin
+
+try:
+    import boto3
+
+    try:
+        from moto import mock_aws
+    except ImportError:  # moto < 5
+        from moto import mock_s3 as mock_aws
+except ImportError:
+    boto3 = None
+
+User = get_user_model()
+DIGEST = "abcdef" + "0" * 58
+
+
+def _png():
+    buf = BytesIO()
+    Image.new("RGB", (5, 5), color="orange").save(buf, "PNG")
+    return SimpleUploadedFile("o.png", buf.getvalue(), content_type="image/png")
+
+
+class ShardNameTests(SimpleTestCase):
+    def test_fans_out_by_prefix(self):
+        self.assertEqual(
+            shard_name(f"blobs/{DIGEST}.png", 2), f"blobs/ab/cd/{DIGEST}.png"
+        )
+        self.assertEqual(shard_name(f"blobs/{DIGEST}.png", 1), f"blobs/ab/{DIGEST}.png")
+        self.assertEqual(shard_name(f"blobs/{DIGEST}.png", 0), f"blobs/{DIGEST}.png")
+
+    def test_is_idempotent_and_skips_short_names(self):
+        sharded = shard_name(f"blobs/{DIGEST}.png", 2)
+        self.assertEqual(shard_name(sharded, 2), sharded)
+        self.assertEqual(shard_name("a.png", 2), "a.png")
+
+
+class ShardedStorageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_uploads_land_in_sharded_directories(self):
+        image_obj = create_image_asset(_png(), uploader_ip="127.0.0.1")
+        digest = image_obj.content_hash
+        self.assertEqual(
+            image_obj.image.name, f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        )
+        self.assertTrue(os.path.exists(image_obj.image.path))
+
+    def test_rehome_moves_files_into_the_current_layout(self):
+        data = b"legacy bytes"
+        digest = hashlib.sha256(data).hexdigest()
+        legacy = default_storage.save(
+            f"uploads/2025/10/01/{digest}.png", ContentFile(data)
+        )
+        blob = ImageBlob.objects.create(
+            content_hash=digest, file=legacy, size=len(data), ref_count=1
+        )
+        missing = ImageBlob.objects.create(
+            content_hash="f" * 64, file="uploads/gone.png", size=1, ref_count=1
+        )
+
+        call_command("rehome_blobs", stdout=StringIO(), stderr=StringIO())
+
+        blob.refresh_from_db()
+        self.assertEqual(
+            blob.file.name, f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.png"
+        )
+        with blob.file.open("rb") as fh:
+            self.assertEqual(fh.read(), data)
+        self.assertFalse(default_storage.exists(legacy))
+        missing.refresh_from_db()
+        self.assertEqual(missing.file.name, "uploads/gone.png")
+
+        # A second run has nothing left to do
+        out = StringIO()
+        call_command("rehome_blobs", stdout=out, stderr=StringIO())
+        self.assertIn("Moved 0", out.getvalue())
+
+    def test_storage_is_selected_from_settings(self):
+        self.assertIsInstance(storages["default"], ShardedFileSystemStorage)
+
+
+@unittest.skipIf(boto3 is None, "boto3/moto not installed")
+class S3StorageTests(SimpleTestCase):
+    def setUp(self):
+        mock = mock_aws()
+        mock.start()
+        self.addCleanup(mock.stop)
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="images")
+        self.storage = S3Storage(
+            bucket_name="images",
+            region_name="us-east-1",
+            access_key="testing",
+            secret_key="testing",
+            multipart_threshold=5 * 1024 * 1024,
+            multipart_chunksize=5 * 1024 * 1024,
+        )
+
+    def test_round_trip_with_sharded_keys(self):
+        name = self.storage.save(f"blobs/{DIGEST}.png", ContentFile(b"png bytes"))
+        self.assertEqual(name, f"blobs/ab/cd/{DIGEST}.png")
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.size(name), 9)
+        with self.storage.open(name) as fh:
+            self.assertEqual(fh.read(), b"png bytes")
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_large_files_use_multipart_upload(self):
+        data = os.urandom(11 * 1024 * 1024)
+        name = self.storage.save(f"blobs/{DIGEST}.jpg", ContentFile(data))
+        head = self.storage.client.head_object(Bucket="images", Key=name, PartNumber=1)
+        self.assertEqual(head["PartsCount"], 3)
+        with self.storage.open(name) as fh:
+            self.assertEqual(fh.read(), data)
@@ -0,0 +1,53 @@
+import os
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.renditions import RenditionCache
+from images.tests.mixins import TempMediaMixin
+from jobs.models import Job
+from jobs.queue import claim, run_job
+
+User = get_user_model()
+
+
+class PostUploadProcessingTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def test_upload_enqueues_processing_after_commit(self):
+        buf = BytesIO()
+        Image.new("RGB", (900, 900), color="green").save(buf, "PNG")
+        upload = SimpleUploadedFile("a.png", buf.getvalue(), "image/png")
+
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post(reverse("image_upload"), {"image": upload})
+            # Nothing is queued until the upload commits
+            self.assertFalse(Job.objects.exists())
+        for callback in callbacks:
+            callback()
+
+        job = Job.objects.get()
+        self.assertEqual(job.task, "images.process_upload")
+        self.assertEqual(
+            job.payload, {"public_id": str(ImageAsset.objects.get().public_id)}
+        )
+
+        claim("w")
+        self.assertTrue(run_job(job.pk, "w"))
+        rendered = [
+            f
+            for _, _, files in os.walk(self.rendition_dir)
+            for f in files
+            if f != RenditionCache.SIZE_FILE
+        ]
+        self.assertEqual(len(rendered), 4)  # 2 presets x (WebP, JPEG)
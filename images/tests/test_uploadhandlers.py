@@ -0,0 +1,95 @@
+import hashlib
+import os
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.test import Client, TestCase
+from django.urls import reverse
+from PIL import Image
+
+from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
+from images.uploadhandlers import (
+    StreamingImageUploadHandler,
+    get_staging_dir,
+    sniff_image_format,
+)
+
+User = get_user_model()
+
+
+def _png_bytes(size=(4, 4)):
+    buf = BytesIO()
+    Image.new("RGB", size, color="red").save(buf, "PNG")
+    return buf.getvalue()
+
+
+class StreamingImageUploadHandlerTests(TestCase):
+    def _start(self, handler, name="a.png"):
+        handler.new_file("image", name, "image/png", None)
+
+    def test_hashes_and_sniffs_while_streaming(self):
+        data = _png_bytes()
+        handler = StreamingImageUploadHandler(max_size=1024 * 1024)
+        self._start(handler)
+        handler.receive_data_chunk(data[:5], 0)
+        handler.receive_data_chunk(data[5:], 5)
+        staged = handler.file_complete(len(data))
+
+        self.assertEqual(staged.image_format, "PNG")
+        self.assertEqual(staged.content_type, "image/png")
+        self.assertEqual(staged.sha256, hashlib.sha256(data).hexdigest())
+        self.assertTrue(staged.temporary_file_path().startswith(get_staging_dir()))
+        staged.close()
+
+    def test_aborts_as_soon_as_limit_is_crossed(self):
+        handler = StreamingImageUploadHandler(max_size=10)
+        self._start(handler)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(_png_bytes(), 0)
+        self.assertEqual(handler.status_code, 413)
+
+    def test_rejects_non_image_from_first_chunk(self):
+        handler = StreamingImageUploadHandler(max_size=1024)
+        self._start(handler, name="evil.png")
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b"<?php echo 'hi'; ?>", 0)
+        self.assertIn("Unsupported file type", handler.error)
+
+    def test_sniff_image_format(self):
+        self.assertEqual(sniff_image_format(b"\xff\xd8\xff\xe0\x00\x10JFIF"), "JPEG")
+        self.assertEqual(sniff_image_format(b"RIFF\x00\x00\x00\x00WEBPVP8 "), "WEBP")
+        self.assertIsNone(sniff_image_format(b"BM\x00\x00"))
+
+
+class StreamingUploadViewTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user(username="amir", password="amir123")
+
+    def test_upload_is_moved_out_of_staging(self):
+        self.client.login(username="amir", password="amir123")
+        response = self.client.post(
+            reverse("image_upload"),
+            {"image": SimpleUploadedFile("a.png", _png_bytes(), "image/png")},
+        )
+        self.assertEqual(response.status_code, 302)
+        image_obj = ImageAsset.objects.get()
+        self.assertTrue(os.path.exists(image_obj.image.path))
+        self.assertFalse(
+            [n for n in os.listdir(get_staging_dir()) if n.endswith(".png")]
+        )
+
+    def test_csrf_is_still_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username="amir", password="amir123")
+        response = client.post(
+            reverse("image_upload"),
+            {"image": SimpleUploadedFile("a.png", _png_bytes(), "image/png")},
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(ImageAsset.objects.count(), 0)
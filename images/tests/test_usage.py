@@ -0,0 +1,111 @@
+from datetime import timedelta
+from importlib import import_module
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from core import ratelimit
+from images import usage
+from images.models import ImageAsset, IpDailyUsage, UserDailyUsage
+from images.services import daily_upload_limiter
+from images.tests.mixins import TempMediaMixin
+
+User = get_user_model()
+
+
+def _png(name, color="red"):
+    buf = BytesIO()
+    Image.new("RGB", (3, 2), color=color).save(buf, "PNG")
+    return SimpleUploadedFile(name, buf.getvalue(), content_type="image/png")
+
+
+class UsageTests(TempMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+        self.user = User.objects.create_user(username="amir", password="amir123")
+        self.client.login(username="amir", password="amir123")
+
+    def _actual(self):
+        images = ImageAsset.objects.filter(user=self.user)
+        return len(images), sum(i.byte_size for i in images)
+
+    def test_uploads_and_deletes_keep_the_rows_in_step(self):
+        self.client.post(reverse("image_upload"), {"image": _png("a.png")})
+        self.client.post(
+            reverse("image_batch_upload"),
+            {"images": [_png("b.png", "green"), _png("c.png", "blue")]},
+        )
+        today = timezone.localdate()
+        totals = usage.user_usage(self.user.pk)
+        self.assertEqual((totals.images, totals.bytes), self._actual())
+        self.assertEqual(
+            totals.last_upload_at,
+            ImageAsset.objects.order_by("-created_at")[0].created_at,
+        )
+        self.assertEqual(usage.ip_usage("127.0.0.1", today).images, 3)
+        self.assertEqual(UserDailyUsage.objects.get().day, today)
+
+        ImageAsset.objects.first().delete()
+        totals = usage.user_usage(self.user.pk)
+        self.assertEqual((totals.images, totals.bytes), self._actual())
+        self.assertEqual(usage.ip_usage("127.0.0.1").images, 2)
+
+    @mock.patch.object(ratelimit, "_backend", ratelimit.CacheBackend())
+    def test_daily_quota_is_seeded_from_the_ip_row(self):
+        self.client.post(reverse("image_upload"), {"image": _png("a.png")})
+        # The counter is lost with the cache
+        cache.clear()
+        with self.assertNumQueries(1):
+            self.assertEqual(daily_upload_limiter(1).is_exceeded("127.0.0.1"), True)
+
+    def test_migration_counts_todays_uploads(self):
+        self.client.post(reverse("image_upload"), {"image": _png("a.png")})
+        # As on the day of the deploy: images but no usage rows yet
+        UserDailyUsage.objects.all().delete()
+        IpDailyUsage.objects.all().delete()
+        cache.clear()
+
+        migration = import_module("images.migrations.0011_backfill_today_usage")
+        migration.backfill_today(apps, None)
+        self.assertEqual(usage.user_usage(self.user.pk).images, 1)
+        self.assertEqual(daily_upload_limiter(1).is_exceeded("127.0.0.1"), True)
+
+    def test_reconcile_fixes_drift_and_missing_days(self):
+        self.client.post(reverse("image_upload"), {"image": _png("a.png")})
+        self.client.post(reverse("image_upload"), {"image": _png("b.png", "green")})
+        # Drift: one image moved to an earlier day behind the rows' back, and
+        # a stray row for a day without images
+        last_week = timezone.now() - timedelta(days=7)
+        ImageAsset.objects.filter(pk=ImageAsset.objects.first().pk).update(
+            created_at=last_week
+        )
+        IpDailyUsage.objects.create(
+            uploader_ip="10.0.0.1", day=timezone.localdate(last_week), image_count=5
+        )
+
+        out = StringIO()
+        call_command("reconcile_usage", "--days", "3", stdout=out)
+        self.assertIn("Reconciled 8 days (5 rows corrected)", out.getvalue())
+
+        self.assertEqual(
+            sorted(UserDailyUsage.objects.values_list("day", "image_count")),
+            [(timezone.localdate(last_week), 1), (timezone.localdate(), 1)],
+        )
+        self.assertFalse(IpDailyUsage.objects.filter(uploader_ip="10.0.0.1").exists())
+        totals = usage.user_usage(self.user.pk)
+        self.assertEqual((totals.images, totals.bytes), self._actual())
+
+        out = StringIO()
+        call_command("reconcile_usage", stdout=out)
+        self.assertIn("(0 rows corrected)", out.getvalue())
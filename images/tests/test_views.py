@@ -1,18 +1,23 @@
 from io import BytesIO
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.urls import reverse
 from PIL import Image
 
 from images.models import ImageAsset
+from images.tests.mixins import TempMediaMixin
 
 User = get_user_model()
 
 
-class ImageUploadTests(TestCase):
+class ImageUploadTests(TempMediaMixin, TestCase):
     def setUp(self):
+        super().setUp()
+        # Quota counters live in the cache, which outlives each test's transaction
+        cache.clear()
         # Create and login a test user
         self.user = User.objects.create_user(username="amir", password="amir123")
         self.client.login(username="amir", password="amir123")
@@ -102,3 +107,19 @@ class ImageUploadTests(TestCase):
         response = self.client.post(delete_url)
         self.assertEqual(response.status_code, 403)
         self.assertEqual(ImageAsset.objects.count(), 1)
+
+    def test_failed_upload_releases_quota_slot(self):
+        """An invalid upload must not consume one of the IP's daily slots."""
+        bogus = SimpleUploadedFile("bad.png", b"not an image", content_type="image/png")
+        response = self.client.post(
+            self.upload_url, {"image": bogus}, REMOTE_ADDR=self.client_ip
+        )
+        self.assertEqual(response.status_code, 400)
+
+        for i in range(10):
+            response = self.client.post(
+                self.upload_url,
+                {"image": self._create_test_image(name=f"ok_{i}.png")},
+                REMOTE_ADDR=self.client_ip,
+            )
+            self.assertEqual(response.status_code, 302)
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import tempfile
+from typing import List, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+
+# Leading bytes that identify the formats we accept, in sniffing order.
+IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+)
+SNIFF_BYTES = 12
+
+IMAGE_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Identify an image format from its first bytes, or return None."""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def get_staging_dir() -> str:
+    """
+    Directory for in-flight uploads. It lives under MEDIA_ROOT by default so that
+    committing a finished upload to storage is a rename, not a copy.
+    """
+    path = str(
+        getattr(settings, "UPLOAD_STAGING_DIR", None)
+        or os.path.join(settings.MEDIA_ROOT, ".staging")
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class StagedUploadedFile(TemporaryUploadedFile):
+    """
+    An upload streamed into the staging directory, with the content hash and
+    sniffed image format computed on the way in.
+    """
+
+    def __init__(self, name, content_type, size, charset, content_type_extra=None):
+        _, ext = os.path.splitext(name)
+        file = tempfile.NamedTemporaryFile(
+            suffix=".upload" + ext, dir=get_staging_dir()
+        )
+        # Skip TemporaryUploadedFile.__init__, which hardcodes FILE_UPLOAD_TEMP_DIR
+        super(TemporaryUploadedFile, self).__init__(
+            file, name, content_type, size, charset, content_type_extra
+        )
+        self.sha256: Optional[str] = None
+        self.image_format: Optional[str] = None
+        # Position among the request's files (see BatchImageUploadHandler)
+        self.index = 0
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Streams an image upload straight to the staging directory.
+
+    - Aborts the read as soon as MAX_UPLOAD_SIZE is crossed.
+    - Rejects the file from its first bytes if it is not a supported image.
+    - Hashes the data (SHA-256) as it arrives, so nothing re-reads the file.
+
+    On rejection `error` and `status_code` describe why; the file is dropped.
+    """
+
+    def __init__(self, request=None, max_size: Optional[int] = None):
+        super().__init__(request)
+        self.max_size = max_size or getattr(
+            settings, "MAX_UPLOAD_SIZE", 5 * 1024 * 1024
+        )
+        self.error: Optional[str] = None
+        self.status_code = 400
+        # Position of the current file among the request's files
+        self.index = -1
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = StagedUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra
+        )
+        self.hasher = hashlib.sha256()
+        self.received = 0
+        self.head = b""
+        self.index += 1
+        self.file.index = self.index
+
+    def _reject(self, message: str, status_code: int = 400):
+        self.error = message
+        self.status_code = status_code
+        raise StopUpload(connection_reset=True)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self._reject(
+                f"File too large. Max size is {self.max_size // (1024 * 1024)} MB.",
+                status_code=413,
+            )
+
+        if self.file.image_format is None:
+            self.head = (self.head + raw_data)[:SNIFF_BYTES]
+            if len(self.head) >= SNIFF_BYTES:
+                self._sniff()
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def _sniff(self):
+        image_format = sniff_image_format(self.head)
+        if image_format is None:
+            self._reject(
+                "Unsupported file type. Upload a JPEG, PNG, GIF or WebP image."
+            )
+        self.file.image_format = image_format
+        self.file.content_type = IMAGE_MIME_TYPES[image_format]
+
+    def file_complete(self, file_size):
+        if self.file.image_format is None:
+            # Tiny files never filled the sniff buffer
+            self._sniff()
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.hasher.hexdigest()
+        return self.file
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+
+
+class RejectedFile(NamedTuple):
+    index: int
+    name: str
+    error: str
+    status_code: int
+
+
+class BatchImageUploadHandler(StreamingImageUploadHandler):
+    """
+    StreamingImageUploadHandler for multi-file requests: a rejected file is
+    skipped and recorded in `rejected` while the rest of the request is still
+    read. Files beyond `max_files` are rejected too.
+    """
+
+    def __init__(
+        self,
+        request=None,
+        max_size: Optional[int] = None,
+        max_files: Optional[int] = None,
+    ):
+        super().__init__(request, max_size)
+        self.max_files = max_files or getattr(settings, "MAX_BATCH_UPLOAD_FILES", 10)
+        self.rejected: List[RejectedFile] = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        if self.index >= self.max_files:
+            self._reject(f"Too many files. Max {self.max_files} per batch.")
+
+    def _reject(self, message: str, status_code: int = 400):
+        self.rejected.append(
+            RejectedFile(self.index, self.file_name, message, status_code)
+        )
+        raise SkipFile()
+
+    def file_complete(self, file_size):
+        try:
+            return super().file_complete(file_size)
+        except SkipFile:
+            self.file.close()
+            return None
@@ -1,10 +1,41 @@
 from django.urls import path
 
-from .views import ImageDetailView, ImageListView, ImageUploadView, delete_image
+from .views import (
+    ImageBatchUploadView,
+    ImageDetailView,
+    ImageExportView,
+    ImageListView,
+    ImageRenditionView,
+    ImageUploadView,
+    ResumableUploadCreateView,
+    ResumableUploadFinalizeView,
+    ResumableUploadView,
+    delete_image,
+)
 
 urlpatterns = [
     path("", ImageUploadView.as_view(), name="image_upload"),
+    path("batch/", ImageBatchUploadView.as_view(), name="image_batch_upload"),
     path("image/<uuid:public_id>/", ImageDetailView.as_view(), name="image_detail"),
     path("image/<uuid:public_id>/delete/", delete_image, name="image_delete"),
+    path(
+        "image/<uuid:public_id>/r/<slug:preset>/",
+        ImageRenditionView.as_view(),
+        name="image_rendition",
+    ),
     path("images/", ImageListView.as_view(), name="image_list"),
+    path("images/export/", ImageExportView.as_view(), name="image_export"),
+    path(
+        "uploads/", ResumableUploadCreateView.as_view(), name="resumable_upload_create"
+    ),
+    path(
+        "uploads/<uuid:public_id>/",
+        ResumableUploadView.as_view(),
+        name="resumable_upload",
+    ),
+    path(
+        "uploads/<uuid:public_id>/finalize/",
+        ResumableUploadFinalizeView.as_view(),
+        name="resumable_upload_finalize",
+    ),
 ]
@@ -0,0 +1,233 @@
+"""
+Per-user and per-IP usage: how many images and bytes each has, by the local
+day they were uploaded (`UserDailyUsage`, `IpDailyUsage`).
+
+The rows are updated with F() expressions in the same transaction as the
+upload (`record_uploads`, from images.signals and the batch upload), the
+delete (`record_delete`, from images.signals) or the worker's optimization
+(`record_resize`), so they always agree with what committed. Reading them
+replaces COUNT/SUM scans over ImageAsset: a user's totals come from one row
+per day they uploaded on, an IP's daily count from a single row (which also
+seeds the daily upload quota).
+
+`manage.py reconcile_usage` recomputes the rows from ImageAsset a few days
+per transaction (`reconcile`), to fill them for older images or fix drift.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateTimeField, F, Max, Q, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from .models import ImageAsset, IpDailyUsage, UserDailyUsage
+
+
+class Usage(NamedTuple):
+    images: int
+    bytes: int
+    last_upload_at: Optional[datetime]
+
+
+def _day(image_obj: ImageAsset) -> date:
+    return timezone.localdate(image_obj.created_at)
+
+
+def _keys(image_obj: ImageAsset):
+    """(model, lookup) of every row counting `image_obj`."""
+    day = _day(image_obj)
+    if image_obj.user_id is not None:
+        yield UserDailyUsage, (("user_id", image_obj.user_id), ("day", day))
+    yield IpDailyUsage, (("uploader_ip", image_obj.uploader_ip), ("day", day))
+
+
+def _add(model, key: tuple, images: int, byte_count: int, last: datetime) -> None:
+    """Add to a row, creating it if needed. Must run inside a transaction."""
+    lookup = dict(key)
+    stamp = Value(last, output_field=DateTimeField())
+    for _ in range(3):
+        if model.objects.filter(**lookup).update(
+            image_count=F("image_count") + images,
+            byte_count=F("byte_count") + byte_count,
+            last_upload_at=Greatest(Coalesce("last_upload_at", stamp), stamp),
+        ):
+            return
+        try:
+            with transaction.atomic():
+                model.objects.create(
+                    **lookup,
+                    image_count=images,
+                    byte_count=byte_count,
+                    last_upload_at=last,
+                )
+            return
+        except IntegrityError:
+            # Created concurrently; add to that one
+            continue
+    raise RuntimeError(f"Could not update {model.__name__} {lookup}")
+
+
+def record_uploads(images: Iterable[ImageAsset]) -> None:
+    """Count new images (saved, so they have `created_at`)."""
+    totals: Dict[Tuple, list] = defaultdict(lambda: [0, 0, None])
+    for image_obj in images:
+        for model, key in _keys(image_obj):
+            total = totals[model, key]
+            total[0] += 1
+            total[1] += image_obj.byte_size or 0
+            if total[2] is None or image_obj.created_at > total[2]:
+                total[2] = image_obj.created_at
+    # In a fixed order, so concurrent batches lock rows the same way round
+    for (model, key), (count, byte_count, last) in sorted(
+        totals.items(), key=lambda item: (item[0][0].__name__, str(item[0][1]))
+    ):
+        _add(model, key, count, byte_count, last)
+
+
+def record_delete(image_obj: ImageAsset) -> None:
+    """Stop counting a deleted image."""
+    for model, key in _keys(image_obj):
+        model.objects.filter(**dict(key)).update(
+            image_count=F("image_count") - 1,
+            byte_count=F("byte_count") - (image_obj.byte_size or 0),
+        )
+
+
+def record_resize(image_obj: ImageAsset, old_size: int) -> None:
+    """Account for an image whose stored size changed from `old_size`."""
+    change = (image_obj.byte_size or 0) - old_size
+    if change:
+        for model, key in _keys(image_obj):
+            model.objects.filter(**dict(key)).update(
+                byte_count=F("byte_count") + change
+            )
+
+
+def _total(queryset) -> Usage:
+    totals = queryset.aggregate(
+        images=Coalesce(Sum("image_count"), 0),
+        bytes=Coalesce(Sum("byte_count"), 0),
+        last_upload_at=Max("last_upload_at"),
+    )
+    return Usage(totals["images"], totals["bytes"], totals["last_upload_at"])
+
+
+def user_usage(user_id: int, since: Optional[date] = None) -> Usage:
+    """A user's images and bytes (uploaded on `since` or later, if given)."""
+    queryset = UserDailyUsage.objects.filter(user_id=user_id)
+    if since is not None:
+        queryset = queryset.filter(day__gte=since)
+    return _total(queryset)
+
+
+def ip_usage(ip: str, day: Optional[date] = None) -> Usage:
+    """An IP's images and bytes, uploaded on `day` if given."""
+    queryset = IpDailyUsage.objects.filter(uploader_ip=ip)
+    if day is not None:
+        queryset = queryset.filter(day=day)
+    return _total(queryset)
+
+
+def _midnight(day: date) -> datetime:
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _computed(start: date, end: date):
+    """Rows for the days in [start, end) recomputed from ImageAsset."""
+    images = ImageAsset.objects.filter(
+        created_at__gte=_midnight(start), created_at__lt=_midnight(end)
+    ).order_by()
+    for model, field, extra in (
+        (UserDailyUsage, "user_id", ~Q(user=None)),
+        (IpDailyUsage, "uploader_ip", Q()),
+    ):
+        groups = (
+            images.filter(extra)
+            .annotate(upload_day=TruncDate("created_at"))
+            .values(field, "upload_day")
+            .annotate(
+                images=Count("id"),
+                bytes=Coalesce(Sum("byte_size"), 0),
+                last=Max("created_at"),
+            )
+        )
+        for group in groups:
+            yield model(
+                **{field: group[field]},
+                day=group["upload_day"],
+                image_count=group["images"],
+                byte_count=group["bytes"],
+                last_upload_at=group["last"],
+            )
+
+
+def _row_key(row) -> tuple:
+    owner = row.user_id if isinstance(row, UserDailyUsage) else row.uploader_ip
+    return owner, row.day
+
+
+def _row_values(row) -> tuple:
+    return row.image_count, row.byte_count, row.last_upload_at
+
+
+def _rewrite(start: date, end: date) -> int:
+    with transaction.atomic():
+        existing = {}
+        for model in (UserDailyUsage, IpDailyUsage):
+            rows = model.objects.select_for_update().filter(day__gte=start, day__lt=end)
+            existing[model] = {_row_key(row): _row_values(row) for row in rows}
+
+        computed = defaultdict(list)
+        for row in _computed(start, end):
+            computed[type(row)].append(row)
+
+        changed = 0
+        for model, old in existing.items():
+            new = {_row_key(row): _row_values(row) for row in computed[model]}
+            changed += sum(old.get(key) != values for key, values in new.items())
+            changed += len(old.keys() - new.keys())
+            model.objects.filter(day__gte=start, day__lt=end).delete()
+            model.objects.bulk_create(computed[model])
+    return changed
+
+
+def reconcile(start: date, end: date) -> int:
+    """
+    Rewrite the usage rows of the days in [start, end) from ImageAsset in
+    one transaction. Returns how many rows were missing, wrong or extra.
+
+    The existing rows are locked first, so uploads and deletes on those days
+    wait and then apply their change on top of the rewritten rows.
+    """
+    for _ in range(2):
+        try:
+            return _rewrite(start, end)
+        except IntegrityError:
+            # An upload created one of the rows meanwhile; start over
+            continue
+    return _rewrite(start, end)
+
+
+def usage_days() -> Optional[Tuple[date, date]]:
+    """
+    `(first, end)` spanning every day up to today that has images or usage
+    rows, or None if there are neither.
+    """
+    first_upload = (
+        ImageAsset.objects.order_by("created_at")
+        .values_list("created_at", flat=True)
+        .first()
+    )
+    days = [timezone.localdate(first_upload)] if first_upload else []
+    for model in (UserDailyUsage, IpDailyUsage):
+        oldest = model.objects.order_by("day").values_list("day", flat=True).first()
+        if oldest is not None:
+            days.append(oldest)
+    if not days:
+        return None
+    return min(days), timezone.localdate() + timedelta(days=1)
@@ -1,42 +1,150 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import hashlib
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Optional
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.core.exceptions import ValidationError
+from django.core.handlers.asgi import ASGIRequest
 from django.core.paginator import Paginator
 from django.http import (
+    FileResponse,
     Http404,
     HttpRequest,
     HttpResponse,
     HttpResponseForbidden,
     HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
 )
+from django.middleware.csrf import CsrfViewMiddleware, get_token
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 
+from core.concurrency import run_blocking
+from core.media import parse_range
+from core.pagination import KeysetPaginator
 from core.utils import get_client_ip, validate_image_size
-from .forms import ImageUploadForm
-from .models import ImageAsset
-from .services import is_daily_quota_exceeded
-
-
-class ImageUploadView(LoginRequiredMixin, View):
+from core.views import AsyncLoginRequiredMixin
+from . import fragments, similarity
+from .export import archive_chunks, byte_range, export_queryset, plan_export
+from .forms import ImageUploadForm, InspectedImageField
+from .models import ImageAsset, UploadSession
+from .renditions import get_presets, get_rendition, negotiate_format
+from .resumable import (
+    CHUNK_SIZE,
+    UploadError,
+    append_chunk,
+    create_session,
+    discard_session,
+    finalize_session,
+)
+from .services import (
+    create_image_asset,
+    create_image_assets,
+    aget_collection_version,
+    is_upload_quota_exceeded,
+    release_upload_slot,
+    reserve_upload_slot,
+)
+from .uploadhandlers import BatchImageUploadHandler, StreamingImageUploadHandler
+
+
+def _etag(request: HttpRequest, *parts) -> str:
+    """
+    Build a page ETag. Pages embed the user's identity and CSRF token, so both
+    are part of the tag: a 304 never revives a page rendered for someone else
+    or with a rotated token.
+    """
+    # get_token() settles the CSRF secret now (issuing one if needed), so the
+    # tag matches the token the page will be rendered with
+    get_token(request)
+    csrf_secret = request.META["CSRF_COOKIE"]
+    raw = "|".join(str(p) for p in (request.user.pk, csrf_secret) + parts)
+    return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+
+async def detail_etag(request: HttpRequest, public_id) -> Optional[str]:
+    # One indexed lookup of a single column; no model or template work
+    updated_at = (
+        await ImageAsset.objects.filter(public_id=public_id)
+        .values_list("updated_at", flat=True)
+        .afirst()
+    )
+    if updated_at is None:
+        return None
+    return _etag(request, public_id, updated_at.isoformat())
+
+
+async def list_etag(request: HttpRequest) -> str:
+    # A cache read; the image query only runs when this changes
+    return _etag(
+        request,
+        await aget_collection_version(request.user.pk),
+        request.GET.urlencode(),
+    )
+
+
+async def _conditional(request: HttpRequest, etag: Optional[str], get_response):
+    """
+    What `django.views.decorators.http.condition` does, for async views:
+    answer 304 when `etag` matches, otherwise await `get_response()`.
+    """
+    etag = quote_etag(etag) if etag else None
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = await get_response()
+    if etag and request.method in ("GET", "HEAD") and not response.has_header("ETag"):
+        response["ETag"] = etag
+    return response
+
+
+def _revalidate(response: HttpResponse) -> HttpResponse:
+    # Let the browser keep the page but check its ETag on every visit
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _csrf_failure(request: HttpRequest) -> Optional[HttpResponse]:
+    """CsrfViewMiddleware's check, for views that opt out of the middleware."""
+    return CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+
+
+# CSRF is checked in `_read_upload` instead: the CSRF middleware would read
+# request.POST before the view can install the streaming upload handler.
+@method_decorator(csrf_exempt, name="dispatch")
+class ImageUploadView(AsyncLoginRequiredMixin, View):
     """Authenticated users can upload an image (max 5 MB, 10 uploads per IP/day)."""
 
     template_name = "images/upload.html"
     login_url = "login"
 
-    def get(self, request: HttpRequest) -> HttpResponse:
+    async def get(self, request: HttpRequest) -> HttpResponse:
         return render(request, self.template_name, {"form": ImageUploadForm()})
 
-    def post(self, request: HttpRequest) -> HttpResponse:
+    async def post(self, request: HttpRequest) -> HttpResponse:
         client_ip = get_client_ip(request)
 
-        # Enforce per-IP upload quota (10 uploads / 24h)
-        if is_daily_quota_exceeded(client_ip):
+        # Enforce per-IP upload quota (10 uploads / day); the slot is taken
+        # atomically up front and handed back if the upload does not go through.
+        reservation = await sync_to_async(reserve_upload_slot)(client_ip)
+        if reservation is None:
             return render(
                 request,
                 self.template_name,
@@ -47,21 +155,73 @@ class ImageUploadView(LoginRequiredMixin, View):
                 status=429,
             )
 
+        handler = StreamingImageUploadHandler(request)
+        request.upload_handlers = [handler]
+        try:
+            response = await self._handle_upload(request, client_ip, handler)
+        except Exception:
+            await sync_to_async(release_upload_slot)(reservation)
+            raise
+        if response.status_code >= 400:
+            await sync_to_async(release_upload_slot)(reservation)
+        return response
+
+    @staticmethod
+    def _read_upload(request: HttpRequest):
+        """
+        The blocking file work: stream the body into the staging directory
+        (through the CSRF check, which reads request.POST) and inspect the
+        image header. Returns (CSRF failure response, form).
+        """
+        rejected = _csrf_failure(request)
+        if rejected is not None:
+            return rejected, None
         form = ImageUploadForm(request.POST, request.FILES)
+        form.is_valid()
+        return None, form
+
+    async def _handle_upload(
+        self,
+        request: HttpRequest,
+        client_ip: str,
+        handler: StreamingImageUploadHandler,
+    ) -> HttpResponse:
+        rejected, form = await run_blocking(self._read_upload, request)
+        if rejected is not None:
+            return rejected
+
+        # The upload handler aborted the transfer (too large / not an image)
+        if handler.error:
+            return render(
+                request,
+                self.template_name,
+                {"form": ImageUploadForm(), "error": handler.error},
+                status=handler.status_code,
+            )
 
         if form.is_valid():
             image_file = form.cleaned_data["image"]
 
-            # Validate file size (max 5 MB)
+            # Validate file size (max 5 MB), and with REJECT_NEAR_DUPLICATES
+            # that the user has no copy of the image yet
             try:
                 validate_image_size(image_file)
+                await sync_to_async(similarity.validate_not_near_duplicate)(
+                    image_file, request.user
+                )
             except ValidationError as e:
-                form.add_error("image", e.message)
-                return render(request, self.template_name, {"form": form}, status=400)
-
-            # Save image linked to current user
-            image_obj = ImageAsset.objects.create(
-                image=image_file,
+                form.add_error("image", e.messages[0])
+                return render(
+                    request,
+                    self.template_name,
+                    {"form": form, "error": e.messages[0]},
+                    status=400,
+                )
+
+            # Save image linked to current user. Known content is not written
+            # again; new content is renamed into MEDIA_ROOT rather than copied.
+            image_obj = await sync_to_async(create_image_asset)(
+                image_file,
                 uploader_ip=client_ip,
                 user=request.user,
             )
@@ -72,28 +232,405 @@ class ImageUploadView(LoginRequiredMixin, View):
         return render(request, self.template_name, {"form": form}, status=400)
 
 
-class ImageDetailView(LoginRequiredMixin, View):
+def _validate_upload(uploaded_file) -> Optional[str]:
+    """Run the upload form's checks on one file; return the error, if any."""
+    try:
+        InspectedImageField().clean(uploaded_file)
+        validate_image_size(uploaded_file)
+    except ValidationError as e:
+        return " ".join(e.messages)
+    return None
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ImageBatchUploadView(LoginRequiredMixin, View):
+    """
+    Upload several images (multipart field `images`) in one request.
+
+    Files are checked concurrently, quota slots for the good ones are taken in
+    one reservation, and the rows are written with a single INSERT. The JSON
+    response has one result per file, in request order, so partial failures
+    are visible to the client.
+    """
+
+    login_url = "login"
+    max_workers = 4
+
+    def post(self, request: HttpRequest) -> HttpResponse:
+        handler = BatchImageUploadHandler(request)
+        request.upload_handlers = [handler]
+        return self._handle_upload(request, handler)
+
+    @method_decorator(csrf_protect)
+    def _handle_upload(
+        self, request: HttpRequest, handler: BatchImageUploadHandler
+    ) -> HttpResponse:
+        files = request.FILES.getlist("images")
+        results = {
+            r.index: {"name": r.name, "status": r.status_code, "error": r.error}
+            for r in handler.rejected
+        }
+        if not files and not results:
+            return JsonResponse({"detail": "No files in field 'images'."}, status=400)
+
+        accepted = []
+        if files:
+            workers = min(len(files), self.max_workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                errors = list(executor.map(_validate_upload, files))
+            for uploaded_file, error in zip(files, errors):
+                if not error:
+                    # Checked here rather than in the pool, whose threads
+                    # would each open their own database connection
+                    try:
+                        similarity.validate_not_near_duplicate(
+                            uploaded_file, request.user
+                        )
+                    except ValidationError as e:
+                        error = " ".join(e.messages)
+                if error:
+                    results[uploaded_file.index] = {
+                        "name": uploaded_file.name,
+                        "status": 400,
+                        "error": error,
+                    }
+                else:
+                    accepted.append(uploaded_file)
+
+        if accepted:
+            client_ip = get_client_ip(request)
+            reservation = reserve_upload_slot(client_ip, len(accepted))
+            if reservation is None:
+                return JsonResponse(
+                    {
+                        "detail": f"Upload quota reached; {len(accepted)} slots "
+                        "are not available. Try again tomorrow."
+                    },
+                    status=429,
+                )
+            try:
+                assets = create_image_assets(accepted, client_ip, user=request.user)
+            except Exception:
+                release_upload_slot(reservation)
+                raise
+            for uploaded_file, image_obj in zip(accepted, assets):
+                results[uploaded_file.index] = {
+                    "name": uploaded_file.name,
+                    "status": 201,
+                    "public_id": str(image_obj.public_id),
+                    "url": reverse("image_detail", args=[image_obj.public_id]),
+                }
+
+        return JsonResponse(
+            {
+                "created": len(accepted),
+                "failed": len(results) - len(accepted),
+                "results": [results[i] for i in sorted(results)],
+            },
+            status=201 if accepted else 400,
+        )
+
+
+def _upload_metadata(header: str) -> dict:
+    """Parse a tus `Upload-Metadata` header: `key base64value, key2 ...`."""
+    metadata = {}
+    for pair in filter(None, (p.strip() for p in header.split(","))):
+        key, _, value = pair.partition(" ")
+        try:
+            metadata[key] = base64.b64decode(value).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            continue
+    return metadata
+
+
+def _session_response(session: UploadSession, status: int = 200) -> HttpResponse:
+    response = JsonResponse(
+        {
+            "id": str(session.public_id),
+            "offset": session.offset,
+            "length": session.length,
+            "expires_at": session.expires_at.isoformat(),
+        },
+        status=status,
+    )
+    response["Upload-Offset"] = str(session.offset)
+    response["Upload-Length"] = str(session.length)
+    response["Upload-Expires"] = http_date(session.expires_at.timestamp())
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def _upload_error(exc: UploadError) -> HttpResponse:
+    return JsonResponse({"detail": str(exc)}, status=exc.status_code)
+
+
+class ResumableUploadCreateView(LoginRequiredMixin, View):
+    """
+    Open a resumable upload (see `images.resumable`). Send the total size as
+    `Upload-Length` and optionally `Upload-Metadata: filename <base64>`; the
+    session URL comes back in `Location`.
+    """
+
+    login_url = "login"
+
+    def post(self, request: HttpRequest) -> HttpResponse:
+        client_ip = get_client_ip(request)
+        if is_upload_quota_exceeded(client_ip):
+            return JsonResponse(
+                {"detail": "Daily quota reached. Try again tomorrow."}, status=429
+            )
+        try:
+            length = int(request.headers.get("Upload-Length", ""))
+        except ValueError:
+            return JsonResponse({"detail": "Upload-Length is required."}, status=400)
+
+        metadata = _upload_metadata(request.headers.get("Upload-Metadata", ""))
+        try:
+            session = create_session(
+                request.user, client_ip, length, metadata.get("filename", "")
+            )
+        except UploadError as exc:
+            return _upload_error(exc)
+
+        response = _session_response(session, status=201)
+        response["Location"] = reverse("resumable_upload", args=[session.public_id])
+        return response
+
+
+class ResumableUploadView(LoginRequiredMixin, View):
+    """
+    A resumable upload session.
+
+    - HEAD / GET: the current `Upload-Offset` (where to resume).
+    - PATCH: append the body (`application/offset+octet-stream`) at
+      `Upload-Offset`, which must equal the current offset.
+    - DELETE: abandon the upload.
+    """
+
+    login_url = "login"
+
+    def get_session(self, public_id) -> UploadSession:
+        return get_object_or_404(
+            UploadSession, public_id=public_id, user=self.request.user
+        )
+
+    def get(self, request: HttpRequest, public_id) -> HttpResponse:
+        return _session_response(self.get_session(public_id))
+
+    def head(self, request: HttpRequest, public_id) -> HttpResponse:
+        return _session_response(self.get_session(public_id))
+
+    def patch(self, request: HttpRequest, public_id) -> HttpResponse:
+        session = self.get_session(public_id)
+        if request.content_type != "application/offset+octet-stream":
+            return JsonResponse(
+                {"detail": "Content-Type must be application/offset+octet-stream."},
+                status=415,
+            )
+        try:
+            offset = int(request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return JsonResponse({"detail": "Upload-Offset is required."}, status=400)
+
+        # Read the body in pieces straight into the staging file
+        stream = iter(lambda: request.read(CHUNK_SIZE), b"")
+        try:
+            append_chunk(session, offset, stream)
+        except UploadError as exc:
+            response = _upload_error(exc)
+            response["Upload-Offset"] = str(session.offset)
+            return response
+        response = _session_response(session)
+        response.status_code = 204
+        response.content = b""
+        return response
+
+    def delete(self, request: HttpRequest, public_id) -> HttpResponse:
+        discard_session(self.get_session(public_id))
+        return HttpResponse(status=204)
+
+
+class ResumableUploadFinalizeView(LoginRequiredMixin, View):
+    """Turn a fully received resumable upload into an ImageAsset."""
+
+    login_url = "login"
+
+    def post(self, request: HttpRequest, public_id) -> HttpResponse:
+        session = get_object_or_404(
+            UploadSession, public_id=public_id, user=request.user
+        )
+        if not session.is_complete:
+            return _session_response(session, status=409)
+
+        reservation = reserve_upload_slot(session.uploader_ip)
+        if reservation is None:
+            return JsonResponse(
+                {"detail": "Daily quota reached. Try again tomorrow."}, status=429
+            )
+        try:
+            image_obj = finalize_session(session)
+        except UploadError as exc:
+            release_upload_slot(reservation)
+            return _upload_error(exc)
+        except Exception:
+            release_upload_slot(reservation)
+            raise
+
+        url = reverse("image_detail", args=[image_obj.public_id])
+        response = JsonResponse(
+            {"public_id": str(image_obj.public_id), "url": url}, status=201
+        )
+        response["Location"] = url
+        return response
+
+
+class ImageDetailView(AsyncLoginRequiredMixin, View):
     """Show a single image detail page with delete option for the owner."""
 
     template_name = "images/detail.html"
     login_url = "login"
 
-    def get(self, request: HttpRequest, public_id: str) -> HttpResponse:
+    async def get(self, request: HttpRequest, public_id: str) -> HttpResponse:
+        etag = await detail_etag(request, public_id)
+        return await _conditional(
+            request, etag, lambda: self._render(request, public_id)
+        )
+
+    async def _render(self, request: HttpRequest, public_id: str) -> HttpResponse:
         try:
             uuid.UUID(str(public_id))
         except ValueError:
             raise Http404("Invalid image identifier")
 
-        image_obj = get_object_or_404(ImageAsset, public_id=public_id)
+        try:
+            image_obj = await ImageAsset.objects.select_related("blob", "user").aget(
+                public_id=public_id
+            )
+        except ImageAsset.DoesNotExist:
+            raise Http404("No ImageAsset matches the given query.")
+
+        [card] = await fragments.arender(fragments.DETAIL_CARD_TEMPLATE, [image_obj])
+        return _revalidate(
+            render(
+                request,
+                self.template_name,
+                {
+                    "image": image_obj,
+                    "card": card,
+                    "can_delete": image_obj.user_id == request.user.pk,
+                },
+            )
+        )
+
 
-        return render(
-            request,
-            self.template_name,
-            {
-                "image": image_obj,
-                "can_delete": image_obj.user == request.user,
-            },
+class ImageRenditionView(LoginRequiredMixin, View):
+    """
+    Serve a resized variant of an image (see `images.renditions`), rendered on
+    first request and then served from the on-disk rendition cache.
+    """
+
+    login_url = "login"
+
+    def get(self, request: HttpRequest, public_id: str, preset: str) -> HttpResponse:
+        if preset not in get_presets():
+            raise Http404("Unknown rendition preset")
+
+        image_obj = get_object_or_404(
+            ImageAsset.objects.select_related("blob"), public_id=public_id
         )
+        if image_obj.blob is None:
+            raise Http404("Image file is missing")
+
+        output_format = negotiate_format(request.META.get("HTTP_ACCEPT", ""))
+        try:
+            path, content_type = get_rendition(image_obj.blob, preset, output_format)
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+        except FileNotFoundError:
+            # Evicted between lookup and open; render it again
+            path, content_type = get_rendition(image_obj.blob, preset, output_format)
+            response = FileResponse(open(path, "rb"), content_type=content_type)
+
+        patch_vary_headers(response, ["Accept"])
+        patch_cache_control(response, private=True, max_age=86400)
+        return response
+
+
+def _stream(request: HttpRequest, chunks):
+    """
+    `chunks` as a response body that is sent as it is generated. Django
+    buffers a sync iterator under ASGI, so there each chunk is produced on
+    the sync thread (where the query's connection lives) and awaited.
+    """
+    if not isinstance(request, ASGIRequest):
+        return chunks
+
+    async def stream():
+        step = sync_to_async(next)
+        try:
+            while (chunk := await step(chunks, None)) is not None:
+                yield chunk
+        finally:
+            await sync_to_async(chunks.close)()
+
+    return stream()
+
+
+class ImageExportView(LoginRequiredMixin, View):
+    """
+    Download the user's images as a ZIP archive (see `images.export`),
+    optionally only those uploaded from `?since=` through `?until=`
+    (YYYY-MM-DD). The archive streams as it is written; a broken download
+    resumes with `Range` and `If-Range` against its ETag.
+    """
+
+    login_url = "login"
+    filename = "images.zip"
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        try:
+            since, until = (
+                date.fromisoformat(request.GET[key]) if request.GET.get(key) else None
+                for key in ("since", "until")
+            )
+        except ValueError:
+            return JsonResponse({"detail": "Dates must be YYYY-MM-DD."}, status=400)
+
+        queryset = export_queryset(request.user, since, until)
+        plan = plan_export(queryset)
+        etag = quote_etag(plan.etag)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+
+        status, offset, length = 200, 0, plan.length
+        range_header = request.headers.get("Range")
+        if range_header and request.headers.get("If-Range", etag) == etag:
+            requested = parse_range(range_header, plan.length)
+            if requested is None:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{plan.length}"
+                return response
+            if requested != (0, plan.length):
+                status, (offset, length) = 206, requested
+
+        if request.method == "HEAD":
+            response = HttpResponse(status=status, content_type="application/zip")
+        else:
+            chunks = archive_chunks(queryset, plan)
+            if status == 206:
+                chunks = byte_range(chunks, offset, length)
+            response = StreamingHttpResponse(
+                _stream(request, chunks), status=status, content_type="application/zip"
+            )
+        response["Content-Length"] = str(length)
+        if status == 206:
+            end = offset + length - 1
+            response["Content-Range"] = f"bytes {offset}-{end}/{plan.length}"
+        response["Accept-Ranges"] = "bytes"
+        response["ETag"] = etag
+        response["Content-Disposition"] = f'attachment; filename="{self.filename}"'
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
 
 @login_required(login_url="login")
@@ -108,38 +645,66 @@ def delete_image(request: HttpRequest, public_id: str) -> HttpResponse:
     if image_obj.user != request.user:
         return HttpResponseForbidden("You are not authorized to delete this image.")
 
-    # Delete file and DB record
-    image_obj.image.delete(save=False)
+    # Delete the DB record; its blob (and file, if this was the last
+    # reference) is released by the post_delete signal
     image_obj.delete()
 
     return HttpResponseRedirect(reverse("image_list"))
 
 
-class ImageListView(LoginRequiredMixin, View):
-    """Paginated list of all images uploaded by the logged-in user."""
+class ImageListView(AsyncLoginRequiredMixin, View):
+    """
+    Images uploaded by the logged-in user, newest first.
+
+    Pages are keyset-paginated on (created_at, id) through opaque `?cursor=`
+    tokens, so every page is one index range scan on (user, created_at, id)
+    with no COUNT. `?page=<n>` keeps numbered pages (with a count and OFFSET)
+    for anyone who wants to jump to a page.
+    """
 
     template_name = "images/list.html"
     login_url = "login"
+    per_page = 10
 
-    def get(self, request: HttpRequest) -> HttpResponse:
-        page_number = request.GET.get("page", 1)
-        per_page = 10
+    async def get(self, request: HttpRequest) -> HttpResponse:
+        etag = await list_etag(request)
+        return await _conditional(request, etag, lambda: self._render(request))
 
-        queryset = (
-            ImageAsset.objects.filter(user=request.user)
-            .only("public_id", "image", "created_at", "uploader_ip")
-            .order_by("-created_at")
+    async def _render(self, request: HttpRequest) -> HttpResponse:
+        queryset = ImageAsset.objects.filter(user=request.user).only(
+            "public_id", "created_at", "updated_at", "uploader_ip", "width", "height"
         )
 
-        paginator = Paginator(queryset, per_page)
-        page_obj = paginator.get_page(page_number)
+        if "page" in request.GET:
+            paginator = Paginator(
+                queryset.order_by("-created_at", "-id"), self.per_page
+            )
+            page_obj = await sync_to_async(_numbered_page)(
+                paginator, request.GET.get("page")
+            )
+        else:
+            paginator = KeysetPaginator(queryset, self.per_page, ("created_at", "id"))
+            page_obj = await paginator.aget_page(request.GET.get("cursor"))
 
-        return render(
-            request,
-            self.template_name,
-            {
-                "images": page_obj.object_list,
-                "page_obj": page_obj,
-                "is_paginated": page_obj.has_other_pages(),
-            },
+        return _revalidate(
+            render(
+                request,
+                self.template_name,
+                {
+                    "images": page_obj.object_list,
+                    "cards": await fragments.arender(
+                        fragments.CARD_TEMPLATE, page_obj.object_list
+                    ),
+                    "page_obj": page_obj,
+                    "is_paginated": page_obj.has_other_pages(),
+                    "uses_cursor": isinstance(paginator, KeysetPaginator),
+                },
+            )
         )
+
+
+def _numbered_page(paginator: Paginator, number):
+    # Evaluated here so the template never queries from the event loop
+    page_obj = paginator.get_page(number)
+    page_obj.object_list = list(page_obj.object_list)
+    return page_obj
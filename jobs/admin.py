@@ -0,0 +1,14 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "status", "attempts", "run_after", "locked_by")
+    # Workers run what a job names, so jobs only come from code
+    readonly_fields = ("task", "payload", "created_at", "updated_at")
+    list_filter = ("status", "task")
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs.queue import claim, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def _run_in_pool(job_id: int, worker_id: str) -> bool:
+    try:
+        return run_job(job_id, worker_id)
+    finally:
+        # Pool threads/processes outlive the job; don't leak connections
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = "Process queued background jobs (post-upload image processing)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=os.cpu_count() or 2,
+            help="Number of jobs to run at once (default: CPU count).",
+        )
+        parser.add_argument(
+            "--pool",
+            choices=["thread", "process"],
+            default="thread",
+            help="Run jobs in threads (I/O-bound) or processes (CPU-bound).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to sleep when the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as the queue is drained.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        if options["pool"] == "process":
+            # Spawned (not forked) children set Django up from scratch, so they
+            # never share this process's database connections
+            executor = ProcessPoolExecutor(
+                max_workers=concurrency,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        self.stdout.write(
+            f"Worker {worker_id} started ({options['pool']} pool, {concurrency} slots)"
+        )
+        processed = failed = 0
+        in_flight = set()
+        with executor:
+            while not self.stopping or in_flight:
+                free = concurrency - len(in_flight)
+                job_ids = claim(worker_id, free) if free and not self.stopping else []
+                for job_id in job_ids:
+                    in_flight.add(executor.submit(_run_in_pool, job_id, worker_id))
+
+                if not in_flight:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    continue
+
+                if len(in_flight) == concurrency:
+                    timeout = None  # Full: wait for a slot
+                elif len(job_ids) == free:
+                    timeout = 0  # Queue may have more: claim again right away
+                else:
+                    timeout = options["poll_interval"]
+                done, in_flight = wait(in_flight, timeout, FIRST_COMPLETED)
+                for future in done:
+                    processed += 1
+                    try:
+                        failed += not future.result()
+                    except Exception:
+                        logger.exception("Worker crashed while running a job")
+                        failed += 1
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Worker stopped: {processed} jobs, {failed} failed")
+        )
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,41 @@
+from django.db import models
+from django.utils import timezone
+
+from core.models import TimeStampedModel
+
+
+class Job(TimeStampedModel):
+    """
+    A unit of background work, claimed by `run_image_worker`.
+
+    A claimed job holds a lease (`locked_until`); if its worker dies the lease
+    runs out and the job becomes claimable again, or fails if that was its
+    last attempt.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    task = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+        ordering = ["run_after", "id"]
+
+    def __str__(self) -> str:
+        return f"{self.task} #{self.pk} ({self.status})"
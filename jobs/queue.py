@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import logging
+import random
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry: Dict[str, Callable] = {}
+
+
+def task(name: str) -> Callable[[Callable], Callable]:
+    """
+    Register a function as a background task under `name`.
+    It is called with the job's payload as keyword arguments.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        _registry[name] = func
+        return func
+
+    return decorator
+
+
+def get_task(name: str) -> Callable:
+    return _registry[name]
+
+
+def enqueue(
+    name: str, *, delay: Optional[timedelta] = None, max_attempts: int = 5, **payload
+) -> Job:
+    """Queue `name(**payload)` to run in a worker (no earlier than `delay` from now)."""
+    if name not in _registry:
+        raise KeyError(f"Unknown task {name!r}")
+    return Job.objects.create(
+        task=name,
+        payload=payload,
+        max_attempts=max_attempts,
+        run_after=timezone.now() + (delay or timedelta(0)),
+    )
+
+
+def enqueue_many(
+    name: str,
+    payloads: List[dict],
+    *,
+    delay: Optional[timedelta] = None,
+    max_attempts: int = 5,
+) -> List[Job]:
+    """Queue `name(**payload)` for each payload with a single INSERT."""
+    if name not in _registry:
+        raise KeyError(f"Unknown task {name!r}")
+    run_after = timezone.now() + (delay or timedelta(0))
+    return Job.objects.bulk_create(
+        Job(task=name, payload=payload, max_attempts=max_attempts, run_after=run_after)
+        for payload in payloads
+    )
+
+
+def enqueue_on_commit(name: str, **kwargs) -> None:
+    """Queue a task once the surrounding transaction commits (now if there is none)."""
+    transaction.on_commit(lambda: enqueue(name, **kwargs))
+
+
+def lease_duration() -> timedelta:
+    return timedelta(seconds=getattr(settings, "JOBS_LEASE_SECONDS", 300))
+
+
+def _abandoned(now) -> Q:
+    # Running on a lease that has run out: the worker crashed or was killed
+    return Q(status=Job.Status.RUNNING, locked_until__lt=now)
+
+
+def _claimable(now) -> Q:
+    # Queued and due, or abandoned with attempts left
+    return Q(status=Job.Status.QUEUED, run_after__lte=now) | (
+        _abandoned(now) & Q(attempts__lt=F("max_attempts"))
+    )
+
+
+def _fail_abandoned(now) -> None:
+    # A job that takes its worker down with it (out of memory, a crash in a
+    # decoder) never reaches run_job's except branch, so its attempts are
+    # counted here instead of being retried forever
+    Job.objects.filter(_abandoned(now), attempts__gte=F("max_attempts")).update(
+        status=Job.Status.FAILED,
+        locked_until=None,
+        last_error="The lease ran out on the last attempt (the worker died).",
+    )
+
+
+def claim(worker_id: str, limit: int = 1) -> List[int]:
+    """
+    Claim up to `limit` due jobs for `worker_id` and return their ids.
+
+    On databases with SKIP LOCKED (PostgreSQL, MySQL 8) competing workers skip
+    each other's rows. Elsewhere (SQLite) each candidate is taken with a
+    conditional UPDATE, which only one worker can win. Abandoned jobs out of
+    attempts are marked failed rather than claimed.
+    """
+    now = timezone.now()
+    _fail_abandoned(now)
+    claimed_fields = {
+        "status": Job.Status.RUNNING,
+        "locked_by": worker_id,
+        "locked_until": now + lease_duration(),
+        "attempts": F("attempts") + 1,
+    }
+    connection = connections[router.db_for_write(Job)]
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=connection.alias):
+            ids = list(
+                Job.objects.select_for_update(skip_locked=True)
+                .filter(_claimable(now))
+                .order_by("run_after", "id")
+                .values_list("id", flat=True)[:limit]
+            )
+            Job.objects.filter(id__in=ids).update(**claimed_fields)
+        return ids
+
+    ids = []
+    candidates = (
+        Job.objects.filter(_claimable(now))
+        .order_by("run_after", "id")
+        .values_list("id", flat=True)[: limit * 2]
+    )
+    for job_id in candidates:
+        if Job.objects.filter(_claimable(now), pk=job_id).update(**claimed_fields):
+            ids.append(job_id)
+            if len(ids) == limit:
+                break
+    return ids
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff with jitter: base, 2*base, 4*base, ... capped at an hour."""
+    base = getattr(settings, "JOBS_RETRY_BACKOFF_SECONDS", 10)
+    delay = min(base * 2 ** max(attempts - 1, 0), 3600)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def run_job(job_id: int, worker_id: str = "") -> bool:
+    """
+    Execute a claimed job and record the outcome. Returns True on success.
+    Safe to call from a worker thread or a worker process.
+    """
+    job = Job.objects.get(pk=job_id)
+    if worker_id and job.locked_by != worker_id:
+        # Lease expired and another worker took over
+        return False
+    # The outcome is only recorded while this worker still holds the job, so
+    # a worker whose lease ran out cannot overwrite its successor's
+    owned = Job.objects.filter(pk=job.pk)
+    if worker_id:
+        owned = owned.filter(locked_by=worker_id)
+
+    try:
+        get_task(job.task)(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Job %s (%s) failed: %s", job.pk, job.task, error)
+        if job.attempts >= job.max_attempts:
+            owned.update(status=Job.Status.FAILED, locked_until=None, last_error=error)
+        else:
+            owned.update(
+                status=Job.Status.QUEUED,
+                locked_by="",
+                locked_until=None,
+                run_after=timezone.now() + retry_delay(job.attempts),
+                last_error=error,
+            )
+        return False
+
+    done = owned.update(status=Job.Status.DONE, locked_until=None, last_error="")
+    if not done:
+        logger.warning("Job %s (%s) finished after its lease ran out", job.pk, job.task)
+    return bool(done)
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.queue import claim, enqueue, run_job, task
+
+calls = []
+
+
+@task("tests.record")
+def record(value):
+    calls.append(value)
+
+
+@task("tests.lose_lease")
+def lose_lease():
+    # The lease runs out mid-task and another worker takes the job over
+    Job.objects.filter(task="tests.lose_lease").update(
+        locked_until=timezone.now() - timedelta(seconds=1)
+    )
+    claim("w2")
+
+
+@task("tests.explode")
+def explode():
+    raise RuntimeError("boom")
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_claim_takes_due_jobs_once(self):
+        first = enqueue("tests.record", value=1)
+        enqueue("tests.record", value=2, delay=timedelta(hours=1))
+
+        self.assertEqual(claim("w1", limit=5), [first.pk])
+        self.assertEqual(claim("w2", limit=5), [])
+
+        first.refresh_from_db()
+        self.assertEqual(first.status, Job.Status.RUNNING)
+        self.assertEqual(first.attempts, 1)
+        self.assertEqual(first.locked_by, "w1")
+
+    def test_expired_lease_is_reclaimed(self):
+        job = enqueue("tests.record", value=1)
+        claim("dead-worker")
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertEqual(claim("w2"), [job.pk])
+        # The original worker no longer owns it
+        self.assertFalse(run_job(job.pk, "dead-worker"))
+        self.assertTrue(run_job(job.pk, "w2"))
+        self.assertEqual(calls, [1])
+
+    def test_expired_lease_on_last_attempt_fails(self):
+        # As if the job had killed its worker twice
+        job = enqueue("tests.record", value=1, max_attempts=2)
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.RUNNING,
+            attempts=2,
+            locked_by="dead-worker",
+            locked_until=timezone.now() - timedelta(seconds=1),
+        )
+        self.assertEqual(claim("w2"), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+        self.assertIsNone(job.locked_until)
+        self.assertIn("lease ran out", job.last_error)
+
+    def test_late_worker_does_not_overwrite_the_new_owner(self):
+        job = enqueue("tests.lose_lease")
+        claim("slow-worker")
+        self.assertFalse(run_job(job.pk, "slow-worker"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.RUNNING)
+        self.assertEqual(job.locked_by, "w2")
+
+    def test_failure_backs_off_then_gives_up(self):
+        job = enqueue("tests.explode", max_attempts=2)
+
+        claim("w")
+        self.assertFalse(run_job(job.pk, "w"))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn("boom", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        claim("w")
+        run_job(job.pk, "w")
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.FAILED)
+
+
+class WorkerCommandTests(TransactionTestCase):
+    # Jobs run on pool threads with their own connections, so they must see
+    # committed rows
+
+    def setUp(self):
+        calls.clear()
+
+    def test_worker_command_drains_queue(self):
+        for i in range(3):
+            enqueue("tests.record", value=i)
+        out = StringIO()
+        call_command("run_image_worker", "--once", "--concurrency=2", stdout=out)
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        self.assertIn("3 jobs, 0 failed", out.getvalue())
+        self.assertEqual(Job.objects.filter(status=Job.Status.DONE).count(), 3)